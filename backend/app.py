@@ -28,6 +28,8 @@ def create_app(*, mode: str = DEVELOP):
     app = Flask(__name__)
 
     config_instance = register_config(app, mode=mode)
+    # 请求体解析阶段即拒绝超大上传（413），预留 1MB 给 multipart 边界与其他字段
+    app.config["MAX_CONTENT_LENGTH"] = config_instance.MAX_FILE_SIZE + 1024 * 1024
 
     try:
         redis_client = redis.Redis(
@@ -44,13 +46,18 @@ def create_app(*, mode: str = DEVELOP):
         logger.info("Redis连接成功: %s:%s", config_instance.REDIS_HOST, config_instance.REDIS_PORT)
     except Exception as e:
         logger.error("Redis连接失败: %s", e, exc_info=True)
-        logger.warning("限流将降级为放行模式")
+        logger.warning("限流将降级为进程内令牌桶")
         config_instance.REDIS_CLIENT = None
 
     register_request_logging(app)
 
     try:
         init_db()
+        from backend.services.chat_persistence import backfill_session_stats
+        from backend.services.usage_rollup import record_backfill_target
+
+        record_backfill_target()
+        backfill_session_stats()
     except Exception as e:
         logger.error("数据库初始化失败: %s", e, exc_info=True)
 
@@ -63,11 +70,15 @@ def create_app(*, mode: str = DEVELOP):
         logger.warning("Agent 对话功能可能不可用，请检查 PostgreSQL 配置")
 
     from backend.services.agent_service import register_agent_service
+    from backend.services.chat_runs import register_run_manager
     from backend.services.llm_service import register_llm_service
+    from backend.services.response_cache import register_response_cache
 
     llm_service = register_llm_service(app, config_instance)
     register_agent_service(app, config_instance, llm_service)
-    logger.info("LLMService / AgentService 已初始化")
+    register_response_cache(app, config_instance)
+    register_run_manager(app, config_instance)
+    logger.info("LLMService / AgentService / ResponseCache / RunManager 已初始化")
 
     register_error_handlers(app)
 
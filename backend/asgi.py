@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""ASGI 异步流式聊天入口（与 Flask/gunicorn 并行部署）。
+
+用法:
+- 部署: `uvicorn backend.asgi:app --host 0.0.0.0 --port 5001`
+- 接口: POST `/api/chat/stream`（请求体、鉴权、限流、SSE 事件格式与 `POST /api/chat` 相同）
+- nginx 只把该路径转发到本进程，其余 API 仍由 gunicorn 上的 Flask 处理
+
+设计说明：
+- Agent 运行走 `AgentService.arun_agent_stream()`：LangGraph `astream` + `AsyncPostgresSaver`
+  + LLM 异步 HTTP 客户端，单进程在一个事件循环内承载大量并发 SSE 连接
+- 复用 `create_app()` 创建的 Flask 应用与进程级 Service；每个请求在 asyncio 任务内推入
+  应用上下文，`asyncio.to_thread` 会复制上下文，线程中的同步 MySQL / Redis 调用照常使用 `get_config()`
+- 异步 checkpointer 的连接池必须在服务器事件循环内创建，由 lifespan 打开与关闭
+- 客户端断开（`http.disconnect`）时设置运行的 `cancel_event`，Agent 在下一个 token / 工具边界停止，
+  部分回答与用量照常落库
+"""
+import asyncio
+import json
+import logging
+import sys
+import threading
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+BACKEND_DIR = Path(__file__).resolve().parent
+PROJECT_ROOT = BACKEND_DIR.parent
+
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+load_dotenv(BACKEND_DIR / ".env.product")
+
+from backend import create_app  # noqa: E402
+from backend.config import PRODUCT, get_config  # noqa: E402
+from backend.services import ChatService, get_agent_service, get_llm_service  # noqa: E402
+from backend.services.chat_events import acoalesce_events, error_event  # noqa: E402
+from backend.services.checkpointer_service import (  # noqa: E402
+    close_async_checkpointer,
+    init_async_checkpointer,
+)
+from backend.utils.rate_limit import chat_rate_limiter, format_rate_limit_message  # noqa: E402
+from backend.utils.user import resolve_user_from_token  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+CHAT_STREAM_PATH = "/api/chat/stream"
+MAX_MESSAGE_SIZE = 64 * 1024  # 与 POST /api/chat 一致
+# 请求体上限：64KB 消息经 JSON \uXXXX 转义最多膨胀 6 倍，另留其余字段的余量
+MAX_BODY_SIZE = 6 * MAX_MESSAGE_SIZE + 64 * 1024
+
+SSE_HEADERS = [
+    (b"content-type", b"text/event-stream; charset=utf-8"),
+    (b"cache-control", b"no-cache"),
+    (b"x-accel-buffering", b"no"),
+]
+
+flask_app = create_app(mode=PRODUCT)
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    if scope["path"] == CHAT_STREAM_PATH and scope["method"] == "POST":
+        with flask_app.app_context():
+            await _chat_stream(scope, receive, send)
+    elif scope["path"] == "/health":
+        await _send_json(send, 200, {"status": "ok"})
+    else:
+        await _send_json(send, 404, {"error": "Not Found"})
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            try:
+                with flask_app.app_context():
+                    await init_async_checkpointer(get_config())
+            except Exception as e:
+                logger.error("Async checkpointer 初始化失败: %s", e, exc_info=True)
+                await send({"type": "lifespan.startup.failed", "message": str(e)})
+                return
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await close_async_checkpointer()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def _chat_stream(scope, receive, send):
+    """POST /api/chat/stream：鉴权 → 限流 → 参数校验 → 异步 Agent 流式响应。"""
+    user = await asyncio.to_thread(resolve_user_from_token, _bearer_token(scope))
+    if not user:
+        await _send_sse_error(send, 401, "未登录或登录已过期")
+        return
+
+    allowed, limit_description, remaining_seconds = await asyncio.to_thread(
+        chat_rate_limiter.is_allowed, user["id"]
+    )
+    if not allowed:
+        await _send_sse_error(send, 429, format_rate_limit_message(limit_description, remaining_seconds))
+        return
+
+    body = await _read_body(receive, MAX_BODY_SIZE)
+    if body is None:
+        await _send_sse_error(send, 413, f"请求体过大，最大允许：{MAX_BODY_SIZE} 字节")
+        return
+    try:
+        data = json.loads(body or b"{}")
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        await _send_sse_error(send, 400, "请求体必须是 JSON")
+        return
+    error = _validate_payload(data)
+    if error:
+        await _send_sse_error(send, 400, error)
+        return
+
+    message = (data.get("message") or "").strip()
+    if not message:
+        await _send_sse_error(send, 400, "消息不能为空")
+        return
+    message_size = len(message.encode("utf-8"))
+    if message_size > MAX_MESSAGE_SIZE:
+        await _send_sse_error(
+            send,
+            400,
+            f"消息过长，当前大小：{message_size} 字节，最大允许：{MAX_MESSAGE_SIZE} 字节（64KB）",
+        )
+        return
+
+    config = get_config()
+    cancel_event = threading.Event()
+    chat_service = ChatService(
+        agent_service=get_agent_service(),
+        llm_service=get_llm_service(),
+        config=config,
+    )
+    events = chat_service.aprocess_chat_stream_with_session(
+        user["id"],
+        data.get("session_id"),
+        message,
+        data.get("file_ids") or [],
+        data.get("llm_provider"),
+        data.get("knowledge_base_ids") or [],
+        cancel_event=cancel_event,
+    )
+    if config.SSE_COALESCE_WINDOW_MS > 0:
+        events = acoalesce_events(events, config.SSE_COALESCE_WINDOW_MS, config.SSE_COALESCE_MAX_BYTES)
+
+    await send({"type": "http.response.start", "status": 200, "headers": SSE_HEADERS})
+    watcher = asyncio.create_task(_watch_disconnect(receive, cancel_event))
+    try:
+        # 断开后仍把生成器消费完：Agent 收尾产出 cancelled 的 done，ChatService 据此保存部分回答
+        async for event in events:
+            if not cancel_event.is_set():
+                await _send_body(send, event.to_sse())
+    except Exception as e:
+        print(f"Stream generation error: {e}")
+        if not cancel_event.is_set():
+            await _send_body(send, error_event(f"流式响应错误: {str(e)}").to_sse())
+    finally:
+        watcher.cancel()
+    if not cancel_event.is_set():
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+async def _watch_disconnect(receive, cancel_event: threading.Event) -> None:
+    """请求体已读完，之后 `receive()` 只会在客户端断开时返回 `http.disconnect`。"""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            cancel_event.set()
+            return
+
+
+def _bearer_token(scope) -> str:
+    for name, value in scope.get("headers", []):
+        if name == b"authorization":
+            auth = value.decode("latin-1")
+            if auth.startswith("Bearer "):
+                return auth.split(" ", 1)[1].strip()
+    return ""
+
+
+def _validate_payload(data) -> str:
+    """校验请求体字段类型，返回错误信息；合法时返回空字符串。"""
+    if not isinstance(data, dict):
+        return "请求体必须是 JSON 对象"
+    if not isinstance(data.get("message") or "", str):
+        return "message 必须是字符串"
+    session_id = data.get("session_id")
+    if session_id is not None and (isinstance(session_id, bool) or not isinstance(session_id, (int, str))):
+        return "session_id 必须是整数或字符串"
+    if not isinstance(data.get("llm_provider") or "", str):
+        return "llm_provider 必须是字符串"
+    for field in ("file_ids", "knowledge_base_ids"):
+        values = data.get(field) or []
+        if not isinstance(values, list) or any(isinstance(v, bool) or not isinstance(v, int) for v in values):
+            return f"{field} 必须是整数数组"
+    return ""
+
+
+async def _read_body(receive, limit: int):
+    """读取完整请求体；累计超过 `limit` 字节时停止读取并返回 None。"""
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > limit:
+            return None
+        chunks.append(chunk)
+        if not message.get("more_body"):
+            break
+    return b"".join(chunks)
+
+
+async def _send_body(send, text: str) -> None:
+    await send({"type": "http.response.body", "body": text.encode("utf-8"), "more_body": True})
+
+
+async def _send_sse_error(send, status: int, message: str) -> None:
+    await send({"type": "http.response.start", "status": status, "headers": SSE_HEADERS})
+    await send({"type": "http.response.body", "body": error_event(message).to_sse().encode("utf-8")})
+
+
+async def _send_json(send, status: int, payload: dict) -> None:
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json")],
+    })
+    await send({"type": "http.response.body", "body": json.dumps(payload).encode("utf-8")})
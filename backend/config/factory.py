@@ -19,6 +19,16 @@ def resolve_log_dir() -> Path:
     return DEFAULT_LOG_DIR
 
 
+def parse_llm_endpoints(raw: str) -> list:
+    """解析 `base_url|api_key,base_url|api_key` 形式的端点池；省略 key 时沿用提供商默认 key。"""
+    endpoints = []
+    for item in raw.split(","):
+        base_url, _, api_key = item.strip().partition("|")
+        if base_url.strip():
+            endpoints.append({"base_url": base_url.strip(), "api_key": api_key.strip()})
+    return endpoints
+
+
 class Config:
     """基础配置，实例化时从环境变量加载全部运行时参数。"""
 
@@ -27,6 +37,9 @@ class Config:
     def __init__(self):
         self.AUTH_TOKEN_SECRET = os.environ.get("AUTH_TOKEN_SECRET")
         self.AUTH_TOKEN_MAX_AGE = int(os.environ.get("AUTH_TOKEN_MAX_AGE", "86400"))
+        # 已登录用户信息缓存：进程内 TTL（秒，也是停用在其他 worker 生效的最大延迟）与 Redis TTL
+        self.AUTH_USER_LOCAL_TTL = int(os.environ.get("AUTH_USER_LOCAL_TTL", "15"))
+        self.AUTH_USER_CACHE_TTL = int(os.environ.get("AUTH_USER_CACHE_TTL", "300"))
 
         self.MYSQL_HOST = os.environ.get("MYSQL_HOST", "mysql")
         self.MYSQL_PORT = int(os.environ.get("MYSQL_PORT", "23306"))
@@ -59,6 +72,8 @@ class Config:
         self.BAIDU_SEARCH_MAX_RESULTS = int(os.environ.get("BAIDU_SEARCH_MAX_RESULTS", "3"))
 
         self.DEEPSEEK_API_KEY = os.environ.get("DEEPSEEK_API_KEY", "")
+        # 端点池（可选）：多个 OpenAI 兼容地址 / Key，按延迟与错误率路由并在首 token 前故障转移
+        self.DEEPSEEK_ENDPOINTS = os.environ.get("DEEPSEEK_ENDPOINTS", "")
         self.LLM_PROVIDERS = {
             "deepseek": {
                 "type": "openai_compatible",
@@ -69,9 +84,30 @@ class Config:
                 "max_context_length": 512000,
                 "supports_images": False,
                 "enabled": True,
+                "endpoints": parse_llm_endpoints(self.DEEPSEEK_ENDPOINTS),
             },
         }
         self.LLM_DEFAULT_PROVIDER = "deepseek"
+        # 端点池路由：首 token 延迟 / 错误率 EWMA 平滑系数，失败端点冷却秒数，
+        # 池内端点的连接超时与读超时（读超时即首 token 及 token 间隔上限，超时后转移到下一个端点）
+        self.LLM_POOL_EWMA_ALPHA = float(os.environ.get("LLM_POOL_EWMA_ALPHA", "0.3"))
+        self.LLM_POOL_COOLDOWN = int(os.environ.get("LLM_POOL_COOLDOWN", "30"))
+        self.LLM_POOL_CONNECT_TIMEOUT = float(os.environ.get("LLM_POOL_CONNECT_TIMEOUT", "10"))
+        self.LLM_POOL_READ_TIMEOUT = float(os.environ.get("LLM_POOL_READ_TIMEOUT", "60"))
+        # api_keys 表 Key 池：单 Key 默认并发流 / 每分钟 token 上限（0 不限，表内字段优先），
+        # Key 变更检查间隔（秒，0 关闭热更新），所有 Key 已满时等待空闲 Key 的最长秒数
+        self.LLM_KEY_MAX_CONCURRENCY = int(os.environ.get("LLM_KEY_MAX_CONCURRENCY", "0"))
+        self.LLM_KEY_TPM_LIMIT = int(os.environ.get("LLM_KEY_TPM_LIMIT", "0"))
+        self.LLM_KEY_RELOAD_INTERVAL = int(os.environ.get("LLM_KEY_RELOAD_INTERVAL", "30"))
+        self.LLM_KEY_ACQUIRE_TIMEOUT = float(os.environ.get("LLM_KEY_ACQUIRE_TIMEOUT", "10"))
+        # LLM HTTP 连接池（每 worker、每提供商一个）：总连接 / 保活连接上限、空闲保活秒数、
+        # 是否启用 HTTP/2（需安装 h2），单端点提供商的连接超时与读超时（秒）
+        self.LLM_HTTP_MAX_CONNECTIONS = int(os.environ.get("LLM_HTTP_MAX_CONNECTIONS", "100"))
+        self.LLM_HTTP_MAX_KEEPALIVE = int(os.environ.get("LLM_HTTP_MAX_KEEPALIVE", "20"))
+        self.LLM_HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("LLM_HTTP_KEEPALIVE_EXPIRY", "90"))
+        self.LLM_HTTP2 = int(os.environ.get("LLM_HTTP2", "1"))
+        self.LLM_HTTP_CONNECT_TIMEOUT = float(os.environ.get("LLM_HTTP_CONNECT_TIMEOUT", "10"))
+        self.LLM_HTTP_READ_TIMEOUT = float(os.environ.get("LLM_HTTP_READ_TIMEOUT", "600"))
 
         self.KB_EMBEDDING_API_URL = os.environ.get("KB_EMBEDDING_API_URL", "")
         self.KB_EMBEDDING_API_KEY = os.environ.get("KB_EMBEDDING_API_KEY", "")
@@ -92,6 +128,53 @@ class Config:
         self.KB_RRF_K = int(os.environ.get("KB_RRF_K", "60"))
         self.KB_RERANK_CANDIDATES = int(os.environ.get("KB_RERANK_CANDIDATES", "20"))
 
+        # 知识库大文件断点续传
+        self.KB_UPLOAD_PART_SIZE = int(os.environ.get("KB_UPLOAD_PART_SIZE", str(5 * 1024 * 1024)))
+        self.KB_UPLOAD_SESSION_TTL = int(os.environ.get("KB_UPLOAD_SESSION_TTL", "86400"))
+        # complete 认领超时（秒）：执行 complete 的 worker 崩溃后，超时的认领可被重试接管
+        self.KB_UPLOAD_CLAIM_TIMEOUT = int(os.environ.get("KB_UPLOAD_CLAIM_TIMEOUT", "1800"))
+
+        # Token 用量缓冲写入：满 N 条或每 T 秒批量落库；BATCH_SIZE<=1 时同步写入
+        self.TOKEN_USAGE_BATCH_SIZE = int(os.environ.get("TOKEN_USAGE_BATCH_SIZE", "50"))
+        self.TOKEN_USAGE_FLUSH_INTERVAL = float(os.environ.get("TOKEN_USAGE_FLUSH_INTERVAL", "2"))
+        self.TOKEN_USAGE_MAX_BUFFER = int(os.environ.get("TOKEN_USAGE_MAX_BUFFER", "10000"))
+
+        # 统计接口服务端缓存（秒）：新用量落库即按版本号失效，TTL 兜底（如跨零点）；纯历史范围固定 1 小时
+        self.STATS_CACHE_TTL = int(os.environ.get("STATS_CACHE_TTL", "30"))
+
+        # 聊天限流存储算法：sliding_log（精确，默认）/ sliding_window（双桶加权计数）/ gcra
+        self.RATE_LIMIT_ALGORITHM = os.environ.get("RATE_LIMIT_ALGORITHM", "sliding_log").strip().lower()
+
+        # 图片/文档下载：app 由 worker 发送；x-accel / x-sendfile 鉴权后交给前置服务器零拷贝发送
+        self.FILE_SERVE_MODE = os.environ.get("FILE_SERVE_MODE", "app").strip().lower()
+        self.FILE_ACCEL_PREFIX = os.environ.get("FILE_ACCEL_PREFIX", "/_protected_uploads/")
+        self.FILE_CACHE_MAX_AGE = int(os.environ.get("FILE_CACHE_MAX_AGE", "31536000"))
+
+        # 聊天 SSE 帧合并：窗口（毫秒）内连续正文合并为一帧；0 表示每个 token 单独一帧
+        self.SSE_COALESCE_WINDOW_MS = int(os.environ.get("SSE_COALESCE_WINDOW_MS", "0"))
+        self.SSE_COALESCE_MAX_BYTES = int(os.environ.get("SSE_COALESCE_MAX_BYTES", "1024"))
+
+        # 聊天流断线续传：每次运行的事件回放缓冲（条数上限 / 运行结束后保留秒数）
+        self.CHAT_REPLAY_MAXLEN = int(os.environ.get("CHAT_REPLAY_MAXLEN", "5000"))
+        self.CHAT_REPLAY_TTL = int(os.environ.get("CHAT_REPLAY_TTL", "600"))
+
+        # 聊天运行调度：每个 worker 同时执行的运行数 / 全局排队上限（超出返回 503）
+        self.CHAT_RUN_MAX_CONCURRENCY = int(os.environ.get("CHAT_RUN_MAX_CONCURRENCY", "8"))
+        self.CHAT_RUN_QUEUE_MAX = int(os.environ.get("CHAT_RUN_QUEUE_MAX", "200"))
+        # 无人观看（客户端断开且未重连）超过该秒数的运行自动取消；0 表示不取消，始终生成完整回答
+        self.CHAT_RUN_ORPHAN_GRACE = int(os.environ.get("CHAT_RUN_ORPHAN_GRACE", "30"))
+
+        # 聊天消息落库：write_behind 开始即写入用户消息并按间隔（秒）追加回答；turn 为结束后整轮写入
+        self.CHAT_PERSIST_MODE = os.environ.get("CHAT_PERSIST_MODE", "write_behind")
+        self.CHAT_PERSIST_INTERVAL = float(os.environ.get("CHAT_PERSIST_INTERVAL", "2.0"))
+
+        # 语义回答缓存（依赖 KB_EMBEDDING_*）：新会话首轮的相似问题直接回放历史回答，跳过 LLM
+        self.RESPONSE_CACHE_ENABLED = int(os.environ.get("RESPONSE_CACHE_ENABLED", "0"))
+        self.RESPONSE_CACHE_THRESHOLD = float(os.environ.get("RESPONSE_CACHE_THRESHOLD", "0.95"))
+        self.RESPONSE_CACHE_TTL = int(os.environ.get("RESPONSE_CACHE_TTL", "86400"))
+        # 缓存范围：user 只回放本人问过的回答；global 跨用户共享（问题或回答含个人信息时会泄露给他人）
+        self.RESPONSE_CACHE_SCOPE = os.environ.get("RESPONSE_CACHE_SCOPE", "user")
+
     @property
     def DATABASE_URL(self):
         return (
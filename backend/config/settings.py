@@ -9,3 +9,7 @@ DEFAULT_LOG_DIR = PROJECT_ROOT / "logs"
 
 # 文件上传配置
 MAX_FILE_SIZE = 100 * 1024 * 1024  # 100MB
+
+# 上传目录；内容寻址 blob 存放于其下 `.blobs`（需与上传文件同一文件系统以支持硬链接）
+UPLOAD_DIR = PROJECT_ROOT / "uploads"
+UPLOAD_BLOB_DIR = UPLOAD_DIR / ".blobs"
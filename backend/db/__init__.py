@@ -14,6 +14,9 @@ from backend.db.models import (
     KbDocument,
     KnowledgeBase,
     TokenUsage,
+    TokenUsageDaily,
+    TokenUsageHourly,
+    TokenUsageRollupState,
     UploadedFile,
     User,
 )
@@ -27,6 +30,9 @@ __all__ = [
     "KbDocument",
     "KnowledgeBase",
     "TokenUsage",
+    "TokenUsageDaily",
+    "TokenUsageHourly",
+    "TokenUsageRollupState",
     "UploadedFile",
     "User",
     "get_db",
@@ -4,6 +4,7 @@
 1) 连接池
    - `create_engine_instance()`  创建带连接池的 SQLAlchemy Engine
    - `init_db()`  初始化全局 Engine（失败时最多重试 5 次）
+   - `_sync_schema()`  为已存在的表补齐模型新增的列与索引（仅增量）
 2) 会话获取
    - `get_session()`  直接返回 ORM Session（路由/Service 层常用）
    - `get_db()`  生成器式 Session，适用于依赖注入场景
@@ -11,7 +12,7 @@
 import logging
 import time
 
-from sqlalchemy import create_engine, event, text
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.exc import DisconnectionError, OperationalError
 from sqlalchemy.orm import sessionmaker
 
@@ -74,9 +75,49 @@ def _create_tables(engine):
     from backend.db.models import Base
 
     Base.metadata.create_all(bind=engine, checkfirst=True)
+    _sync_schema(engine, Base.metadata)
     logger.info("数据库表结构已就绪")
 
 
+def _sync_schema(engine, metadata):
+    """为已存在的表补齐模型中新增的列与索引（幂等，仅增量）。
+
+    create_all 只创建缺失的表，不会修改已有表；模型新增列时
+    在此执行 `ALTER TABLE ... ADD COLUMN`，已有行取 NULL 或 server_default。
+    不会修改或删除已有列。
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    preparer = engine.dialect.identifier_preparer
+
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+
+            existing_columns = {col["name"] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                ddl = (
+                    f"ALTER TABLE {preparer.quote(table.name)} "
+                    f"ADD COLUMN {preparer.quote(column.name)} "
+                    f"{column.type.compile(dialect=engine.dialect)} NULL"
+                )
+                if column.server_default is not None:
+                    default = column.server_default.arg
+                    ddl += f" DEFAULT {getattr(default, 'text', default)}"
+                conn.execute(text(ddl))
+                logger.info("已补齐列 %s.%s", table.name, column.name)
+
+            existing_indexes = {idx["name"] for idx in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name in existing_indexes:
+                    continue
+                index.create(bind=conn)
+                logger.info("已补齐索引 %s.%s", table.name, index.name)
+
+
 def init_db():
     """初始化全局 Engine 与 Session 工厂，带重试机制。"""
     global _engine, _SessionLocal
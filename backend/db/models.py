@@ -3,7 +3,7 @@
 表总览（按业务领域）：
 1) 用户与认证
    - `User`    账号、密码哈希、admin 标志
-   - `ApiKey`  LLM 提供商 API 密钥
+   - `ApiKey`  LLM 提供商 API 密钥（含单 Key 并发 / TPM 上限，供 Key 池调度）
 2) 聊天
    - `ChatSession`          会话主题与 LLM 提供商
    - `ChatMessage`          用户/助手消息及附件 ID
@@ -11,6 +11,8 @@
 3) 文件与统计
    - `UploadedFile`  上传文件元数据与提取文本
    - `TokenUsage`    Token 用量记录
+   - `TokenUsageHourly` / `TokenUsageDaily`  按（时间桶, 用户, 模型）预聚合的用量
+   - `TokenUsageRollupState`  汇总表历史回填的目标与进度（单行）
 4) 知识库
    - `KnowledgeBase`  用户知识库
    - `KbDocument`     知识库文档元数据
@@ -19,12 +21,15 @@ from sqlalchemy import (
     BigInteger,
     Boolean,
     Column,
+    Date,
+    DateTime,
     ForeignKey,
     Index,
     Integer,
     String,
     Text,
     TIMESTAMP,
+    UniqueConstraint,
     text,
 )
 from sqlalchemy.ext.declarative import declarative_base
@@ -53,6 +58,9 @@ class ApiKey(Base):
     api_key = Column(String(255), nullable=False)
     provider = Column(String(50), default="deepseek")
     is_active = Column(Boolean, default=True)
+    # 单个 Key 的并发流与每分钟 token 上限；NULL 时使用 LLM_KEY_MAX_CONCURRENCY / LLM_KEY_TPM_LIMIT
+    max_concurrency = Column(Integer, nullable=True)
+    tpm_limit = Column(Integer, nullable=True)
     created_at = Column(TIMESTAMP, server_default=text("CURRENT_TIMESTAMP"))
     updated_at = Column(
         TIMESTAMP,
@@ -67,6 +75,8 @@ class TokenUsage(Base):
     __table_args__ = (
         Index("idx_token_usage_user_id", "user_id"),
         Index("idx_token_usage_request_time", "request_time"),
+        # 按会话统计提示缓存命中率
+        Index("idx_token_usage_session_id", "session_id"),
     )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -74,16 +84,71 @@ class TokenUsage(Base):
     prompt_tokens = Column(Integer, default=0)
     completion_tokens = Column(Integer, default=0)
     total_tokens = Column(Integer, default=0)
+    # 提供商返回的提示前缀缓存命中 token 数（包含在 prompt_tokens 内）
+    cached_tokens = Column(Integer, default=0, server_default=text("0"))
+    session_id = Column(Integer)
     model = Column(String(50), default="deepseek-chat")
     request_time = Column(TIMESTAMP, server_default=text("CURRENT_TIMESTAMP"))
 
 
+class TokenUsageHourly(Base):
+    """小时级用量汇总表 `token_usage_hourly`，随 `token_usage` 写入增量维护。"""
+    __tablename__ = "token_usage_hourly"
+    __table_args__ = (
+        UniqueConstraint("bucket_start", "user_id", "model", name="uq_token_usage_hourly_bucket"),
+        Index("idx_token_usage_hourly_user_bucket", "user_id", "bucket_start"),
+    )
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    bucket_start = Column(DateTime, nullable=False)
+    user_id = Column(Integer, nullable=False)
+    model = Column(String(50), nullable=False, default="")
+    prompt_tokens = Column(BigInteger, nullable=False, default=0)
+    completion_tokens = Column(BigInteger, nullable=False, default=0)
+    total_tokens = Column(BigInteger, nullable=False, default=0)
+    cached_tokens = Column(BigInteger, nullable=False, default=0, server_default=text("0"))
+    request_count = Column(Integer, nullable=False, default=0)
+
+
+class TokenUsageDaily(Base):
+    """日级用量汇总表 `token_usage_daily`，随 `token_usage` 写入增量维护。"""
+    __tablename__ = "token_usage_daily"
+    __table_args__ = (
+        UniqueConstraint("bucket_date", "user_id", "model", name="uq_token_usage_daily_bucket"),
+        Index("idx_token_usage_daily_user_bucket", "user_id", "bucket_date"),
+    )
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    bucket_date = Column(Date, nullable=False)
+    user_id = Column(Integer, nullable=False)
+    model = Column(String(50), nullable=False, default="")
+    prompt_tokens = Column(BigInteger, nullable=False, default=0)
+    completion_tokens = Column(BigInteger, nullable=False, default=0)
+    total_tokens = Column(BigInteger, nullable=False, default=0)
+    cached_tokens = Column(BigInteger, nullable=False, default=0, server_default=text("0"))
+    request_count = Column(Integer, nullable=False, default=0)
+
+
+class TokenUsageRollupState(Base):
+    """汇总表回填进度 `token_usage_rollup_state`（单行，id=1）。
+
+    首次以增量维护汇总表的版本启动时记录 `backfill_target_id`（当时的 `MAX(token_usage.id)`），
+    此前的明细由 `scripts/backfill_usage_rollups.py` 分批回填，`backfilled_id` 为已回填到的 id。
+    """
+    __tablename__ = "token_usage_rollup_state"
+
+    id = Column(Integer, primary_key=True)
+    backfill_target_id = Column(BigInteger, nullable=False, default=0)
+    backfilled_id = Column(BigInteger, nullable=False, default=0)
+
+
 class ChatSession(Base):
     """聊天会话表 `chat_sessions`，每个用户可有多个会话。"""
     __tablename__ = "chat_sessions"
     __table_args__ = (
         Index("idx_chat_sessions_user_id", "user_id"),
         Index("idx_chat_sessions_updated_at", "updated_at"),
+        # 侧边栏 keyset 分页 (is_pinned, updated_at, id) 倒序；InnoDB 二级索引隐含主键 id
         Index("idx_chat_sessions_pinned", "user_id", "is_pinned", "updated_at"),
     )
 
@@ -92,6 +157,10 @@ class ChatSession(Base):
     title = Column(String(200), nullable=False)
     llm_provider = Column(String(50), default="deepseek")
     is_pinned = Column(Boolean, default=False)
+    # 冗余统计，由 `ChatPersistenceService.save_turn()` 维护；NULL 表示历史会话尚未回填
+    message_count = Column(Integer, default=0)
+    last_message_at = Column(TIMESTAMP, nullable=True)
+    last_message_preview = Column(String(200), nullable=True)
     created_at = Column(TIMESTAMP, server_default=text("CURRENT_TIMESTAMP"))
     updated_at = Column(
         TIMESTAMP,
@@ -106,6 +175,8 @@ class ChatMessage(Base):
     __table_args__ = (
         Index("idx_chat_messages_session_id", "session_id"),
         Index("idx_chat_messages_created_at", "created_at"),
+        # 按会话倒序分页 / bootstrap 取最近 N 条
+        Index("idx_chat_messages_session_created", "session_id", "created_at"),
     )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -126,6 +197,7 @@ class UploadedFile(Base):
         Index("idx_uploaded_files_user_id", "user_id"),
         Index("idx_uploaded_files_stored_filename", "stored_filename"),
         Index("idx_uploaded_files_created_at", "created_at"),
+        Index("idx_uploaded_files_content_hash", "content_hash"),
     )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -136,6 +208,7 @@ class UploadedFile(Base):
     file_size = Column(BigInteger, nullable=False)
     file_type = Column(String(100), nullable=False)
     file_extension = Column(String(20), nullable=False)
+    content_hash = Column(String(64), nullable=True)  # SHA-256，对应 uploads/.blobs 下的 blob
     extracted_text = Column(Text)
     text_length = Column(Integer, default=0)
     extraction_status = Column(String(20), default="pending")
@@ -175,6 +248,7 @@ class KbDocument(Base):
     __table_args__ = (
         Index("idx_kb_documents_kb_id", "knowledge_base_id"),
         Index("idx_kb_documents_user_id", "user_id"),
+        Index("idx_kb_documents_content_hash", "content_hash"),
     )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -187,6 +261,7 @@ class KbDocument(Base):
     file_path = Column(String(500), nullable=False)
     file_size = Column(BigInteger, nullable=False)
     file_extension = Column(String(20), nullable=False)
+    content_hash = Column(String(64), nullable=True)  # SHA-256，对应 uploads/.blobs 下的 blob
     status = Column(String(20), default="pending")
     chunk_count = Column(Integer, default=0)
     is_enabled = Column(Boolean, default=True, nullable=False)
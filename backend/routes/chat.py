@@ -3,7 +3,11 @@
 接口总览（按用户使用流程）：
 1) 发送消息
    - POST `/api/chat`  发送消息并返回 SSE 流式响应（支持附件、知识库、模型选择）
-2) 会话管理
+2) 运行管理（Agent 运行与连接解耦，可多端观看、断线续传、取消）
+   - GET  `/api/chat/runs`                   当前用户进行中的运行
+   - GET  `/api/chat/runs/<run_id>/events`   订阅运行事件流（SSE）
+   - POST `/api/chat/<run_id>/cancel`        取消运行
+3) 会话管理
    - GET    `/api/sessions`                      获取当前用户的会话列表
    - GET    `/api/sessions/<session_id>/messages`  获取会话消息历史
    - PATCH  `/api/sessions/<session_id>`       更新会话（如固定/取消固定）
@@ -15,6 +19,7 @@ from flask import Blueprint, Response, jsonify, request, stream_with_context
 
 from ..config import get_config
 from ..services import ChatService, get_agent_service, get_llm_service
+from ..services.chat_runs import get_run_manager, parse_event_id, stream_run_frames
 from ..services.auth_token import sse_login_required
 from ..utils import get_current_user, rate_limit_chat
 
@@ -31,8 +36,12 @@ def api_chat():
     - 方法/路径: `POST /api/chat`
     - 认证: Bearer Token
     - 请求体: `{ "message": "...", "session_id": 1, "file_ids": [], "llm_provider": "...", "knowledge_base_ids": [] }`
-    - 成功响应: `text/event-stream`，事件 `{ "type": "chunk"|"end"|"error", ... }`
-    - 失败响应: 401 未登录；400 参数错误；429 访问过于频繁
+    - 成功响应: `text/event-stream`，事件 `{ "type": "chunk"|"end"|"error", ... }`，
+      每帧带 `id: <run_id>:<seq>`
+    - 断线续传: 重发同一请求并带 `Last-Event-ID` 头，从该事件之后继续推送原运行
+      （运行在后台继续，不会重新生成；续传请求不计入限流）
+    - 调度: 运行入队后由任一空闲 worker 执行，首个事件为 `{ "type": "run", "run_id": "..." }`
+    - 失败响应: 401 未登录；400 参数错误；410 运行已过期；429 访问过于频繁；503 排队已满
     ---
     tags:
       - 聊天
@@ -46,6 +55,11 @@ def api_chat():
     produces:
       - text/event-stream
     parameters:
+      - in: header
+        name: Last-Event-ID
+        type: string
+        required: false
+        description: 断线重连时携带最后收到的事件 ID（`<run_id>:<seq>`），续传原运行
       - in: body
         name: body
         description: 聊天请求参数
@@ -113,11 +127,17 @@ def api_chat():
               example: "未登录"
       500:
         description: 服务器内部错误
+      503:
+        description: 运行排队已满
     security:
       - bearerAuth: []
     """
     user = get_current_user()
 
+    last_event_id = request.headers.get('Last-Event-ID')
+    if last_event_id:
+        return _resume_chat_run(user, last_event_id)
+
     try:
         data = request.get_json()
         message = data.get('message', '').strip()
@@ -143,37 +163,22 @@ def api_chat():
                 status=400
             )
         
-        chat_service = ChatService(
-            agent_service=get_agent_service(),
-            llm_service=get_llm_service(),
-            config=get_config(),
-        )
-        
-        def generate():
-            """生成SSE流"""
-            try:
-                for chunk in chat_service.process_chat_stream_with_session(
-                    user['id'], 
-                    session_id, 
-                    message,
-                    file_ids,
-                    llm_provider,
-                    knowledge_base_ids,
-                ):
-                    yield chunk
-            except Exception as e:
-                print(f"Stream generation error: {e}")
-                yield f'data: {json.dumps({"type": "error", "message": f"流式响应错误: {str(e)}"})}\n\n'
-        
-        return Response(
-            stream_with_context(generate()),
-            mimetype='text/event-stream',
-            headers={
-                'Cache-Control': 'no-cache',
-                'X-Accel-Buffering': 'no',
-                'Connection': 'keep-alive'
-            }
-        )
+        # 运行入队，由空闲 worker 执行；响应只订阅事件通道，客户端断开不影响生成
+        manager = get_run_manager()
+        run_id = manager.submit(user['id'], {
+            'session_id': session_id,
+            'message': message,
+            'file_ids': file_ids,
+            'llm_provider': llm_provider,
+            'knowledge_base_ids': knowledge_base_ids,
+        })
+        if run_id is None:
+            return Response(
+                'data: {"type":"error","message":"当前排队请求过多，请稍后再试"}\n\n',
+                mimetype='text/event-stream',
+                status=503
+            )
+        return _sse_response(_run_frames(manager.buffer, run_id))
             
     except Exception as e:
         print(f"Chat API error: {e}")
@@ -184,22 +189,203 @@ def api_chat():
         )
 
 
+def _resume_chat_run(user, last_event_id):
+    """按 `Last-Event-ID` 续传原运行（仅运行所属用户可续传）。"""
+    parsed = parse_event_id(last_event_id)
+    buffer = get_run_manager().buffer
+    if not parsed or buffer.owner(parsed[0]) != user['id']:
+        return Response(
+            f'data: {json.dumps({"type": "error", "message": "流式运行已结束或已过期，请刷新会话"})}\n\n',
+            mimetype='text/event-stream',
+            status=410
+        )
+    run_id, after = parsed
+    return _sse_response(_run_frames(buffer, run_id, after))
+
+
+def _run_frames(buffer, run_id, after=0):
+    """订阅运行事件；按 `SSE_COALESCE_WINDOW_MS` / `SSE_COALESCE_MAX_BYTES` 合并连续的正文帧。"""
+    config = get_config()
+    return stream_run_frames(
+        buffer, run_id, after,
+        coalesce_window_ms=config.SSE_COALESCE_WINDOW_MS,
+        coalesce_max_bytes=config.SSE_COALESCE_MAX_BYTES,
+    )
+
+
+def _sse_response(frames):
+    return Response(
+        stream_with_context(frames),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',
+            'Connection': 'keep-alive'
+        }
+    )
+
+
+@chat_bp.route('/chat/runs', methods=['GET'])
+def list_chat_runs():
+    """获取当前用户进行中（排队 / 运行）的聊天运行。
+
+    用法:
+    - 方法/路径: `GET /api/chat/runs`
+    - 认证: Bearer Token
+    - 成功响应: `{ "runs": [{ "run_id": "...", "session_id": 1, "status": "running", "created_at": 1700000000 }] }`
+    - 失败响应: 401 未登录
+    ---
+    tags:
+      - 聊天
+    summary: 获取进行中的运行
+    description: 页面刷新或在另一设备打开时，用于发现并重新订阅尚未结束的回答
+    produces:
+      - application/json
+    responses:
+      200:
+        description: 获取成功
+      401:
+        description: 未登录
+    security:
+      - bearerAuth: []
+    """
+    user = get_current_user()
+    if not user:
+        return jsonify({'error': '未登录'}), 401
+
+    runs = get_run_manager().buffer.active_runs(user['id'])
+    return jsonify({'runs': [
+        {
+            'run_id': run['run_id'],
+            'session_id': run['session_id'],
+            'status': run['status'],
+            'created_at': int(run['created_at']),
+        }
+        for run in runs
+    ]})
+
+
+@chat_bp.route('/chat/runs/<run_id>/events', methods=['GET'])
+@sse_login_required
+def stream_chat_run(run_id):
+    """订阅指定运行的事件流（可多端同时订阅）。
+
+    用法:
+    - 方法/路径: `GET /api/chat/runs/<run_id>/events?after=0`
+    - 认证: Bearer Token
+    - 参数: `after` 从该序号之后开始推送（默认 0，即从头回放）；也可用 `Last-Event-ID` 头
+    - 成功响应: `text/event-stream`，事件格式与 `POST /api/chat` 相同
+    - 失败响应: 401 未登录；410 运行不存在或已过期
+    ---
+    tags:
+      - 聊天
+    summary: 订阅运行事件流
+    produces:
+      - text/event-stream
+    parameters:
+      - in: path
+        name: run_id
+        type: string
+        required: true
+        description: 运行 ID
+      - in: query
+        name: after
+        type: integer
+        default: 0
+        description: 从该序号之后开始推送
+      - in: header
+        name: Last-Event-ID
+        type: string
+        required: false
+        description: 断线重连时携带最后收到的事件 ID（`<run_id>:<seq>`）
+    responses:
+      200:
+        description: 订阅成功
+      401:
+        description: 未登录
+      410:
+        description: 运行不存在或已过期
+    security:
+      - bearerAuth: []
+    """
+    user = get_current_user()
+    after = request.args.get('after', 0, type=int)
+    parsed = parse_event_id(request.headers.get('Last-Event-ID'))
+    if parsed and parsed[0] == run_id:
+        after = parsed[1]
+    return _resume_chat_run(user, f"{run_id}:{max(after, 0)}")
+
+
+@chat_bp.route('/chat/<run_id>/cancel', methods=['POST'])
+def cancel_chat_run(run_id):
+    """取消指定运行（排队中的不再执行，运行中的在下一个 token / 工具边界停止）。
+
+    用法:
+    - 方法/路径: `POST /api/chat/<run_id>/cancel`
+    - 认证: Bearer Token
+    - 成功响应: `{ "success": true }`；订阅方随后收到 `{ "type": "done", "cancelled": true }`
+    - 已生成的部分回答照常保存（metadata 标记 `cancelled`），用量按已生成部分估算记录
+    - 关闭页面且 `CHAT_RUN_ORPHAN_GRACE` 秒内未重连的运行也会被自动取消
+    - 失败响应: 401 未登录；404 运行不存在或无权限
+    ---
+    tags:
+      - 聊天
+    summary: 取消运行
+    produces:
+      - application/json
+    parameters:
+      - in: path
+        name: run_id
+        type: string
+        required: true
+        description: 运行 ID
+    responses:
+      200:
+        description: 已请求取消
+      401:
+        description: 未登录
+      404:
+        description: 运行不存在或无权限
+    security:
+      - bearerAuth: []
+    """
+    user = get_current_user()
+    if not user:
+        return jsonify({'error': '未登录'}), 401
+
+    manager = get_run_manager()
+    if manager.buffer.owner(run_id) != user['id']:
+        return jsonify({'error': '运行不存在或无权限'}), 404
+    manager.cancel(run_id)
+    return jsonify({'success': True})
+
+
 @chat_bp.route('/sessions', methods=['GET'])
 def get_sessions():
-    """获取当前用户的全部聊天会话。
+    """分页获取当前用户的聊天会话（置顶优先，按更新时间倒序）。
 
     用法:
-    - 方法/路径: `GET /api/sessions`
+    - 方法/路径: `GET /api/sessions?limit=50&cursor=...`
     - 认证: Bearer Token
-    - 成功响应: `{ "sessions": [...] }`
+    - 成功响应: `{ "sessions": [...], "next_cursor": "..." | null }`
     - 失败响应: 401 未登录；500 获取失败
     ---
     tags:
       - 会话
-    summary: 获取当前用户的所有会话
-    description: 返回当前登录用户的所有聊天会话列表，按创建时间倒序排列
+    summary: 获取当前用户的会话列表
+    description: 返回当前登录用户的聊天会话列表（置顶优先，按更新时间倒序），使用 keyset 游标分页
     produces:
       - application/json
+    parameters:
+      - in: query
+        name: limit
+        type: integer
+        default: 200
+        description: 每页条数（1-200）
+      - in: query
+        name: cursor
+        type: string
+        description: 上一页返回的 next_cursor
     responses:
       200:
         description: 获取成功
@@ -233,6 +419,16 @@ def get_sessions():
                     type: integer
                     description: 消息数量
                     example: 10
+                  last_message_at:
+                    type: string
+                    format: date-time
+                    description: 最后一条消息时间
+                  last_message_preview:
+                    type: string
+                    description: 最后一条消息预览
+            next_cursor:
+              type: string
+              description: 下一页游标，没有更多时为 null
         examples:
           application/json:
             sessions:
@@ -264,8 +460,11 @@ def get_sessions():
             llm_service=get_llm_service(),
             config=get_config(),
         )
-        sessions = chat_service.get_sessions(user['id'])
-        return jsonify({'sessions': sessions})
+        limit = min(max(request.args.get('limit', 200, type=int) or 200, 1), 200)
+        sessions, next_cursor = chat_service.get_sessions(
+            user['id'], limit=limit, cursor=request.args.get('cursor')
+        )
+        return jsonify({'sessions': sessions, 'next_cursor': next_cursor})
     except Exception as e:
         print(f"Get sessions error: {e}")
         return jsonify({'error': '获取会话列表失败'}), 500
@@ -273,12 +472,13 @@ def get_sessions():
 
 @chat_bp.route('/sessions/<int:session_id>/messages', methods=['GET'])
 def get_session_messages(session_id):
-    """获取指定会话的全部消息（含附件信息）。
+    """获取指定会话的消息（含附件信息），支持从最新一页往前翻。
 
     用法:
-    - 方法/路径: `GET /api/sessions/<session_id>/messages`
+    - 方法/路径: `GET /api/sessions/<session_id>/messages?limit=50&before=...`
     - 认证: Bearer Token
-    - 成功响应: `{ "messages": [...] }`
+    - 参数: `limit` 每页条数（不传返回全部）；`before` 上一页的 `next_cursor`
+    - 成功响应: `{ "messages": [...], "next_cursor": "..." | null }`，页内按时间正序
     - 失败响应: 401 未登录；404 会话不存在或无权限；500 获取失败
     ---
     tags:
@@ -294,12 +494,23 @@ def get_session_messages(session_id):
         required: true
         description: 会话ID
         example: 1
+      - in: query
+        name: limit
+        type: integer
+        description: 每页条数（1-200），不传返回全部消息
+      - in: query
+        name: before
+        type: string
+        description: 上一页返回的 next_cursor，获取更早的消息
     responses:
       200:
         description: 获取成功
         schema:
           type: object
           properties:
+            next_cursor:
+              type: string
+              description: 更早消息的游标，没有更多时为 null
             messages:
               type: array
               items:
@@ -377,13 +588,23 @@ def get_session_messages(session_id):
             llm_service=get_llm_service(),
             config=get_config(),
         )
+        limit = request.args.get('limit', type=int)
+        if limit is not None:
+            limit = min(max(limit, 1), 200)
         # 包含文件信息
-        messages = chat_service.get_session_messages(session_id, user['id'], include_files=True)
+        page = chat_service.get_session_messages(
+            session_id,
+            user['id'],
+            include_files=True,
+            limit=limit,
+            before=request.args.get('before'),
+        )
         
-        if messages is None:
+        if page is None:
             return jsonify({'error': '会话不存在或无权限'}), 404
         
-        return jsonify({'messages': messages})
+        messages, next_cursor = page
+        return jsonify({'messages': messages, 'next_cursor': next_cursor})
     except Exception as e:
         print(f"Get session messages error: {e}")
         return jsonify({'error': '获取消息失败'}), 500
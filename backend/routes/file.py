@@ -13,12 +13,13 @@
 """
 import os
 
-from flask import Blueprint, jsonify, request, send_file
+from flask import Blueprint, jsonify, request
 
 from ..db import get_session
 from ..db import UploadedFile
 from ..services import FileService
-from ..utils import get_current_user
+from ..services.file_service import FileExtractor
+from ..utils import get_current_user, send_upload
 
 file_bp = Blueprint("file", __name__)
 
@@ -388,7 +389,8 @@ def get_image(file_id):
     用法:
     - 方法/路径: `GET /api/files/<file_id>/image`
     - 认证: Bearer Token
-    - 成功响应: 图片二进制流（`image/*`）
+    - 成功响应: 图片二进制流（`image/*`），带强 ETag 与 `Cache-Control: immutable`，支持 Range
+    - 条件请求: `If-None-Match` 命中返回 304
     - 失败响应: 401 未登录；404 非图片或文件不存在；500 获取失败
     ---
     tags:
@@ -409,6 +411,10 @@ def get_image(file_id):
         description: 图片文件
         schema:
           type: file
+      206:
+        description: Range 部分内容
+      304:
+        description: 未修改（ETag 命中）
       401:
         description: 未登录
       404:
@@ -433,19 +439,18 @@ def get_image(file_id):
             return jsonify({'error': '文件不存在或无权限'}), 404
         
         # 检查是否为图片文件
-        file_service = FileService()
-        if not file_service.extractor.is_image(file_obj.file_extension):
+        if not FileExtractor().is_image(file_obj.file_extension):
             return jsonify({'error': '文件不是图片格式'}), 404
         
         # 检查文件是否存在
         if not os.path.exists(file_obj.file_path):
             return jsonify({'error': '文件不存在'}), 404
         
-        # 返回图片文件
-        return send_file(
+        # 返回图片文件（uuid 命名不可变：强 ETag + 长缓存；x-accel 模式下由 nginx 发送）
+        return send_upload(
             file_obj.file_path,
             mimetype=file_obj.file_type or 'image/jpeg',
-            as_attachment=False
+            content_hash=file_obj.content_hash,
         )
     except Exception as e:
         print(f"Get image error: {e}")
@@ -11,15 +11,20 @@
    - GET    `/api/knowledge-bases/<kb_id>/documents`                  列出文档
    - POST   `/api/knowledge-bases/<kb_id>/documents`                  上传文档并入库
    - DELETE `/api/knowledge-bases/<kb_id>/documents/<doc_id>`         删除文档
+   - POST   `/api/knowledge-bases/<kb_id>/uploads`                    创建断点续传会话
+   - GET    `/api/knowledge-bases/<kb_id>/uploads/<upload_id>`        查询已上传分片
+   - PUT    `/api/knowledge-bases/<kb_id>/uploads/<upload_id>/parts/<n>`  上传单个分片
+   - POST   `/api/knowledge-bases/<kb_id>/uploads/<upload_id>/complete`   拼接并入库
+   - DELETE `/api/knowledge-bases/<kb_id>/uploads/<upload_id>`        取消续传会话
 3) 检索与配置
    - POST   `/api/knowledge-bases/<kb_id>/search`  混合检索测试
    - GET    `/api/knowledge/supported`               支持的文件类型与大小限制
 """
-from flask import Blueprint, jsonify, request, send_file
+from flask import Blueprint, jsonify, request
 
 from ..services.auth_token import login_required
-from ..services.knowledge_service import KnowledgeService
-from ..utils import get_current_user
+from ..services.knowledge_service import DocumentProcessingError, KnowledgeService
+from ..utils import get_current_user, send_upload
 
 knowledge_bp = Blueprint("knowledge", __name__)
 
@@ -346,6 +351,148 @@ def upload_document(kb_id):
         return jsonify({"error": f"上传失败: {exc}"}), 500
 
 
+@knowledge_bp.route("/knowledge-bases/<int:kb_id>/uploads", methods=["POST"])
+@login_required
+def init_upload(kb_id):
+    """创建大文件断点续传会话。
+
+    用法:
+    - 方法/路径: `POST /api/knowledge-bases/<kb_id>/uploads`
+    - 认证: Bearer Token
+    - 请求体: `{ "filename": "...", "file_size": 123456 }`
+    - 成功响应: `{ "success": true, "upload": { upload_id, part_size, total_parts, uploaded_parts } }`
+    - 失败响应: 400 参数错误或格式不支持；401 未登录
+    - 后续: 按 `part_size` 切片逐个 PUT 分片，全部完成后 POST complete
+    ---
+    tags:
+      - 知识库
+    summary: 创建断点续传会话
+    consumes:
+      - application/json
+    produces:
+      - application/json
+    security:
+      - bearerAuth: []
+    parameters:
+      - in: path
+        name: kb_id
+        type: integer
+        required: true
+        description: 知识库 ID
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: object
+          required:
+            - filename
+            - file_size
+          properties:
+            filename:
+              type: string
+              description: 原始文件名
+            file_size:
+              type: integer
+              description: 文件总字节数
+    responses:
+      200:
+        description: 创建成功
+      400:
+        description: 参数错误或文件格式不支持
+      401:
+        description: 未登录
+    """
+    user = get_current_user()
+    data = request.get_json(silent=True) or {}
+
+    try:
+        upload = _service().init_upload(
+            kb_id=kb_id,
+            user_id=user["id"],
+            filename=data.get("filename", ""),
+            file_size=int(data.get("file_size") or 0),
+        )
+        return jsonify({"success": True, "upload": upload})
+    except (TypeError, ValueError) as exc:
+        return jsonify({"error": str(exc)}), 400
+    except Exception as exc:
+        return jsonify({"error": f"创建上传会话失败: {exc}"}), 500
+
+
+@knowledge_bp.route("/knowledge-bases/<int:kb_id>/uploads/<upload_id>", methods=["GET"])
+@login_required
+def get_upload(kb_id, upload_id):
+    """查询续传会话状态（已上传分片列表），用于断线后续传。"""
+    user = get_current_user()
+
+    upload = _service().get_upload(kb_id, user["id"], upload_id)
+    if not upload:
+        return jsonify({"error": "上传会话不存在或已过期"}), 404
+    return jsonify({"upload": upload})
+
+
+@knowledge_bp.route(
+    "/knowledge-bases/<int:kb_id>/uploads/<upload_id>/parts/<int:part_number>",
+    methods=["PUT"],
+)
+@login_required
+def upload_part(kb_id, upload_id, part_number):
+    """上传单个分片。
+
+    用法:
+    - 方法/路径: `PUT /api/knowledge-bases/<kb_id>/uploads/<upload_id>/parts/<part_number>`
+    - 认证: Bearer Token
+    - 请求体: 分片原始字节（`Content-Type: application/octet-stream`），序号从 1 开始
+    - 成功响应: `{ "success": true, "upload_id", "part_number", "size" }`
+    - 失败响应: 400 分片大小不符或序号越界；404 会话不存在或已过期
+    - 说明: 同一分片可重复上传（覆盖），分片之间无顺序要求
+    """
+    user = get_current_user()
+
+    try:
+        result = _service().upload_part(kb_id, user["id"], upload_id, part_number, request.stream)
+        if not result:
+            return jsonify({"error": "上传会话不存在或已过期"}), 404
+        return jsonify({"success": True, **result})
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    except Exception as exc:
+        return jsonify({"error": f"分片上传失败: {exc}"}), 500
+
+
+@knowledge_bp.route("/knowledge-bases/<int:kb_id>/uploads/<upload_id>/complete", methods=["POST"])
+@login_required
+def complete_upload(kb_id, upload_id):
+    """拼接全部分片并入库（解析、分块、向量化），响应同普通上传。
+
+    解析失败时文档已建立（status=failed）、会话已结束，400 响应带 `document`，不要重试 complete。
+    """
+    user = get_current_user()
+
+    try:
+        doc = _service().complete_upload(kb_id, user["id"], upload_id)
+        if not doc:
+            return jsonify({"error": "上传会话不存在或已过期"}), 404
+        return jsonify({"success": True, "document": doc})
+    except DocumentProcessingError as exc:
+        return jsonify({"error": str(exc), "document": exc.document}), 400
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    except Exception as exc:
+        return jsonify({"error": f"上传失败: {exc}"}), 500
+
+
+@knowledge_bp.route("/knowledge-bases/<int:kb_id>/uploads/<upload_id>", methods=["DELETE"])
+@login_required
+def abort_upload(kb_id, upload_id):
+    """取消续传会话并删除已上传分片。"""
+    user = get_current_user()
+
+    if not _service().abort_upload(kb_id, user["id"], upload_id):
+        return jsonify({"error": "上传会话不存在或已过期"}), 404
+    return jsonify({"success": True})
+
+
 @knowledge_bp.route("/knowledge-bases/<int:kb_id>/documents/<int:doc_id>", methods=["DELETE"])
 @login_required
 def delete_document(kb_id, doc_id):
@@ -475,8 +622,9 @@ def download_document(kb_id, doc_id):
     payload = _service().get_document_download(kb_id, doc_id, user["id"])
     if not payload:
         return jsonify({"error": "文档不存在或文件已丢失"}), 404
-    return send_file(
+    return send_upload(
         payload["file_path"],
+        content_hash=payload["content_hash"],
         as_attachment=True,
         download_name=payload["original_filename"],
     )
@@ -2,11 +2,12 @@
 
 接口总览：
 - GET `/api/llm/providers`  获取已配置的 LLM 提供商列表及默认模型
+- GET `/api/llm/routing`    端点池路由与 HTTP 连接复用统计（需 admin）
 """
 from flask import Blueprint, jsonify
 
 from ..config import get_config
-from ..services import get_llm_service
+from ..services import admin_required, get_llm_service
 from ..utils import get_current_user
 
 llm_bp = Blueprint("llm", __name__)
@@ -92,3 +93,106 @@ def get_llm_providers():
     except Exception as e:
         print(f"Get LLM providers error: {e}")
         return jsonify({'error': '获取模型列表失败'}), 500
+
+
+@llm_bp.route('/llm/routing', methods=['GET'])
+@admin_required
+def get_llm_routing():
+    """获取端点池路由与 HTTP 连接复用统计（当前 worker 进程）。
+
+    用法:
+    - 方法/路径: `GET /api/llm/routing`
+    - 认证: Bearer Token，需 admin
+    - 成功响应: `{ "pools": [{ "provider_id": "...", "endpoints": [...] }], "http_clients": [...] }`
+    - 说明: 只包含已被使用过的端点池（开启 Key 热更新时每个提供商都有，可能只有一个默认成员）；
+      统计按 worker 进程独立，`tpm_used` 有 Redis 时为跨 worker 的当前分钟用量
+    ---
+    tags:
+      - 模型
+    summary: 获取 LLM 端点池路由与连接复用统计（管理员）
+    produces:
+      - application/json
+    responses:
+      200:
+        description: 获取成功
+        schema:
+          type: object
+          properties:
+            pools:
+              type: array
+              items:
+                type: object
+                properties:
+                  provider_id:
+                    type: string
+                    example: "deepseek"
+                  endpoints:
+                    type: array
+                    items:
+                      type: object
+                      properties:
+                        name:
+                          type: string
+                          example: "api.deepseek.com#key3"
+                        key_id:
+                          type: integer
+                          description: api_keys 表 ID，配置端点为 null
+                        max_concurrency:
+                          type: integer
+                          description: 并发流上限，0 表示不限
+                        tpm_limit:
+                          type: integer
+                          description: 每分钟 token 上限，0 表示不限
+                        tpm_used:
+                          type: integer
+                          description: 当前分钟已用 token
+                        latency_ewma_ms:
+                          type: number
+                          description: 首 token 延迟 EWMA（毫秒），未测量时为 null
+                        error_rate:
+                          type: number
+                        inflight:
+                          type: integer
+                        requests:
+                          type: integer
+                        failures:
+                          type: integer
+                        failovers:
+                          type: integer
+                        cooling_down:
+                          type: boolean
+                        score:
+                          type: number
+                          description: 选路得分，越小越优先
+            http_clients:
+              type: array
+              items:
+                type: object
+                properties:
+                  provider_id:
+                    type: string
+                  http2:
+                    type: boolean
+                    description: 是否启用 HTTP/2（实际协议由 ALPN 协商）
+                  requests:
+                    type: integer
+                  new_connections:
+                    type: integer
+                    description: 新建 TCP 连接数
+                  tls_handshakes:
+                    type: integer
+                  http2_requests:
+                    type: integer
+                  reuse_rate:
+                    type: number
+                    description: 1 - 新建连接数 / 请求数
+      401:
+        description: 未登录或无管理员权限
+    security:
+      - bearerAuth: []
+    """
+    llm_service = get_llm_service()
+    return jsonify({
+        'pools': llm_service.get_routing_stats(),
+        'http_clients': llm_service.get_http_stats(),
+    })
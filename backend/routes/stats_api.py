@@ -2,18 +2,42 @@
 
 接口总览：
 - GET `/api/stats/user`   当前用户 Token 用量（需登录）
-- GET `/api/stats/admin`  全局统计与最近用量（需 admin）
+- GET `/api/stats/sessions/<session_id>`  单个会话的用量与提示缓存命中率（需登录，仅本人会话）
+- GET `/api/stats/admin`  全局统计、最近用量与语义回答缓存命中率（需 admin）
+- GET `/api/stats/admin/usage`  按时间范围与维度分组的用量序列（需 admin）
+
+统计结果经 `stats_cache` 缓存（`STATS_CACHE_TTL`），新用量落库时按版本号失效。
 """
-from flask import Blueprint, jsonify
+from datetime import date, timedelta
+
+from flask import Blueprint, jsonify, request
 
-from ..middleware.errors import AppError
+from ..config import get_config
+from ..middleware.errors import AppError, BadRequestError
 from ..services import StatsService
+from ..services.response_cache import get_response_cache
+from ..services.stats_cache import stats_cache
+from ..services.stats_service import USAGE_GROUP_BY
 from ..services.auth_token import admin_required, login_required
 from ..utils import get_current_user
 
 stats_api_bp = Blueprint("stats_api", __name__)
 
 
+# 单次查询允许的最大天数（hour 分组按小时桶计，限制更严）
+_MAX_RANGE_DAYS = {"hour": 31, "day": 731, "model": 731, "user": 731}
+
+
+def _parse_date_arg(name: str, default: date) -> date:
+    value = (request.args.get(name) or "").strip()
+    if not value:
+        return default
+    try:
+        return date.fromisoformat(value[:10])
+    except ValueError:
+        raise BadRequestError(f"{name} 格式应为 YYYY-MM-DD")
+
+
 def _serialize_token_usage(usage) -> dict:
     request_time = usage.request_time
     return {
@@ -22,11 +46,21 @@ def _serialize_token_usage(usage) -> dict:
         "prompt_tokens": usage.prompt_tokens or 0,
         "completion_tokens": usage.completion_tokens or 0,
         "total_tokens": usage.total_tokens or 0,
+        "cached_tokens": usage.cached_tokens or 0,
+        "session_id": usage.session_id,
         "model": usage.model or "",
         "request_time": request_time.isoformat() if request_time else None,
     }
 
 
+def _build_admin_payload() -> dict:
+    admin_data = StatsService().get_admin_stats()
+    return {
+        "stats": admin_data.get("stats", {}),
+        "recent_usage": [_serialize_token_usage(item) for item in admin_data.get("recent_usage", [])],
+    }
+
+
 @stats_api_bp.route("/user", methods=["GET"])
 @login_required
 def get_user_stats():
@@ -51,11 +85,53 @@ def get_user_stats():
       - bearerAuth: []
     """
     user = get_current_user()
-    stats_service = StatsService()
-    stats = stats_service.get_user_stats(user["id"])
+    stats = stats_cache.get_or_compute(
+        f"user:{user['id']}:{stats_cache.generation(user['id'])}",
+        get_config().STATS_CACHE_TTL,
+        lambda: StatsService().get_user_stats(user["id"]),
+    )
     return jsonify({"stats": stats})
 
 
+@stats_api_bp.route("/sessions/<int:session_id>", methods=["GET"])
+@login_required
+def get_session_usage(session_id):
+    """获取当前用户某个会话的 Token 用量与提示缓存命中率。
+
+    用法:
+    - 方法/路径: `GET /api/stats/sessions/<session_id>`
+    - 认证: Bearer Token
+    - 成功响应: `{ "session_id": 1, "usage": { prompt, completion, total, cached, cache_hit_rate, count } }`
+    - 说明: `cached` 为提供商报告的前缀缓存命中 token 数，`cache_hit_rate = cached / prompt`
+    ---
+    tags:
+      - 统计
+    summary: 获取会话 Token 用量与缓存命中率
+    produces:
+      - application/json
+    parameters:
+      - in: path
+        name: session_id
+        type: integer
+        required: true
+        description: 会话 ID
+    responses:
+      200:
+        description: 获取成功
+      401:
+        description: 未登录
+    security:
+      - bearerAuth: []
+    """
+    user = get_current_user()
+    try:
+        usage = StatsService.get_session_usage(session_id, user_id=user["id"])
+    except Exception as e:
+        print(f"Get session usage API error: {e}")
+        raise AppError("获取会话用量失败", status_code=500)
+    return jsonify({"session_id": session_id, "usage": usage})
+
+
 @stats_api_bp.route("/admin", methods=["GET"])
 @admin_required
 def get_admin_stats():
@@ -64,7 +140,8 @@ def get_admin_stats():
     用法:
     - 方法/路径: `GET /api/stats/admin`
     - 认证: Bearer Token，需 admin
-    - 成功响应: `{ "stats": {...}, "recent_usage": [...] }`
+    - 成功响应: `{ "stats": {...}, "recent_usage": [...], "response_cache": {...} }`
+    - `response_cache` 为语义回答缓存计数（实时读取 Redis，不经统计缓存）
     ---
     tags:
       - 统计
@@ -80,15 +157,86 @@ def get_admin_stats():
       - bearerAuth: []
     """
     try:
-        stats_service = StatsService()
-        admin_data = stats_service.get_admin_stats()
-        recent_usage = [_serialize_token_usage(item) for item in admin_data.get("recent_usage", [])]
-        return jsonify(
-            {
-                "stats": admin_data.get("stats", {}),
-                "recent_usage": recent_usage,
-            }
+        payload = stats_cache.get_or_compute(
+            f"admin:{stats_cache.generation()}",
+            get_config().STATS_CACHE_TTL,
+            _build_admin_payload,
         )
+        return jsonify({**payload, "response_cache": get_response_cache().stats()})
     except Exception as e:
         print(f"Get admin stats API error: {e}")
         raise AppError("获取管理统计失败", status_code=500)
+
+
+@stats_api_bp.route("/admin/usage", methods=["GET"])
+@admin_required
+def get_admin_usage_series():
+    """按时间范围与分组维度查询 Token 用量序列（admin）。
+
+    用法:
+    - 方法/路径: `GET /api/stats/admin/usage?from=2025-01-01&to=2025-01-31&group_by=day`
+    - 认证: Bearer Token，需 admin
+    - 参数: `from` / `to` 起止日期（含两端，默认最近 7 天）；`group_by` 默认 `day`
+    - 成功响应: `{ "from", "to", "group_by", "series": [{ bucket|model|user_id, prompt, completion, total, cached, cache_hit_rate, count }] }`
+    - 失败响应: 400 参数错误；401 未登录或无管理员权限
+    ---
+    tags:
+      - 统计
+    summary: Token 用量时间序列（管理员）
+    produces:
+      - application/json
+    parameters:
+      - in: query
+        name: from
+        type: string
+        format: date
+        description: 起始日期（含），默认 6 天前
+      - in: query
+        name: to
+        type: string
+        format: date
+        description: 结束日期（含），默认今天
+      - in: query
+        name: group_by
+        type: string
+        enum: [day, hour, model, user]
+        default: day
+        description: 分组维度
+    responses:
+      200:
+        description: 获取成功
+      400:
+        description: 参数错误
+      401:
+        description: 未登录或无管理员权限
+    security:
+      - bearerAuth: []
+    """
+    group_by = (request.args.get("group_by") or "day").strip().lower()
+    if group_by not in USAGE_GROUP_BY:
+        raise BadRequestError(f"group_by 仅支持: {', '.join(USAGE_GROUP_BY)}")
+
+    today = date.today()
+    end = _parse_date_arg("to", today)
+    start = _parse_date_arg("from", end - timedelta(days=6))
+    if start > end:
+        raise BadRequestError("from 不能晚于 to")
+    if (end - start).days + 1 > _MAX_RANGE_DAYS[group_by]:
+        raise BadRequestError(f"group_by={group_by} 时时间范围最多 {_MAX_RANGE_DAYS[group_by]} 天")
+
+    try:
+        series = StatsService.get_usage_series(
+            start, end, group_by, cache_ttl=get_config().STATS_CACHE_TTL
+        )
+    except Exception as e:
+        print(f"Get usage series API error: {e}")
+        raise AppError("获取用量序列失败", status_code=500)
+
+    return jsonify(
+        {
+            "from": start.isoformat(),
+            "to": end.isoformat(),
+            "group_by": group_by,
+            "series": series,
+        }
+    )
@@ -1,17 +1,45 @@
-"""Agent Service — 基于 create_agent 的统一对话引擎。"""
-import json
-from typing import Dict, Generator, List, Optional
+"""Agent Service — 基于 create_agent 的统一对话引擎。
+
+- `run_agent_stream()`   同步流（Flask / gevent）
+- `arun_agent_stream()`  asyncio 流（ASGI 入口 `backend.asgi`）
+两者共用 `_AgentRunState` 解析 LangGraph 流，产出相同的 `ChatEvent` 序列。
+传入 `cancel_event` 时可被取消：已生成的部分回答写回 checkpoint，用量按已完成调用
+加部分输出估算，最后产出 `done`（`cancelled: true`）。
+"""
+import asyncio
+import threading
+from typing import AsyncGenerator, Callable, Dict, Generator, List, Optional
 
 from langchain.agents import create_agent
-from langchain.agents.middleware import SummarizationMiddleware
-from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain.agents.middleware import AgentMiddleware, SummarizationMiddleware
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately
 
 from .agent_tools import build_agent_tools
-from .checkpointer_service import get_checkpointer
+from .cancellation import (
+    CancelCallbackHandler,
+    RunCancelled,
+    clear_cancel_event,
+    raise_if_cancelled,
+    set_cancel_event,
+)
+from .chat_events import (
+    DONE,
+    TOOL_END,
+    TOOL_START,
+    TOOL_STATUS,
+    ChatEvent,
+    content_event,
+    done_event,
+    error_event,
+    usage_event,
+)
+from .checkpointer_service import get_async_checkpointer, get_checkpointer
 from .knowledge_service import KnowledgeService
 from .llm_service import LLMService
 from .web_search_service import WebSearchService
 
+# 提示前缀的第一段：保持为常量，任何逐请求变化都会让提供商的前缀缓存失效
 SYSTEM_PROMPT = """你是一个友好、专业且乐于助人的 AI 助手。
 
 你可以使用以下工具：
@@ -26,9 +54,206 @@ SYSTEM_PROMPT = """你是一个友好、专业且乐于助人的 AI 助手。
 4. 用简洁清晰的中文回答；不确定时请诚实说明
 5. 用户上传的文件内容已在消息中，请基于文件内容作答"""
 
+STREAM_MODES = ["messages", "updates", "custom"]
+# create_agent 中调用模型的节点名；只统计该节点产出的 AIMessage 用量
+MODEL_NODE = "model"
+# 取消时写回 checkpoint 的占位工具结果，保证 tool_calls 后必有对应 ToolMessage
+CANCELLED_TOOL_RESULT = "工具调用已取消"
+
+
+def _usage_from_message(msg) -> Optional[Dict]:
+    """从 AIMessage 提取用量；`cached_tokens` 为提供商报告的提示前缀缓存命中数。"""
+    um = getattr(msg, "usage_metadata", None)
+    if not um:
+        return None
+    cached = (um.get("input_token_details") or {}).get("cache_read")
+    if cached is None:
+        # DeepSeek 另以 prompt_cache_hit_tokens 返回命中数
+        token_usage = (getattr(msg, "response_metadata", None) or {}).get("token_usage") or {}
+        cached = token_usage.get("prompt_cache_hit_tokens", 0)
+    return {
+        "prompt_tokens": um.get("input_tokens", 0),
+        "completion_tokens": um.get("output_tokens", 0),
+        "total_tokens": um.get("total_tokens", 0),
+        "cached_tokens": cached or 0,
+    }
+
+
+def _tool_name(tool) -> str:
+    if isinstance(tool, dict):
+        return tool.get("name") or (tool.get("function") or {}).get("name", "")
+    return getattr(tool, "name", "")
+
+
+class StablePrefixMiddleware(AgentMiddleware):
+    """提示前缀缓存友好：每次模型调用前固定工具顺序。
+
+    提供商按字节前缀命中缓存（系统提示 → 工具定义 → 历史消息），前缀中任何字节变化都会
+    让其后的内容全部失效。本中间件放在中间件链最内层，看到的是最终请求，工具按名称排序，
+    不受构建顺序或其他中间件追加工具的影响。
+    其余部分由约定保证：
+    - 系统提示为常量 `SYSTEM_PROMPT`，不拼接时间、用户等易变信息（时间走 `get_time_info` 工具）
+    - 易变内容（本轮用户输入、文件上下文、工具结果）总在消息末尾；历史消息在 checkpoint 中
+      逐字节保留，同一轮的多次模型调用与下一轮都可复用前缀
+    """
+
+    def wrap_model_call(self, request, handler):
+        return handler(self._stabilize(request))
+
+    async def awrap_model_call(self, request, handler):
+        return await handler(self._stabilize(request))
+
+    @staticmethod
+    def _stabilize(request):
+        return request.override(tools=sorted(request.tools, key=_tool_name))
+
+
+class _AgentRunState:
+    """单次 Agent 运行的流解析状态（同步 / 异步流共用）。"""
+
+    def __init__(self):
+        self.content_parts: List[str] = []
+        # 当前这次模型调用已流出的正文（模型节点完成时清空），取消时用于估算用量
+        self.call_parts: List[str] = []
+        self.tool_calls_log: List[Dict] = []
+        self.pending_tools: Dict[str, Dict] = {}
+        # 本轮各次模型调用（含工具循环中的中间调用）的累计用量
+        self.usage: Optional[Dict] = None
+
+    def events_from_chunk(self, mode: str, chunk) -> Generator[ChatEvent, None, None]:
+        if mode == "messages":
+            token, _metadata = chunk
+            content = getattr(token, "content", None)
+            if not content or not isinstance(content, str):
+                return
+            if getattr(token, "tool_calls", None):
+                return
+            if isinstance(token, ToolMessage):
+                return
+            self.content_parts.append(content)
+            self.call_parts.append(content)
+            yield content_event(content)
+
+        elif mode == "updates":
+            for node, update in chunk.items():
+                if not isinstance(update, dict):
+                    continue
+                for msg in update.get("messages", []):
+                    if node == MODEL_NODE and isinstance(msg, AIMessage):
+                        self._record_model_call(msg)
+                    yield from self._events_from_update_message(msg)
+
+        elif mode == "custom":
+            if isinstance(chunk, dict):
+                yield ChatEvent(TOOL_STATUS, dict(chunk))
+
+    def final_events(self, final_state) -> Generator[ChatEvent, None, None]:
+        """流结束后从最终 state 补发正文（如有需要）、用量与 done。"""
+        usage = self.usage
+        messages = (final_state.values or {}).get("messages", [])
+        if not self.content_parts:
+            for msg in reversed(messages):
+                if isinstance(msg, HumanMessage):
+                    # 只在本轮消息中回退，不把上一轮的回答当作本轮正文
+                    break
+                if isinstance(msg, AIMessage) and msg.content:
+                    # 模型未逐 token 流式输出时，用最终消息补发一次正文
+                    fallback = msg.content if isinstance(msg.content, str) else str(msg.content)
+                    self.content_parts.append(fallback)
+                    yield content_event(fallback)
+                    break
+        for msg in reversed(messages):
+            if usage or isinstance(msg, HumanMessage):
+                # 早于本轮 HumanMessage 的用量属于之前的轮次，不能重复记账
+                break
+            if isinstance(msg, AIMessage) and getattr(msg, "usage_metadata", None):
+                # updates 流未带用量时退回本轮最后一条带用量的 AIMessage
+                usage = _usage_from_message(msg)
+                break
+
+        if usage:
+            yield usage_event(usage)
+
+        yield done_event(self.tool_calls_log)
+
+    def cancel_repair_messages(self, state) -> List:
+        """取消后需写回 checkpoint 的消息：未完成工具调用的占位结果 + 部分回答。"""
+        messages = (state.values or {}).get("messages", []) if state else []
+        answered = {msg.tool_call_id for msg in messages if isinstance(msg, ToolMessage)}
+        repair = []
+        for msg in reversed(messages):
+            if isinstance(msg, HumanMessage):
+                break
+            if isinstance(msg, AIMessage) and msg.tool_calls:
+                repair.extend(
+                    ToolMessage(content=CANCELLED_TOOL_RESULT, tool_call_id=tc["id"], name=tc.get("name"))
+                    for tc in msg.tool_calls
+                    if tc.get("id") and tc["id"] not in answered
+                )
+        partial = "".join(self.call_parts)
+        if partial:
+            repair.append(AIMessage(content=partial, response_metadata={"cancelled": True}))
+        return repair
+
+    def cancelled_events(self, state) -> Generator[ChatEvent, None, None]:
+        """取消后的收尾事件：用量（本轮已完成调用 + 被中断调用的估算）与 cancelled 的 done。"""
+        messages = (state.values or {}).get("messages", []) if state else []
+        usage = dict(self.usage or {"prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0})
+
+        partial = "".join(self.call_parts)
+        if partial and messages:
+            # 流被中断时提供商不会返回 usage，按字符数估算被中断的这次调用
+            usage["prompt_tokens"] += count_tokens_approximately(
+                [SystemMessage(content=SYSTEM_PROMPT), *messages]
+            )
+            usage["completion_tokens"] += count_tokens_approximately([AIMessage(content=partial)])
+            usage["estimated"] = True
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        if usage["total_tokens"]:
+            yield usage_event(usage)
+        yield ChatEvent(DONE, {"tool_calls": self.tool_calls_log, "cancelled": True})
+
+    def _record_model_call(self, msg) -> None:
+        """模型节点完成一次调用：累计其用量，清空被中断时才需要估算的正文。"""
+        self.call_parts = []
+        call_usage = _usage_from_message(msg)
+        if not call_usage:
+            return
+        if self.usage is None:
+            self.usage = call_usage
+            return
+        for key, value in call_usage.items():
+            self.usage[key] = self.usage.get(key, 0) + value
+
+    def _events_from_update_message(self, msg) -> Generator[ChatEvent, None, None]:
+        """从 updates 流解析 tool 事件。"""
+        if isinstance(msg, AIMessage) and msg.tool_calls:
+            for tc in msg.tool_calls:
+                tc_id = tc.get("id") or tc.get("name", "unknown")
+                entry = {
+                    "id": tc_id,
+                    "name": tc.get("name", "unknown"),
+                    "args": tc.get("args", {}),
+                }
+                self.pending_tools[tc_id] = entry
+                yield ChatEvent(TOOL_START, {"tool": entry["name"], "args": entry["args"]})
+
+        elif isinstance(msg, ToolMessage):
+            tc_id = msg.tool_call_id
+            entry = self.pending_tools.pop(tc_id, {"name": msg.name or "tool", "args": {}})
+            preview = (msg.content or "")[:200]
+            log_entry = {
+                "name": entry.get("name") or msg.name,
+                "args": entry.get("args", {}),
+                "result_preview": preview,
+            }
+            self.tool_calls_log.append(log_entry)
+            yield ChatEvent(TOOL_END, {"tool": log_entry["name"], "result_preview": preview})
+
 
 class AgentService:
-    """封装 create_agent 创建、checkpoint bootstrap 与 SSE 流式执行。"""
+    """封装 create_agent 创建、checkpoint bootstrap 与流式执行（产出 `ChatEvent`）。"""
 
     def __init__(self, config, llm_service=None):
         self.config = config
@@ -36,17 +261,21 @@ class AgentService:
         self.search_service = WebSearchService(config)
         self.knowledge_service = KnowledgeService(config)
         self._agents: Dict[str, object] = {}
+        self._async_agents: Dict[str, object] = {}
 
-    def _create_agent(self, provider_id: str):
+    def _create_agent(self, provider_id: str, checkpointer=None):
         llm = self.llm_service.get_llm(provider_id)
-        tools = build_agent_tools(self.search_service, self.knowledge_service)
-        checkpointer = get_checkpointer()
+        # 工具定义位于提示前缀中，按名称固定顺序
+        tools = sorted(build_agent_tools(self.search_service, self.knowledge_service), key=_tool_name)
+        checkpointer = checkpointer or get_checkpointer()
         middleware = [
             SummarizationMiddleware(
                 model=llm,
                 trigger=("fraction", self.config.AGENT_SUMMARY_TRIGGER_FRACTION),
                 keep=("messages", self.config.AGENT_SUMMARY_KEEP_MESSAGES),
-            )
+            ),
+            # 最内层：在最终请求上固定前缀
+            StablePrefixMiddleware(),
         ]
         return create_agent(
             model=llm,
@@ -61,19 +290,45 @@ class AgentService:
             self._agents[provider_id] = self._create_agent(provider_id)
         return self._agents[provider_id]
 
+    def get_async_agent(self, provider_id: str):
+        """绑定 `AsyncPostgresSaver` 的 Agent，供 `astream` 使用。"""
+        if provider_id not in self._async_agents:
+            self._async_agents[provider_id] = self._create_agent(
+                provider_id, checkpointer=get_async_checkpointer()
+            )
+        return self._async_agents[provider_id]
+
     def _agent_config(self, session_id: int) -> dict:
         return {
             "configurable": {"thread_id": str(session_id)},
             "recursion_limit": self.config.AGENT_RECURSION_LIMIT,
         }
 
-    def bootstrap_checkpoint_if_needed(self, agent, session_id: int, seed_messages: List) -> None:
-        """若 PG 无 checkpoint，用 MySQL 历史 seed。"""
+    @staticmethod
+    def _run_config(config: dict, cancel_event: Optional[threading.Event]) -> dict:
+        """运行用 config：绑定取消回调，模型 / 工具开始及每个 token 时检查取消信号。"""
+        if cancel_event is None:
+            return config
+        return {**config, "callbacks": [CancelCallbackHandler(cancel_event)]}
+
+    def bootstrap_checkpoint_if_needed(
+            self,
+            agent,
+            session_id: int,
+            seed_messages: Optional[List] = None,
+            seed_loader: Optional[Callable[[], List]] = None,
+    ) -> None:
+        """若 PG 无 checkpoint，用 MySQL 历史 seed。
+
+        `seed_loader` 仅在 checkpoint 为空时调用，常规轮次不访问 MySQL。
+        """
         config = self._agent_config(session_id)
         state = agent.get_state(config)
         existing = (state.values or {}).get("messages") or []
         if existing:
             return
+        if seed_messages is None and seed_loader is not None:
+            seed_messages = seed_loader()
         if seed_messages:
             agent.update_state(config, {"messages": seed_messages})
 
@@ -85,109 +340,127 @@ class AgentService:
             seed_messages: Optional[List] = None,
             user_id: Optional[int] = None,
             knowledge_base_ids: Optional[List[int]] = None,
-    ) -> Generator[str, None, None]:
-        """流式运行 Agent，yield SSE 事件。"""
+            seed_loader: Optional[Callable[[], List]] = None,
+            cancel_event: Optional[threading.Event] = None,
+    ) -> Generator[ChatEvent, None, None]:
+        """流式运行 Agent，yield `ChatEvent`（SSE 序列化由路由完成）。
+
+        `cancel_event` 被设置后，在下一个 token / 工具边界停止，产出取消收尾事件。
+        """
         from .knowledge.context import clear_knowledge_context, set_knowledge_context
 
         if user_id is not None:
             set_knowledge_context(user_id, knowledge_base_ids)
+        set_cancel_event(cancel_event)
 
         agent = self.get_agent(provider_id)
         config = self._agent_config(session_id)
 
-        self.bootstrap_checkpoint_if_needed(agent, session_id, seed_messages or [])
-
-        assistant_content = ""
-        tool_calls_log: List[Dict] = []
-        usage = None
-        pending_tools: Dict[str, Dict] = {}
-
+        run = _AgentRunState()
         try:
+            self.bootstrap_checkpoint_if_needed(agent, session_id, seed_messages, seed_loader)
+
             for mode, chunk in agent.stream(
                     {"messages": [user_message]},
-                    config=config,
-                    stream_mode=["messages", "updates", "custom"],
+                    config=self._run_config(config, cancel_event),
+                    stream_mode=STREAM_MODES,
             ):
-                if mode == "messages":
-                    token, _metadata = chunk
-                    content = getattr(token, "content", None)
-                    if not content or not isinstance(content, str):
-                        continue
-                    if getattr(token, "tool_calls", None):
-                        continue
-                    if isinstance(token, ToolMessage):
-                        continue
-                    assistant_content += content
-                    yield f"data: {json.dumps({'type': 'content', 'content': content}, ensure_ascii=False)}\n\n"
-
-                elif mode == "updates":
-                    for _node, update in chunk.items():
-                        if not isinstance(update, dict):
-                            continue
-                        for msg in update.get("messages", []):
-                            yield from self._events_from_update_message(
-                                msg, tool_calls_log, pending_tools
-                            )
-
-                elif mode == "custom":
-                    payload = chunk
-                    if isinstance(payload, dict):
-                        yield f"data: {json.dumps({'type': 'tool_status', **payload}, ensure_ascii=False)}\n\n"
-
-            final_state = agent.get_state(config)
-            for msg in reversed((final_state.values or {}).get("messages", [])):
-                if isinstance(msg, AIMessage) and msg.content and not assistant_content:
-                    assistant_content = msg.content if isinstance(msg.content, str) else str(msg.content)
-                if isinstance(msg, AIMessage) and getattr(msg, "usage_metadata", None):
-                    um = msg.usage_metadata
-                    usage = {
-                        "prompt_tokens": um.get("input_tokens", 0),
-                        "completion_tokens": um.get("output_tokens", 0),
-                        "total_tokens": um.get("total_tokens", 0),
-                    }
-                    break
+                yield from run.events_from_chunk(mode, chunk)
+                raise_if_cancelled(cancel_event)
+
+            yield from run.final_events(agent.get_state(config))
+
+        except RunCancelled:
+            state = None
+            try:
+                state = agent.get_state(config)
+                repair = run.cancel_repair_messages(state)
+                if repair:
+                    agent.update_state(config, {"messages": repair}, as_node="model")
+            except Exception as e:
+                print(f"Agent cancel cleanup error: {e}")
+            yield from run.cancelled_events(state)
+        except Exception as e:
+            yield error_event(f"Agent 执行错误: {str(e)}")
+            raise
+        finally:
+            clear_knowledge_context()
+            clear_cancel_event()
+
+    async def abootstrap_checkpoint_if_needed(
+            self,
+            agent,
+            session_id: int,
+            seed_loader: Optional[Callable[[], List]] = None,
+    ) -> None:
+        """`bootstrap_checkpoint_if_needed()` 的异步版本；同步的 MySQL 读取放到线程池。"""
+        config = self._agent_config(session_id)
+        state = await agent.aget_state(config)
+        if (state.values or {}).get("messages"):
+            return
+        seed_messages = await asyncio.to_thread(seed_loader) if seed_loader else None
+        if seed_messages:
+            await agent.aupdate_state(config, {"messages": seed_messages})
+
+    async def arun_agent_stream(
+            self,
+            provider_id: str,
+            session_id: int,
+            user_message: HumanMessage,
+            user_id: Optional[int] = None,
+            knowledge_base_ids: Optional[List[int]] = None,
+            seed_loader: Optional[Callable[[], List]] = None,
+            cancel_event: Optional[threading.Event] = None,
+    ) -> AsyncGenerator[ChatEvent, None]:
+        """`run_agent_stream()` 的 asyncio 版本：`agent.astream` + 异步 checkpointer + 异步 HTTP。
+
+        用法:
+        - 调用方: `ChatService.aprocess_chat_stream_with_session()`（ASGI 入口）
+        - 同步工具（联网搜索、知识库检索）由 LangGraph 放到线程池执行
+        - `cancel_event`: ASGI 入口在客户端断开时设置
+        """
+        from .knowledge.context import clear_knowledge_context, set_knowledge_context
 
-            if usage:
-                yield f"data: {json.dumps({'type': 'usage', 'usage': usage}, ensure_ascii=False)}\n\n"
+        if user_id is not None:
+            set_knowledge_context(user_id, knowledge_base_ids)
+        set_cancel_event(cancel_event)
 
-            yield f"data: {json.dumps({'type': 'done', 'tool_calls': tool_calls_log}, ensure_ascii=False)}\n\n"
+        agent = self.get_async_agent(provider_id)
+        config = self._agent_config(session_id)
 
+        run = _AgentRunState()
+        try:
+            await self.abootstrap_checkpoint_if_needed(agent, session_id, seed_loader)
+
+            async for mode, chunk in agent.astream(
+                    {"messages": [user_message]},
+                    config=self._run_config(config, cancel_event),
+                    stream_mode=STREAM_MODES,
+            ):
+                for event in run.events_from_chunk(mode, chunk):
+                    yield event
+                raise_if_cancelled(cancel_event)
+
+            for event in run.final_events(await agent.aget_state(config)):
+                yield event
+
+        except RunCancelled:
+            state = None
+            try:
+                state = await agent.aget_state(config)
+                repair = run.cancel_repair_messages(state)
+                if repair:
+                    await agent.aupdate_state(config, {"messages": repair}, as_node="model")
+            except Exception as e:
+                print(f"Agent cancel cleanup error: {e}")
+            for event in run.cancelled_events(state):
+                yield event
         except Exception as e:
-            error_msg = f"Agent 执行错误: {str(e)}"
-            yield f"data: {json.dumps({'type': 'error', 'message': error_msg}, ensure_ascii=False)}\n\n"
+            yield error_event(f"Agent 执行错误: {str(e)}")
             raise
         finally:
             clear_knowledge_context()
-
-    @staticmethod
-    def _events_from_update_message(
-            msg,
-            tool_calls_log: List[Dict],
-            pending_tools: Dict[str, Dict],
-    ) -> Generator[str, None, None]:
-        """从 updates 流解析 tool 事件。"""
-        if isinstance(msg, AIMessage) and msg.tool_calls:
-            for tc in msg.tool_calls:
-                tc_id = tc.get("id") or tc.get("name", "unknown")
-                entry = {
-                    "id": tc_id,
-                    "name": tc.get("name", "unknown"),
-                    "args": tc.get("args", {}),
-                }
-                pending_tools[tc_id] = entry
-                yield f"data: {json.dumps({'type': 'tool_start', 'tool': entry['name'], 'args': entry['args']}, ensure_ascii=False)}\n\n"
-
-        elif isinstance(msg, ToolMessage):
-            tc_id = msg.tool_call_id
-            entry = pending_tools.pop(tc_id, {"name": msg.name or "tool", "args": {}})
-            preview = (msg.content or "")[:200]
-            log_entry = {
-                "name": entry.get("name") or msg.name,
-                "args": entry.get("args", {}),
-                "result_preview": preview,
-            }
-            tool_calls_log.append(log_entry)
-            yield f"data: {json.dumps({'type': 'tool_end', 'tool': log_entry['name'], 'result_preview': preview}, ensure_ascii=False)}\n\n"
+            clear_cancel_event()
 
 
 AGENT_SERVICE_KEY = "agent_service"
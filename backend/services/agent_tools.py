@@ -7,6 +7,7 @@ from langchain_core.tools import tool
 from langgraph.config import get_stream_writer
 from pydantic import Field
 
+from .cancellation import RunCancelled, run_cancellable
 from .knowledge.context import get_knowledge_context
 
 
@@ -37,7 +38,9 @@ def build_agent_tools(search_service, knowledge_service=None):
             writer({"type": "tool_status", "tool": "web_search", "status": "start", "message": "正在搜索..."})
         try:
             normalized_query = " ".join(query.split())
-            result = search_service.search(query=normalized_query)
+            result = run_cancellable(lambda: search_service.search(query=normalized_query))
+        except RunCancelled:
+            raise
         except Exception as e:
             result = f"搜索失败: {str(e)}"
         if writer:
@@ -85,11 +88,15 @@ def build_agent_tools(search_service, knowledge_service=None):
             result = "知识库服务未启用。"
         else:
             try:
-                result = knowledge_service.search_for_agent(
-                    user_id=ctx.user_id,
-                    knowledge_base_ids=ctx.knowledge_base_ids,
-                    query=query,
+                result = run_cancellable(
+                    lambda: knowledge_service.search_for_agent(
+                        user_id=ctx.user_id,
+                        knowledge_base_ids=ctx.knowledge_base_ids,
+                        query=query,
+                    )
                 )
+            except RunCancelled:
+                raise
             except Exception as e:
                 result = f"知识库检索失败: {str(e)}"
 
@@ -0,0 +1,118 @@
+"""Agent 运行取消 — 把取消信号传递到 LangGraph、模型 HTTP 流与工具调用。
+
+职责总览：
+1) 取消信号
+   - `RunCancelled`            运行被取消时在 Agent 内部抛出，由 `AgentService` 捕获并收尾
+   - `set_cancel_event()` / `get_cancel_event()` / `clear_cancel_event()`
+     以 `ContextVar` 绑定当前运行的 `threading.Event`（LangGraph 执行工具时会复制上下文）
+2) 模型调用
+   - `CancelCallbackHandler`   作为 LangChain 回调挂到 Agent config：模型开始 / 每个 token /
+     工具开始时检查信号并抛出 `RunCancelled`，中断对提供商的流式 HTTP 请求
+3) 工具调用
+   - `run_cancellable()`       在后台线程执行阻塞调用（联网搜索、知识库检索），
+     等待期间轮询取消信号，取消后立即返回，不再等待结果
+
+调用方：
+- `RunManager`（无人观看超时 / `POST /api/chat/<run_id>/cancel`）与 ASGI 入口（客户端断开）设置信号
+- `AgentService.run_agent_stream()` / `arun_agent_stream()` 绑定信号与回调
+- `agent_tools` 中的联网搜索、知识库检索工具
+
+已知局限：
+- 模型尚未返回首个 token 时，要等到首个 token 到达才会中断
+- 被放弃的工具调用仍在后台线程内运行到其自身超时，只是结果被丢弃
+"""
+import threading
+from contextvars import ContextVar, copy_context
+from typing import Callable, Optional, TypeVar
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+T = TypeVar("T")
+
+# 工具等待期间检查取消信号的间隔（秒）
+TOOL_POLL_INTERVAL = 0.2
+
+
+class RunCancelled(Exception):
+    """Agent 运行已被取消。"""
+
+
+_cancel_event: ContextVar[Optional[threading.Event]] = ContextVar("agent_cancel_event", default=None)
+
+
+def set_cancel_event(cancel_event: Optional[threading.Event]) -> None:
+    _cancel_event.set(cancel_event)
+
+
+def get_cancel_event() -> Optional[threading.Event]:
+    return _cancel_event.get()
+
+
+def clear_cancel_event() -> None:
+    _cancel_event.set(None)
+
+
+def raise_if_cancelled(cancel_event: Optional[threading.Event] = None) -> None:
+    cancel_event = cancel_event or get_cancel_event()
+    if cancel_event is not None and cancel_event.is_set():
+        raise RunCancelled()
+
+
+class CancelCallbackHandler(BaseCallbackHandler):
+    """模型 / 工具回调中检查取消信号；`raise_error` 使异常穿透到 LangGraph 而不是被回调管理器吞掉。"""
+
+    raise_error = True
+    # 异步运行时也在事件循环内同步调用，不丢到线程池
+    run_inline = True
+
+    def __init__(self, cancel_event: threading.Event):
+        self.cancel_event = cancel_event
+
+    def _check(self) -> None:
+        if self.cancel_event.is_set():
+            raise RunCancelled()
+
+    def on_chat_model_start(self, serialized, messages, **kwargs) -> None:
+        self._check()
+
+    def on_llm_start(self, serialized, prompts, **kwargs) -> None:
+        self._check()
+
+    def on_llm_new_token(self, token, **kwargs) -> None:
+        self._check()
+
+    def on_tool_start(self, serialized, input_str, **kwargs) -> None:
+        self._check()
+
+
+def run_cancellable(func: Callable[[], T]) -> T:
+    """执行阻塞调用；当前运行被取消时抛出 `RunCancelled`，不等待调用结束。
+
+    用法:
+    - 调用方: Agent 工具函数
+    - 未绑定取消信号（如脚本直接调用工具）时直接同步执行
+    """
+    cancel_event = get_cancel_event()
+    if cancel_event is None:
+        return func()
+    raise_if_cancelled(cancel_event)
+
+    outcome = {}
+    finished = threading.Event()
+
+    def target():
+        try:
+            outcome["result"] = func()
+        except BaseException as e:
+            outcome["error"] = e
+        finally:
+            finished.set()
+
+    # 复制上下文：工具线程内仍可读取 Flask 应用上下文与知识库检索上下文
+    context = copy_context()
+    threading.Thread(target=context.run, args=(target,), name="agent-tool-call", daemon=True).start()
+    while not finished.wait(TOOL_POLL_INTERVAL):
+        raise_if_cancelled(cancel_event)
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
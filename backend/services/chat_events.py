@@ -0,0 +1,196 @@
+"""聊天流事件 — Agent → ChatService → 路由之间传递的类型化事件。
+
+职责总览：
+1) 事件对象
+   - `ChatEvent(type, data)`  一条流事件；`content` 事件的文本放在 `data["content"]`
+   - 构造函数 `content_event()` / `usage_event()` / `done_event()` / `error_event()` 等
+2) 序列化
+   - `ChatEvent.to_sse()`  仅在路由边界序列化为 `data: {...}\\n\\n`（可选 `id:` 行）
+   - `to_sse_stream()`     把事件生成器包装为 SSE 字符串生成器
+3) 帧合并（可选）
+   - `ContentCoalescer`    把时间/大小窗口内连续的 content 事件合并为一帧，
+     减少高速模型下 gunicorn → nginx 的小包写入；其他事件原样、按序透传。
+     `stream_run_frames()` 在其阻塞读取的超时唤醒上检查截止时间，窗口到期即刷出
+   - `acoalesce_events()`  异步事件流的合并，供 ASGI 入口使用
+
+设计说明：
+- 服务层之间直接传对象，`ChatService` 按 `event.type` 分支累积正文与用量，
+  不再对每个 token 做 `json.loads`
+- 事件类型与前端约定的 SSE `type` 字段一一对应
+"""
+import asyncio
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Iterable, Iterator, List, Optional
+
+CONTENT = "content"
+TOOL_START = "tool_start"
+TOOL_END = "tool_end"
+TOOL_STATUS = "tool_status"
+USAGE = "usage"
+DONE = "done"
+ERROR = "error"
+SESSION_ID = "session_id"
+SESSION_TITLE = "session_title"
+
+
+@dataclass(slots=True)
+class ChatEvent:
+    """一条聊天流事件。"""
+
+    type: str
+    data: Dict[str, Any] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"type": self.type, **self.data}
+
+    @classmethod
+    def from_dict(cls, payload: Dict[str, Any]) -> "ChatEvent":
+        data = dict(payload)
+        return cls(data.pop("type"), data)
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), ensure_ascii=False)
+
+    def to_sse(self, event_id: Optional[str] = None) -> str:
+        """序列化为 SSE 帧；`event_id` 非空时带 `id:` 行，供断线重连的 `Last-Event-ID` 使用。"""
+        if event_id:
+            return f"id: {event_id}\ndata: {self.to_json()}\n\n"
+        return f"data: {self.to_json()}\n\n"
+
+
+def content_event(content: str) -> ChatEvent:
+    return ChatEvent(CONTENT, {"content": content})
+
+
+def usage_event(usage: Dict[str, int]) -> ChatEvent:
+    return ChatEvent(USAGE, {"usage": usage})
+
+
+def done_event(tool_calls: List[Dict]) -> ChatEvent:
+    return ChatEvent(DONE, {"tool_calls": tool_calls})
+
+
+def error_event(message: str) -> ChatEvent:
+    return ChatEvent(ERROR, {"message": message})
+
+
+def session_id_event(session_id: int) -> ChatEvent:
+    return ChatEvent(SESSION_ID, {"session_id": session_id})
+
+
+def session_title_event(title: str) -> ChatEvent:
+    return ChatEvent(SESSION_TITLE, {"title": title})
+
+
+class ContentCoalescer:
+    """content 事件合并状态：`push()` 返回应立即发出的事件，`flush()` 取出剩余正文。"""
+
+    def __init__(self, window_ms: int, max_bytes: int):
+        self.window = window_ms / 1000.0
+        self.max_bytes = max_bytes
+        self.parts: List[str] = []
+        self.size = 0
+        self.started = 0.0
+
+    def push(self, event: ChatEvent) -> List[ChatEvent]:
+        if event.type != CONTENT:
+            return self.flush() + [event]
+
+        text = event.data["content"]
+        if not self.parts:
+            self.started = time.monotonic()
+        self.parts.append(text)
+        self.size += len(text.encode("utf-8"))
+        if self.size >= self.max_bytes or time.monotonic() - self.started >= self.window:
+            return self.flush()
+        return []
+
+    def flush(self) -> List[ChatEvent]:
+        if not self.parts:
+            return []
+        merged = content_event("".join(self.parts))
+        self.parts, self.size = [], 0
+        return [merged]
+
+    def timeout(self) -> Optional[float]:
+        """距缓冲正文刷出截止的秒数；无缓冲时返回 None（无限等待下一个事件）。"""
+        if not self.parts:
+            return None
+        return max(0.0, self.started + self.window - time.monotonic())
+
+
+# 上游事件流结束的哨兵
+_END = object()
+
+
+class _UpstreamError:
+    """上游事件流抛出的异常，由消费方重新抛出。"""
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+async def acoalesce_events(
+        events: AsyncIterable[ChatEvent],
+        window_ms: int,
+        max_bytes: int = 1024,
+) -> AsyncIterator[ChatEvent]:
+    """合并异步事件流中窗口内连续的 content 事件（ASGI 入口使用）。
+
+    用法:
+    - 调用方: `asgi.py` 的 `/api/chat` 流式响应（`SSE_COALESCE_WINDOW_MS > 0` 时启用）
+    - 刷出时机与 `ContentCoalescer` 相同；上游由同一事件循环中的任务消费，窗口到期即刷出
+    """
+    coalescer = ContentCoalescer(window_ms, max_bytes)
+    items: asyncio.Queue = asyncio.Queue()
+
+    async def _pump() -> None:
+        try:
+            async for event in events:
+                await items.put(event)
+            await items.put(_END)
+        except Exception as e:
+            await items.put(_UpstreamError(e))
+
+    pump = asyncio.create_task(_pump())
+    try:
+        while True:
+            timeout = coalescer.timeout()
+            if timeout == 0:
+                for merged in coalescer.flush():
+                    yield merged
+                continue
+            try:
+                item = await asyncio.wait_for(items.get(), timeout)
+            except asyncio.TimeoutError:
+                continue
+            if item is _END:
+                break
+            if isinstance(item, _UpstreamError):
+                raise item.error
+            for merged in coalescer.push(item):
+                yield merged
+        for merged in coalescer.flush():
+            yield merged
+    finally:
+        if not pump.done():
+            pump.cancel()
+
+
+def to_sse_stream(events: Iterable[ChatEvent], on_error: Optional[str] = None) -> Iterator[str]:
+    """把事件流序列化为 SSE 文本流。
+
+    用法:
+    - 调用方: `/api/chat` 路由的响应生成器
+    - 参数: `on_error` 非空时，上游异常转为一条 error 事件（前缀为该文案）而不是中断连接
+    """
+    try:
+        for event in events:
+            yield event.to_sse()
+    except Exception as e:
+        if on_error is None:
+            raise
+        print(f"Stream generation error: {e}")
+        yield error_event(f"{on_error}: {str(e)}").to_sse()
@@ -1,14 +1,90 @@
-"""MySQL 聊天持久化 — 用户可见消息与 checkpoint bootstrap。"""
+"""MySQL 聊天持久化 — 用户可见消息与 checkpoint bootstrap。
+
+职责总览：
+1) 消息构建与 bootstrap（`ChatPersistenceService`）
+2) 一轮对话落库 `save_turn()`，同一事务维护 `chat_sessions` 冗余统计
+   （`message_count` / `last_message_at` / `last_message_preview`）
+3) 增量落库（`CHAT_PERSIST_MODE=write_behind`）
+   - `begin_turn()`                 开始时写入用户消息与空的 assistant 占位消息
+   - `append_assistant_content()`   流式过程中按间隔追加正文（`CONCAT`，只传增量）
+   - `finish_turn()`                结束时追加剩余正文、写入 metadata 与会话预览；无正文时删除占位
+4) 历史会话统计回填 `backfill_session_stats()`（启动时执行，仅处理 NULL 行；无待回填会话时只做一次 LIMIT 1 探测）
+"""
 import json
-from typing import Dict, List, Optional
+import logging
+from typing import Dict, List, Optional, Tuple
 
 from langchain_core.messages import AIMessage, HumanMessage
+from sqlalchemy import bindparam, func, text
 
 from ..config import Config
 from ..db import get_session
-from ..db import ChatMessage
+from ..db import ChatMessage, ChatSession
 from .file_service import FileService
 
+logger = logging.getLogger(__name__)
+
+PREVIEW_MAX_CHARS = 120
+# 历史会话统计回填的每批会话数
+BACKFILL_BATCH_SIZE = 500
+
+
+def build_message_preview(content: str) -> str:
+    """会话列表预览：压缩空白后截断。"""
+    preview = " ".join((content or "").split())
+    if len(preview) > PREVIEW_MAX_CHARS:
+        preview = preview[:PREVIEW_MAX_CHARS] + "..."
+    return preview
+
+
+def backfill_session_stats() -> None:
+    """为 `message_count IS NULL` 的历史会话回填冗余统计（幂等）。
+
+    用法:
+    - 调用方: `create_app()` 初始化数据库之后
+    - 先用 `LIMIT 1` 探测是否有待回填会话，没有时不扫描 `chat_messages`；
+      有则每批 `BACKFILL_BATCH_SIZE` 个会话，只聚合这些会话的消息
+    - 预览仅对新消息维护，历史会话回填时留空
+    """
+    db = get_session()
+    try:
+        total = 0
+        while True:
+            session_ids = [
+                row[0]
+                for row in db.execute(
+                    text("SELECT id FROM chat_sessions WHERE message_count IS NULL LIMIT :limit"),
+                    {"limit": BACKFILL_BATCH_SIZE},
+                )
+            ]
+            if not session_ids:
+                break
+            result = db.execute(
+                text("""
+                    UPDATE chat_sessions s
+                    LEFT JOIN (
+                        SELECT session_id, COUNT(*) AS cnt, MAX(created_at) AS last_at
+                        FROM chat_messages
+                        WHERE session_id IN :ids
+                        GROUP BY session_id
+                    ) m ON m.session_id = s.id
+                    SET s.message_count = COALESCE(m.cnt, 0),
+                        s.last_message_at = m.last_at,
+                        s.updated_at = s.updated_at
+                    WHERE s.id IN :ids AND s.message_count IS NULL
+                """).bindparams(bindparam("ids", expanding=True)),
+                {"ids": session_ids},
+            )
+            db.commit()
+            total += result.rowcount
+        if total:
+            logger.info("已回填 %s 个会话的消息统计", total)
+    except Exception as e:
+        db.rollback()
+        logger.error("会话消息统计回填失败: %s", e, exc_info=True)
+    finally:
+        db.close()
+
 
 class ChatPersistenceService:
     """管理 MySQL 展示层消息；PG checkpointer 负责 Agent 运行时记忆。"""
@@ -20,6 +96,8 @@ class ChatPersistenceService:
         self.user_id = user_id
         self.config = Config()
         self.file_service = FileService()
+        # begin_turn() 写入的本轮消息，bootstrap 时排除（本轮输入由 Agent 自行追加）
+        self._turn_message_ids: List[int] = []
 
     def build_user_message(self, user_message: str, file_ids: List[int] = None, llm_provider: str = None) -> HumanMessage:
         """构建带文件上下文的用户消息。"""
@@ -86,23 +164,28 @@ class ChatPersistenceService:
         return self.file_service.extractor.is_image(file_info.get("file_extension", ""))
 
     def get_bootstrap_messages(self) -> List:
-        """从 MySQL 加载最近消息，用于首次写入 PG checkpoint。"""
+        """从 MySQL 加载最近 `BOOTSTRAP_MAX_MESSAGES` 条消息，用于首次写入 PG checkpoint。
+
+        倒序 LIMIT 走 `idx_chat_messages_session_created`，再翻转为时间正序。
+        """
         db = get_session()
         try:
+            query = db.query(ChatMessage).filter(ChatMessage.session_id == self.session_id)
+            if self._turn_message_ids:
+                query = query.filter(ChatMessage.id.notin_(self._turn_message_ids))
             rows = (
-                db.query(ChatMessage)
-                .filter(ChatMessage.session_id == self.session_id)
-                .order_by(ChatMessage.created_at.asc())
+                query
+                .order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc())
+                .limit(self.BOOTSTRAP_MAX_MESSAGES)
                 .all()
             )
-            if len(rows) > self.BOOTSTRAP_MAX_MESSAGES:
-                rows = rows[-self.BOOTSTRAP_MAX_MESSAGES :]
 
             messages = []
-            for row in rows:
+            for row in reversed(rows):
                 if row.role == "user":
                     messages.append(HumanMessage(content=row.content))
-                elif row.role == "assistant":
+                elif row.role == "assistant" and row.content:
+                    # 跳过进程中断遗留的空 assistant 占位
                     messages.append(AIMessage(content=row.content))
             return messages
         finally:
@@ -115,7 +198,7 @@ class ChatPersistenceService:
         user_file_ids: List[int] = None,
         metadata: Optional[Dict] = None,
     ) -> None:
-        """保存一轮 user/assistant 到 MySQL。"""
+        """保存一轮 user/assistant 到 MySQL，并在同一事务内更新会话冗余统计。"""
         db = get_session()
         try:
             user_msg = ChatMessage(
@@ -133,9 +216,117 @@ class ChatPersistenceService:
                 metadata_json=json.dumps(metadata, ensure_ascii=False) if metadata else None,
             )
             db.add(assistant_msg)
+
+            db.query(ChatSession).filter(ChatSession.id == self.session_id).update(
+                {
+                    ChatSession.message_count: func.coalesce(ChatSession.message_count, 0) + 2,
+                    ChatSession.last_message_at: func.now(),
+                    ChatSession.last_message_preview: build_message_preview(assistant_output or user_input),
+                },
+                synchronize_session=False,
+            )
             db.commit()
         except Exception as e:
             print(f"Save turn error: {e}")
             db.rollback()
         finally:
             db.close()
+
+    def begin_turn(
+        self,
+        user_input: str,
+        user_file_ids: List[int] = None,
+    ) -> Tuple[Optional[int], Optional[int]]:
+        """写入用户消息与空的 assistant 占位消息，返回 `(user_message_id, assistant_message_id)`。
+
+        用法:
+        - 调用方: `ChatService._prepare_turn()`（write_behind 模式）
+        - 失败时返回 `(None, None)`，调用方回退为结束时 `save_turn()`
+        """
+        db = get_session()
+        try:
+            user_msg = ChatMessage(
+                session_id=self.session_id,
+                role="user",
+                content=user_input,
+                file_ids=json.dumps(user_file_ids) if user_file_ids else None,
+            )
+            assistant_msg = ChatMessage(session_id=self.session_id, role="assistant", content="")
+            db.add_all([user_msg, assistant_msg])
+            db.flush()
+            message_ids = (user_msg.id, assistant_msg.id)
+            self._turn_message_ids = list(message_ids)
+
+            db.query(ChatSession).filter(ChatSession.id == self.session_id).update(
+                {
+                    ChatSession.message_count: func.coalesce(ChatSession.message_count, 0) + 2,
+                    ChatSession.last_message_at: func.now(),
+                    ChatSession.last_message_preview: build_message_preview(user_input),
+                },
+                synchronize_session=False,
+            )
+            db.commit()
+            return message_ids
+        except Exception as e:
+            print(f"Begin turn error: {e}")
+            db.rollback()
+            self._turn_message_ids = []
+            return None, None
+        finally:
+            db.close()
+
+    def append_assistant_content(self, message_id: int, delta: str) -> bool:
+        """把流式增量追加到 assistant 消息（单条 UPDATE），成功返回 True。"""
+        db = get_session()
+        try:
+            db.query(ChatMessage).filter(ChatMessage.id == message_id).update(
+                {ChatMessage.content: func.concat(ChatMessage.content, delta)},
+                synchronize_session=False,
+            )
+            db.commit()
+            return True
+        except Exception as e:
+            print(f"Append assistant content error: {e}")
+            db.rollback()
+            return False
+        finally:
+            db.close()
+
+    def finish_turn(
+        self,
+        message_id: int,
+        delta: str,
+        assistant_output: str,
+        metadata: Optional[Dict] = None,
+    ) -> None:
+        """追加剩余正文并写入 metadata / 会话预览（同一事务）；整轮无正文时删除占位消息。"""
+        db = get_session()
+        try:
+            message_query = db.query(ChatMessage).filter(ChatMessage.id == message_id)
+            session_query = db.query(ChatSession).filter(ChatSession.id == self.session_id)
+            if not assistant_output:
+                message_query.delete(synchronize_session=False)
+                session_query.update(
+                    {ChatSession.message_count: func.greatest(func.coalesce(ChatSession.message_count, 1) - 1, 0)},
+                    synchronize_session=False,
+                )
+            else:
+                values = {
+                    ChatMessage.metadata_json: json.dumps(metadata, ensure_ascii=False) if metadata else None,
+                }
+                if delta:
+                    values[ChatMessage.content] = func.concat(ChatMessage.content, delta)
+                message_query.update(values, synchronize_session=False)
+                session_query.update(
+                    {
+                        ChatSession.last_message_at: func.now(),
+                        ChatSession.last_message_preview: build_message_preview(assistant_output),
+                    },
+                    synchronize_session=False,
+                )
+            db.commit()
+        except Exception as e:
+            print(f"Finish turn error: {e}")
+            db.rollback()
+        finally:
+            db.close()
@@ -0,0 +1,554 @@
+"""聊天运行管理 — Agent 运行与 HTTP 连接解耦：队列调度、事件广播、断线续传、取消。
+
+职责总览：
+1) 事件通道（`ChatRunBuffer`）
+   - Redis Stream `chat:run:<run_id>:events`，条目 ID 为 `<seq>-0`，`MAXLEN ~ CHAT_REPLAY_MAXLEN`；
+     任意数量的订阅方各自 XREAD，天然支持多端同时观看与断线续传
+   - 运行元数据 `chat:run:<run_id>:meta`（hash：user_id / status / session_id / worker）
+   - 运行结束后保留 `CHAT_REPLAY_TTL` 秒；Redis 不可用时退化为进程内缓冲与队列（仅本 worker 可见）
+2) 调度（`RunManager`）
+   - `submit()`  运行参数序列化后入队 `chat:runs:queue`，请求本身不执行 Agent
+   - 每个 worker 一个调度线程，在空闲槽位（`CHAT_RUN_MAX_CONCURRENCY`）内 BRPOP 取任务执行，
+     运行在各 worker 间按空闲程度自然分摊，与 SSE 连接落在哪个 worker 无关
+   - 调度线程在本 worker 首次 `submit()` 时启动：只有处理 `POST /api/chat` 的 WSGI worker 消费队列，
+     复用同一应用工厂的 ASGI 进程（`backend/asgi.py`）不会领取运行
+   - `cancel()`  设置取消标记；执行方的监视线程轮询取消标记与观看心跳，
+     命中后设置运行的 `cancel_event`，由 Agent 在下一个 token / 工具边界停止
+   - 无人观看超过 `CHAT_RUN_ORPHAN_GRACE` 秒（标签页关闭且未重连）视为断开，自动取消
+   - 执行方的监视线程每 `EXEC_HEARTBEAT_INTERVAL` 秒刷新 `exec_seen`；worker 被杀 / 重启导致心跳超过
+     `EXEC_STALE_SECONDS` 秒未更新时，订阅方或运行列表把运行收尾为 failed（错误事件 + 结束标记）
+3) 订阅
+   - `stream_run_frames()`  从指定序号之后读取事件，输出带 `id: <run_id>:<seq>` 的 SSE 帧，
+     并定期刷新运行的观看心跳 `viewer_seen`；可选按 `SSE_COALESCE_WINDOW_MS` 合并连续的 content 帧
+   - `parse_event_id()`     解析 `Last-Event-ID`
+
+调用方：
+- `POST /api/chat`（提交运行并订阅；带 `Last-Event-ID` 时续传原运行）
+- `GET /api/chat/runs`、`GET /api/chat/runs/<run_id>/events`、`POST /api/chat/<run_id>/cancel`
+"""
+import json
+import os
+import queue
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .chat_events import CONTENT, DONE, SESSION_ID, ChatEvent, ContentCoalescer, error_event
+
+# 读取方阻塞等待的单次时长（毫秒）；须小于 Redis 客户端 socket_timeout
+READ_BLOCK_MS = 1000
+# 长时间无事件（如工具调用）时发送 SSE 注释保活，避免代理断开空闲连接
+KEEPALIVE_SECONDS = 15
+# 执行方检查取消标记与观看心跳的间隔（秒）
+CANCEL_CHECK_INTERVAL = 0.5
+# 订阅方刷新观看心跳的间隔（秒）
+VIEWER_TOUCH_INTERVAL = 5
+# 执行方刷新执行心跳的间隔（秒）；超过 EXEC_STALE_SECONDS 未刷新视为执行方已退出
+EXEC_HEARTBEAT_INTERVAL = 5
+EXEC_STALE_SECONDS = 30
+
+RUN_EVENT = "run"
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_CANCELLED = "cancelled"
+STATUS_FAILED = "failed"
+ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+
+
+class _LocalRun:
+    def __init__(self, meta: Dict, maxlen: int):
+        self.meta = meta
+        self.entries: deque = deque(maxlen=maxlen)
+        self.finished = False
+        self.cancelled = False
+        self.expires_at: Optional[float] = None
+        self.cond = threading.Condition()
+
+
+class ChatRunBuffer:
+    """运行事件通道与元数据（Redis Stream + hash，或进程内环形缓冲）。"""
+
+    key_prefix = "chat:run:"
+    user_runs_prefix = "chat:runs:user:"
+
+    def __init__(self, redis_client=None, maxlen: int = 5000, ttl: int = 600):
+        self.redis_client = redis_client
+        self.maxlen = maxlen
+        self.ttl = ttl
+        self._local: Dict[str, _LocalRun] = {}
+        self._lock = threading.Lock()
+
+    def _events_key(self, run_id: str) -> str:
+        return f"{self.key_prefix}{run_id}:events"
+
+    def _meta_key(self, run_id: str) -> str:
+        return f"{self.key_prefix}{run_id}:meta"
+
+    def _cancel_key(self, run_id: str) -> str:
+        return f"{self.key_prefix}{run_id}:cancel"
+
+    def create(self, run_id: str, user_id: int, session_id: Optional[int] = None) -> None:
+        meta = {
+            "run_id": run_id,
+            "user_id": user_id,
+            "session_id": session_id or "",
+            "status": STATUS_QUEUED,
+            "created_at": int(time.time()),
+            # 提交即视为有人观看，避免首个订阅连接建立前被判定为无人观看
+            "viewer_seen": int(time.time()),
+        }
+        if self.redis_client:
+            # 运行中也设置过期时间兜底，防止 worker 崩溃后 key 永久残留
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.hset(self._meta_key(run_id), mapping=meta)
+            pipe.expire(self._meta_key(run_id), self.ttl * 6)
+            pipe.sadd(f"{self.user_runs_prefix}{user_id}", run_id)
+            pipe.expire(f"{self.user_runs_prefix}{user_id}", self.ttl * 6)
+            pipe.execute()
+            return
+        now = time.monotonic()
+        with self._lock:
+            expired = [rid for rid, run in self._local.items() if run.expires_at and run.expires_at < now]
+            for rid in expired:
+                self._local.pop(rid, None)
+            self._local[run_id] = _LocalRun(meta, self.maxlen)
+
+    def get_meta(self, run_id: str) -> Optional[Dict]:
+        if self.redis_client:
+            meta = self.redis_client.hgetall(self._meta_key(run_id))
+            if not meta or "user_id" not in meta:
+                return None
+            meta["user_id"] = int(meta["user_id"])
+            meta["session_id"] = int(meta["session_id"]) if meta.get("session_id") else None
+            return meta
+        run = self._local.get(run_id)
+        if run is None:
+            return None
+        return {**run.meta, "session_id": run.meta.get("session_id") or None}
+
+    def update_meta(self, run_id: str, **fields) -> None:
+        if self.redis_client:
+            self.redis_client.hset(self._meta_key(run_id), mapping=fields)
+            return
+        run = self._local.get(run_id)
+        if run is not None:
+            run.meta.update(fields)
+
+    def owner(self, run_id: str) -> Optional[int]:
+        meta = self.get_meta(run_id)
+        return meta["user_id"] if meta else None
+
+    def active_runs(self, user_id: int) -> List[Dict]:
+        """用户进行中（排队 / 运行）的运行列表。"""
+        if self.redis_client:
+            run_ids = self.redis_client.smembers(f"{self.user_runs_prefix}{user_id}")
+        else:
+            run_ids = [rid for rid, run in list(self._local.items()) if run.meta["user_id"] == user_id]
+        runs = []
+        for run_id in run_ids:
+            meta = self.get_meta(run_id)
+            if meta and meta["status"] in ACTIVE_STATUSES and not self.reap_if_stale(run_id, meta):
+                runs.append(meta)
+            elif self.redis_client:
+                self.redis_client.srem(f"{self.user_runs_prefix}{user_id}", run_id)
+        return sorted(runs, key=lambda m: int(m["created_at"]))
+
+    def request_cancel(self, run_id: str) -> None:
+        if self.redis_client:
+            self.redis_client.set(self._cancel_key(run_id), 1, ex=self.ttl * 6)
+            return
+        run = self._local.get(run_id)
+        if run is not None:
+            run.cancelled = True
+
+    def touch_viewer(self, run_id: str) -> None:
+        # 运行已过期时不能 HSET，否则会重建一个没有 TTL 的残缺 meta
+        if self.redis_client and not self.redis_client.exists(self._meta_key(run_id)):
+            return
+        self.update_meta(run_id, viewer_seen=int(time.time()))
+
+    def stop_reason(self, run_id: str, orphan_grace: int = 0) -> Optional[str]:
+        """运行应停止的原因：`cancelled`（显式取消）、`orphaned`（无人观看超时）或 None。"""
+        if self.redis_client:
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.exists(self._cancel_key(run_id))
+            pipe.hget(self._meta_key(run_id), "viewer_seen")
+            cancelled, viewer_seen = pipe.execute()
+        else:
+            run = self._local.get(run_id)
+            cancelled = bool(run and run.cancelled)
+            viewer_seen = run.meta.get("viewer_seen") if run else None
+        if cancelled:
+            return STATUS_CANCELLED
+        if orphan_grace > 0 and viewer_seen and time.time() - int(viewer_seen) > orphan_grace:
+            return "orphaned"
+        return None
+
+    def touch_executor(self, run_id: str) -> None:
+        if self.redis_client and not self.redis_client.exists(self._meta_key(run_id)):
+            return
+        self.update_meta(run_id, exec_seen=int(time.time()))
+
+    def reap_if_stale(self, run_id: str, meta: Optional[Dict] = None) -> bool:
+        """执行心跳超时的运行收尾为 failed：追加错误事件与结束标记。返回运行是否已被判定为失效。"""
+        meta = meta or self.get_meta(run_id)
+        if not meta or meta.get("status") != STATUS_RUNNING:
+            return False
+        exec_seen = meta.get("exec_seen")
+        if not exec_seen or time.time() - int(exec_seen) <= EXEC_STALE_SECONDS:
+            return False
+        # 多个订阅方可能同时发现：只由第一个写入收尾事件
+        if self.redis_client and not self.redis_client.hsetnx(self._meta_key(run_id), "reaped", 1):
+            return True
+        seq = self._last_seq(run_id) + 1
+        print(f"Chat run {run_id} executor heartbeat lost (worker {meta.get('worker')}), marking failed")
+        self.append(run_id, seq, error_event("执行该运行的服务进程已退出，回答未完成，请重新发送"))
+        self.append(run_id, seq + 1, None, status=STATUS_FAILED)
+        return True
+
+    def _last_seq(self, run_id: str) -> int:
+        if self.redis_client:
+            entries = self.redis_client.xrevrange(self._events_key(run_id), count=1)
+            return int(entries[0][0].split("-", 1)[0]) if entries else 0
+        run = self._local.get(run_id)
+        if run is None or not run.entries:
+            return 0
+        return run.entries[-1][0]
+
+    def is_cancelled(self, run_id: str) -> bool:
+        if self.redis_client:
+            return bool(self.redis_client.exists(self._cancel_key(run_id)))
+        run = self._local.get(run_id)
+        return bool(run and run.cancelled)
+
+    def append(self, run_id: str, seq: int, event: Optional[ChatEvent], status: Optional[str] = None) -> None:
+        """写入第 `seq` 条事件；`event` 为 None 表示运行结束（`status` 为最终状态）。"""
+        if self.redis_client:
+            fields = {"e": event.to_json()} if event is not None else {"end": "1"}
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.xadd(self._events_key(run_id), fields, id=f"{seq}-0", maxlen=self.maxlen, approximate=True)
+            if event is None:
+                pipe.hset(self._meta_key(run_id), "status", status or STATUS_DONE)
+                for key in (self._events_key(run_id), self._meta_key(run_id), self._cancel_key(run_id)):
+                    pipe.expire(key, self.ttl)
+            pipe.execute()
+            return
+        run = self._local.get(run_id)
+        if run is None:
+            return
+        with run.cond:
+            run.entries.append((seq, event))
+            if event is None:
+                run.finished = True
+                run.meta["status"] = status or STATUS_DONE
+                run.expires_at = time.monotonic() + self.ttl
+            run.cond.notify_all()
+
+    def read(self, run_id: str, after: int, block_ms: int = READ_BLOCK_MS) -> List[Tuple[int, Optional[ChatEvent]]]:
+        """读取 `after` 之后的事件；无新事件时最多阻塞 `block_ms` 毫秒。"""
+        if self.redis_client:
+            reply = self.redis_client.xread({self._events_key(run_id): f"{after}-0"}, block=block_ms, count=500)
+            entries = []
+            for _key, items in reply or []:
+                for entry_id, fields in items:
+                    seq = int(entry_id.split("-", 1)[0])
+                    event = ChatEvent.from_dict(json.loads(fields["e"])) if "e" in fields else None
+                    entries.append((seq, event))
+            return entries
+
+        run = self._local.get(run_id)
+        if run is None:
+            return [(after + 1, None)]
+        with run.cond:
+            pending = [entry for entry in run.entries if entry[0] > after]
+            if not pending and not run.finished:
+                run.cond.wait(block_ms / 1000.0)
+                pending = [entry for entry in run.entries if entry[0] > after]
+        return pending
+
+
+class RunManager:
+    """进程级运行调度：入队、按空闲槽位执行、取消。"""
+
+    queue_key = "chat:runs:queue"
+
+    def __init__(self, app, config):
+        self.app = app
+        self.config = config
+        self.redis_client = config.REDIS_CLIENT
+        self.buffer = ChatRunBuffer(
+            redis_client=config.REDIS_CLIENT,
+            maxlen=config.CHAT_REPLAY_MAXLEN,
+            ttl=config.CHAT_REPLAY_TTL,
+        )
+        self.max_concurrency = config.CHAT_RUN_MAX_CONCURRENCY
+        self.queue_max = config.CHAT_RUN_QUEUE_MAX
+        self.orphan_grace = config.CHAT_RUN_ORPHAN_GRACE
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._local_queue: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._dispatcher = None
+        self._pid = None
+
+    @property
+    def worker_name(self) -> str:
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def submit(self, user_id: int, request: Dict) -> Optional[str]:
+        """提交一次运行，返回 `run_id`；队列已满时返回 None。
+
+        用法:
+        - 参数: `request` — `process_chat_stream_with_session()` 的关键字参数
+          （session_id / message / file_ids / llm_provider / knowledge_base_ids），须可 JSON 序列化
+        """
+        self.ensure_started()
+        if self._queue_length() >= self.queue_max:
+            return None
+
+        run_id = uuid.uuid4().hex
+        self.buffer.create(run_id, user_id, request.get("session_id"))
+        # 第 1 条事件告知前端 run_id（用于取消与多端观看），执行方从第 2 条开始写
+        self.buffer.append(run_id, 1, ChatEvent(RUN_EVENT, {"run_id": run_id, "status": STATUS_QUEUED}))
+        task = json.dumps({"run_id": run_id, "user_id": user_id, "request": request}, ensure_ascii=False)
+        if self.redis_client:
+            self.redis_client.lpush(self.queue_key, task)
+        else:
+            self._local_queue.put(task)
+        return run_id
+
+    def cancel(self, run_id: str) -> None:
+        """请求取消；排队中的运行不会再执行，运行中的在下一个 token / 工具边界停止。"""
+        self.buffer.request_cancel(run_id)
+
+    def ensure_started(self) -> None:
+        # fork 之后线程不会被继承：按 pid 判断当前 worker 是否已启动调度线程
+        if self._pid == os.getpid() and self._dispatcher and self._dispatcher.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._dispatcher and self._dispatcher.is_alive():
+                return
+            self._pid = os.getpid()
+            self._slots = threading.BoundedSemaphore(self.max_concurrency)
+            self._dispatcher = threading.Thread(target=self._dispatch_loop, name="chat-run-dispatcher", daemon=True)
+            self._dispatcher.start()
+
+    def _queue_length(self) -> int:
+        if self.redis_client:
+            return self.redis_client.llen(self.queue_key)
+        return self._local_queue.qsize()
+
+    def _next_task(self, timeout: int = 1) -> Optional[str]:
+        if self.redis_client:
+            item = self.redis_client.brpop(self.queue_key, timeout=timeout)
+            return item[1] if item else None
+        try:
+            return self._local_queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _dispatch_loop(self) -> None:
+        while True:
+            self._slots.acquire()
+            try:
+                task = self._next_task()
+            except Exception as e:
+                print(f"Chat run dispatch error: {e}")
+                task = None
+                time.sleep(1)
+            if task is None:
+                self._slots.release()
+                continue
+            threading.Thread(target=self._execute, args=(json.loads(task),), daemon=True).start()
+
+    def _execute(self, task: Dict) -> None:
+        run_id = task["run_id"]
+        seq = 1
+        status = STATUS_DONE
+        try:
+            if self.buffer.is_cancelled(run_id):
+                status = STATUS_CANCELLED
+                seq += 1
+                self.buffer.append(run_id, seq, ChatEvent(DONE, {"tool_calls": [], "cancelled": True}))
+                return
+
+            self.buffer.update_meta(
+                run_id, status=STATUS_RUNNING, worker=self.worker_name, exec_seen=int(time.time())
+            )
+            with self.app.app_context():
+                for event in self._run_events(task):
+                    seq += 1
+                    self.buffer.append(run_id, seq, event)
+                    if event.type == SESSION_ID:
+                        self.buffer.update_meta(run_id, session_id=event.data["session_id"])
+                    if event.type == DONE and event.data.get("cancelled"):
+                        status = STATUS_CANCELLED
+        except Exception as e:
+            print(f"Chat run error: {e}")
+            status = STATUS_FAILED
+            seq += 1
+            try:
+                self.buffer.append(run_id, seq, error_event(f"流式响应错误: {str(e)}"))
+            except Exception as append_error:
+                print(f"Chat run error event failed: {append_error}")
+        finally:
+            try:
+                self.buffer.append(run_id, seq + 1, None, status=status)
+            except Exception as e:
+                print(f"Chat run finish error: {e}")
+            self._slots.release()
+
+    def _run_events(self, task: Dict) -> Iterator[ChatEvent]:
+        """执行 Agent 并产出事件；监视线程在取消或无人观看时设置 `cancel_event`。"""
+        from .agent_service import get_agent_service
+        from .chat_service import ChatService
+        from .llm_service import get_llm_service
+
+        chat_service = ChatService(
+            agent_service=get_agent_service(),
+            llm_service=get_llm_service(),
+            config=self.config,
+        )
+        cancel_event = threading.Event()
+        finished = threading.Event()
+        events = chat_service.process_chat_stream_with_session(
+            task["user_id"], cancel_event=cancel_event, **task["request"]
+        )
+
+        threading.Thread(
+            target=self._watch_run,
+            args=(task["run_id"], cancel_event, finished),
+            name="chat-run-watch",
+            daemon=True,
+        ).start()
+        try:
+            yield from events
+        finally:
+            finished.set()
+            events.close()
+
+    def _watch_run(self, run_id: str, cancel_event: threading.Event, finished: threading.Event) -> None:
+        """轮询取消标记与观看心跳，并刷新执行心跳直到运行结束（取消后 Agent 收尾期间仍需刷新）。"""
+        heartbeat_at = time.monotonic()
+        while not finished.wait(CANCEL_CHECK_INTERVAL):
+            try:
+                if time.monotonic() - heartbeat_at >= EXEC_HEARTBEAT_INTERVAL:
+                    self.buffer.touch_executor(run_id)
+                    heartbeat_at = time.monotonic()
+                if cancel_event.is_set():
+                    continue
+                reason = self.buffer.stop_reason(run_id, self.orphan_grace)
+            except Exception as e:
+                print(f"Chat run watch error: {e}")
+                continue
+            if reason:
+                self.buffer.update_meta(run_id, cancel_reason=reason)
+                cancel_event.set()
+
+
+def parse_event_id(event_id: Optional[str]) -> Optional[Tuple[str, int]]:
+    """解析 `<run_id>:<seq>` 格式的 SSE 事件 ID。"""
+    if not event_id or ":" not in event_id:
+        return None
+    run_id, _, seq = event_id.strip().rpartition(":")
+    if not run_id or not seq.isdigit():
+        return None
+    return run_id, int(seq)
+
+
+def stream_run_frames(
+        buffer: ChatRunBuffer,
+        run_id: str,
+        after: int = 0,
+        coalesce_window_ms: int = 0,
+        coalesce_max_bytes: int = 1024,
+) -> Iterator[str]:
+    """订阅运行事件，输出带事件 ID 的 SSE 帧，直到运行结束。
+
+    用法:
+    - `coalesce_window_ms > 0` 时合并窗口内连续的 content 事件为一帧；截止时间在阻塞读取的
+      超时唤醒上检查，模型停顿时已缓冲的正文按时刷出。合并帧的 ID 取其最后一条事件的序号，
+      续传时不会重复或遗漏正文
+    """
+    coalescer = ContentCoalescer(coalesce_window_ms, coalesce_max_bytes) if coalesce_window_ms > 0 else None
+    content_seq = after
+    last_seq = after
+    idle_since = time.monotonic()
+    touched_at = 0.0
+    while True:
+        # 客户端断开后生成器被关闭，心跳随之停止，执行方据此判断无人观看
+        if time.monotonic() - touched_at >= VIEWER_TOUCH_INTERVAL:
+            buffer.touch_viewer(run_id)
+            touched_at = time.monotonic()
+        block_ms = READ_BLOCK_MS
+        if coalescer is not None:
+            timeout = coalescer.timeout()
+            if timeout == 0:
+                for merged in coalescer.flush():
+                    yield merged.to_sse(f"{run_id}:{content_seq}")
+                idle_since = time.monotonic()
+                continue
+            if timeout is not None:
+                # block=0 在 Redis 中表示无限阻塞，至少等待 1 毫秒
+                block_ms = min(READ_BLOCK_MS, max(1, int(timeout * 1000)))
+        entries = buffer.read(run_id, last_seq, block_ms)
+        if not entries:
+            if time.monotonic() - idle_since >= KEEPALIVE_SECONDS:
+                meta = buffer.get_meta(run_id)
+                if meta is None:
+                    yield error_event("流式运行已结束或已过期").to_sse()
+                    return
+                idle_since = time.monotonic()
+                if buffer.reap_if_stale(run_id, meta):
+                    # 执行方已退出：收尾事件已写入通道，下一轮读取后结束
+                    continue
+                yield ": keep-alive\n\n"
+            continue
+        idle_since = time.monotonic()
+        if entries[0][0] > last_seq + 1:
+            # 续传起点已被 MAXLEN 裁剪，提示前端重新加载会话
+            yield error_event("部分流式内容已过期，请刷新会话查看完整回答").to_sse()
+        for seq, event in entries:
+            if event is None:
+                if coalescer is not None:
+                    for merged in coalescer.flush():
+                        yield merged.to_sse(f"{run_id}:{content_seq}")
+                return
+            last_seq = seq
+            if coalescer is None:
+                yield event.to_sse(f"{run_id}:{seq}")
+                continue
+            if event.type == CONTENT:
+                content_seq = seq
+                for merged in coalescer.push(event):
+                    yield merged.to_sse(f"{run_id}:{content_seq}")
+                continue
+            # 先刷出缓冲正文再透传，保证 tool_start / tool_status 等事件的顺序
+            for merged in coalescer.flush():
+                yield merged.to_sse(f"{run_id}:{content_seq}")
+            yield event.to_sse(f"{run_id}:{seq}")
+
+
+RUN_MANAGER_KEY = "run_manager"
+
+
+def register_run_manager(app, config) -> RunManager:
+    """在应用工厂中注册进程级 RunManager；调度线程在首次 `submit()` 时启动。"""
+    manager = RunManager(app, config)
+    app.extensions[RUN_MANAGER_KEY] = manager
+    return manager
+
+
+def get_run_manager() -> RunManager:
+    from flask import current_app
+
+    try:
+        return current_app.extensions[RUN_MANAGER_KEY]
+    except RuntimeError as exc:
+        raise RuntimeError("必须在 Flask 应用上下文中访问 RunManager") from exc
+    except KeyError as exc:
+        raise RuntimeError("RunManager 未初始化，请在 create_app 中调用 register_run_manager") from exc
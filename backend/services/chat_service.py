@@ -1,15 +1,74 @@
-"""聊天 Service — 会话管理与 SSE 流式响应（统一 create_agent 模式）。"""
+"""聊天 Service — 会话管理与 SSE 流式响应（统一 create_agent 模式）。
+
+消息落库由 `CHAT_PERSIST_MODE` 控制：
+- `write_behind`（默认）开始时写入用户消息与 assistant 占位，流式过程中每
+  `CHAT_PERSIST_INTERVAL` 秒追加一次正文，进程崩溃时最多丢失一个间隔的内容
+- `turn`  Agent 结束后一次性 `save_turn()`
+首轮标题由会话的 `message_count` 判断，不再额外 COUNT。
+
+启用 `RESPONSE_CACHE_ENABLED` 时，新会话首轮提问先查语义回答缓存（见 `response_cache`），
+命中则回放缓存回答、不调用 Agent；未命中且回答正常结束、未调用工具时写入缓存。
+缓存默认按用户隔离，`RESPONSE_CACHE_SCOPE=global` 时跨用户共享。
+"""
+import asyncio
+import base64
 import json
+import threading
+import time
 import traceback
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional
 
-from sqlalchemy import func
+from sqlalchemy import and_, or_
 
 from ..config import Config
 from ..db import get_session
-from ..db import ChatMessage, ChatSession, TokenUsage
+from ..db import ChatMessage, ChatSession, UploadedFile
+from .chat_events import (
+    CONTENT,
+    DONE,
+    USAGE,
+    error_event,
+    session_id_event,
+    session_title_event,
+)
 from .chat_persistence import ChatPersistenceService
 from .checkpointer_service import delete_thread
-from .file_service import FileService
+from .response_cache import get_response_cache, replay_events
+from .usage_writer import get_token_usage_writer
+
+
+def encode_cursor(*values) -> str:
+    """把排序键编码为不透明的 keyset 游标（datetime 以 ISO 字符串保存）。"""
+    payload = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, *types):
+    """按 `types` 逐项还原 `encode_cursor()` 的游标；无效时返回 None（从第一页开始）。"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if len(values) != len(types):
+            return None
+        return tuple(
+            datetime.fromisoformat(v) if t is datetime else t(v)
+            for t, v in zip(types, values)
+        )
+    except (ValueError, TypeError):
+        return None
+
+
+def _parse_file_ids(raw):
+    if not raw:
+        return []
+    try:
+        return [int(fid) for fid in json.loads(raw) or []]
+    except (json.JSONDecodeError, TypeError, ValueError):
+        return []
 
 
 class ChatService:
@@ -20,23 +79,9 @@ class ChatService:
         self.llm_service = llm_service
         self.agent_service = agent_service
 
-    def save_token_usage(self, user_id: object, usage_data: object, model_name: object) -> object:
-        db = get_session()
-        try:
-            token_usage = TokenUsage(
-                user_id=user_id,
-                prompt_tokens=usage_data.get('prompt_tokens', 0),
-                completion_tokens=usage_data.get('completion_tokens', 0),
-                total_tokens=usage_data.get('total_tokens', 0),
-                model=model_name
-            )
-            db.add(token_usage)
-            db.commit()
-        except Exception as e:
-            print(f"Save token usage error: {e}")
-            db.rollback()
-        finally:
-            db.close()
+    def save_token_usage(self, user_id: object, usage_data: object, model_name: object, session_id=None) -> object:
+        """缓冲写入本轮用量（含提示缓存命中数），由 `TokenUsageWriter` 后台批量落库。"""
+        get_token_usage_writer(self.config).record(user_id, usage_data, model_name, session_id=session_id)
 
     def create_session(self, user_id, title=None, llm_provider=None):
         db = get_session()
@@ -58,101 +103,169 @@ class ChatService:
         finally:
             db.close()
 
-    def get_sessions(self, user_id, limit=200):
+    def get_sessions(self, user_id, limit=200, cursor=None):
+        """侧边栏会话列表：单条索引范围查询，按 置顶 → 更新时间 → id 倒序 keyset 分页。
+
+        用法:
+        - 参数: `limit` 每页条数；`cursor` 上一页返回的 `next_cursor`
+        - 返回值: `(sessions, next_cursor)`，没有更多时 `next_cursor` 为 None
+        """
         db = get_session()
         try:
-            try:
-                sessions = db.query(ChatSession).filter(
-                    ChatSession.user_id == user_id
-                ).order_by(
-                    ChatSession.is_pinned.desc(),
-                    ChatSession.updated_at.desc(),
-                ).limit(limit).all()
-            except Exception as order_error:
-                print(f"Get sessions fallback order: {order_error}")
-                db.rollback()
-                sessions = db.query(ChatSession).filter(
-                    ChatSession.user_id == user_id
-                ).order_by(
-                    ChatSession.updated_at.desc()
-                ).limit(limit).all()
-
-            session_ids = [s.id for s in sessions]
-            message_count_map = {}
-            if session_ids:
-                message_counts = db.query(
-                    ChatMessage.session_id,
-                    func.count(ChatMessage.id)
-                ).filter(
-                    ChatMessage.session_id.in_(session_ids)
-                ).group_by(
-                    ChatMessage.session_id
-                ).all()
-                message_count_map = {sid: count for sid, count in message_counts}
+            query = db.query(
+                ChatSession.id,
+                ChatSession.title,
+                ChatSession.is_pinned,
+                ChatSession.created_at,
+                ChatSession.updated_at,
+                ChatSession.message_count,
+                ChatSession.last_message_at,
+                ChatSession.last_message_preview,
+            ).filter(ChatSession.user_id == user_id)
+
+            position = decode_cursor(cursor, bool, datetime, int)
+            if position:
+                pinned, updated_at, last_id = position
+                query = query.filter(
+                    or_(
+                        ChatSession.is_pinned < pinned,
+                        and_(ChatSession.is_pinned == pinned, ChatSession.updated_at < updated_at),
+                        and_(
+                            ChatSession.is_pinned == pinned,
+                            ChatSession.updated_at == updated_at,
+                            ChatSession.id < last_id,
+                        ),
+                    )
+                )
+
+            rows = query.order_by(
+                ChatSession.is_pinned.desc(),
+                ChatSession.updated_at.desc(),
+                ChatSession.id.desc(),
+            ).limit(limit + 1).all()
+
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+            next_cursor = None
+            if has_more and rows:
+                last = rows[-1]
+                next_cursor = encode_cursor(int(bool(last.is_pinned)), last.updated_at, last.id)
 
             return [{
                 'id': s.id,
                 'title': s.title,
                 'created_at': s.created_at.isoformat() if s.created_at else None,
                 'updated_at': s.updated_at.isoformat() if s.updated_at else None,
-                'message_count': message_count_map.get(s.id, 0),
-                'is_pinned': bool(getattr(s, 'is_pinned', False)),
-            } for s in sessions]
+                'message_count': s.message_count or 0,
+                'last_message_at': s.last_message_at.isoformat() if s.last_message_at else None,
+                'last_message_preview': s.last_message_preview or '',
+                'is_pinned': bool(s.is_pinned),
+            } for s in rows], next_cursor
         except Exception as e:
             print(f"Get sessions error: {e}")
-            return []
+            return [], None
         finally:
             db.close()
 
-    def get_session_messages(self, session_id, user_id, include_files=False):
+    def get_session_messages(self, session_id, user_id, include_files=False, limit=None, before=None):
+        """会话消息历史，支持从最新一页往前翻的游标分页。
+
+        用法:
+        - 参数:
+            - limit: 每页条数；为空时返回全部消息
+            - before: 上一页返回的 `next_cursor`，取更早的消息
+        - 返回值: `(messages, next_cursor)`，页内按时间正序；会话不存在时返回 None
+        - 附件信息每页一次 `IN` 查询批量获取
+        """
         db = get_session()
         try:
-            session = db.query(ChatSession).filter(
+            session = db.query(ChatSession.id).filter(
                 ChatSession.id == session_id,
                 ChatSession.user_id == user_id
             ).first()
             if not session:
                 return None
 
-            messages = db.query(ChatMessage).filter(
-                ChatMessage.session_id == session_id
-            ).order_by(ChatMessage.created_at.asc()).all()
+            query = db.query(ChatMessage).filter(ChatMessage.session_id == session_id)
+            position = decode_cursor(before, datetime, int)
+            if position:
+                created_at, message_id = position
+                query = query.filter(
+                    or_(
+                        ChatMessage.created_at < created_at,
+                        and_(ChatMessage.created_at == created_at, ChatMessage.id < message_id),
+                    )
+                )
+
+            # 走 (session_id, created_at) 索引倒序取最新一页，再翻转为正序展示
+            query = query.order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc())
+            if limit:
+                messages = query.limit(limit + 1).all()
+                has_more = len(messages) > limit
+                messages = messages[:limit]
+            else:
+                messages = query.all()
+                has_more = False
+            messages.reverse()
+
+            next_cursor = None
+            if has_more and messages:
+                next_cursor = encode_cursor(messages[0].created_at, messages[0].id)
+
+            attachments = {}
+            if include_files:
+                attachments = self._load_attachments(db, messages, user_id)
 
             result = []
             for m in messages:
-                msg_data = {'role': m.role, 'content': m.content}
+                msg_data = {
+                    'id': m.id,
+                    'role': m.role,
+                    'content': m.content,
+                    'created_at': m.created_at.isoformat() if m.created_at else None,
+                }
                 if m.metadata_json:
                     try:
                         msg_data['metadata'] = json.loads(m.metadata_json)
                     except json.JSONDecodeError:
                         pass
 
-                if m.file_ids and include_files:
-                    try:
-                        file_ids = json.loads(m.file_ids)
-                        if file_ids:
-                            file_service = FileService()
-                            files = []
-                            for fid in file_ids:
-                                file_info = file_service.get_file(fid, user_id)
-                                if file_info:
-                                    files.append({
-                                        'id': file_info['id'],
-                                        'filename': file_info['original_filename'],
-                                        'file_size': file_info['file_size'],
-                                        'file_extension': file_info['file_extension']
-                                    })
-                            msg_data['files'] = files
-                    except json.JSONDecodeError:
-                        pass
+                file_ids = _parse_file_ids(m.file_ids)
+                if include_files and file_ids:
+                    msg_data['files'] = [attachments[fid] for fid in file_ids if fid in attachments]
                 result.append(msg_data)
-            return result
+            return result, next_cursor
         except Exception as e:
             print(f"Get session messages error: {e}")
             return None
         finally:
             db.close()
 
+    @staticmethod
+    def _load_attachments(db, messages, user_id):
+        """一次查询取出本页全部附件的展示信息。"""
+        file_ids = {fid for m in messages for fid in _parse_file_ids(m.file_ids)}
+        if not file_ids:
+            return {}
+        rows = db.query(
+            UploadedFile.id,
+            UploadedFile.original_filename,
+            UploadedFile.file_size,
+            UploadedFile.file_extension,
+        ).filter(
+            UploadedFile.id.in_(file_ids),
+            UploadedFile.user_id == user_id,
+        ).all()
+        return {
+            row.id: {
+                'id': row.id,
+                'filename': row.original_filename,
+                'file_size': row.file_size,
+                'file_extension': row.file_extension,
+            }
+            for row in rows
+        }
+
     def update_session_title(self, session_id, user_id, title):
         db = get_session()
         try:
@@ -227,141 +340,317 @@ class ChatService:
         file_ids=None,
         llm_provider=None,
         knowledge_base_ids=None,
+        cancel_event=None,
     ):
         """处理带会话的 Agent 流式聊天。
 
-        这是一个「生成器函数」，通过 yield 逐块输出 SSE（Server-Sent Events）数据，
-        供 Flask 路由以 text/event-stream 形式推送给前端。
+        这是一个「生成器函数」，逐个 yield `ChatEvent`，
+        由 Flask 路由序列化为 SSE（text/event-stream）推送给前端。
 
         整体流程：会话准备 → 权限校验 → 确定 LLM → 构建消息 → 委托 Agent 流式执行。
+        `cancel_event` 被设置时 Agent 提前结束，已生成的部分回答与用量照常落库。
         """
         try:
-            # ── 会话准备（新对话时自动建会话）──
-            if not session_id:
-                # 前端首次发消息时 session_id 为空，用消息前 30 字作为标题
-                title = self.generate_title_from_message(message)
-                session_id = self.create_session(user_id, title, llm_provider)
-                if not session_id:
-                    yield f"data: {json.dumps({'type': 'error', 'message': '创建会话失败'})}\n\n"
-                    return
-                # 通知前端新会话 ID，便于后续请求带上 session_id
-                yield f"data: {json.dumps({'type': 'session_id', 'session_id': session_id})}\n\n"
-
-            # ── 校验会话归属 + 确定 LLM 提供商 ──
-            db = get_session()
-            try:
-                # 必须同时匹配 session_id 与 user_id，防止越权访问他人会话
-                session = db.query(ChatSession).filter(
-                    ChatSession.id == session_id,
-                    ChatSession.user_id == user_id
-                ).first()
-                if not session:
-                    yield f"data: {json.dumps({'type': 'error', 'message': '会话不存在或无权限'})}\n\n"
-                    return
-
-                if llm_provider:
-                    # 请求显式指定模型时，更新会话记录并优先使用
-                    provider_id = llm_provider
-                    if hasattr(session, 'llm_provider'):
-                        session.llm_provider = provider_id
-                        db.commit()
-                else:
-                    # 未指定则沿用会话已保存的 provider，再回退到全局默认
-                    provider_id = getattr(session, 'llm_provider', None) or self.config.LLM_DEFAULT_PROVIDER
-            finally:
-                db.close()
-
-            # ── 构建 Agent 输入 ──
-            persistence = ChatPersistenceService(session_id=session_id, user_id=user_id)
-            # 将用户文本 + 附件内容拼成 LangChain HumanMessage（支持多模态图片）
-            user_message = persistence.build_user_message(message, file_ids, provider_id)
-            # 从 MySQL 拉最近历史，用于 PG checkpoint 首次为空时的 bootstrap
-            seed_messages = persistence.get_bootstrap_messages()
-
-            # ── 阶段 4：流式执行 Agent，并透传所有 SSE 事件 ──
-            yield from self._process_agent_stream(
-                user_id=user_id,
-                session_id=session_id,
-                provider_id=provider_id,
-                persistence=persistence,
-                user_message=user_message,
-                original_message=message,  # 存库用原始文本，不含文件注入前缀
-                file_ids=file_ids,
-                seed_messages=seed_messages,
-                knowledge_base_ids=knowledge_base_ids,
+            prelude, turn = self._prepare_turn(
+                user_id, session_id, message, file_ids, llm_provider, knowledge_base_ids
             )
+            if turn is not None:
+                turn.cancel_event = cancel_event
+            yield from prelude
+            if turn is None:
+                return
+
+            # ── 阶段 4：流式执行 Agent，并透传所有事件 ──
+            yield from self._process_agent_stream(turn)
         except Exception as e:
             error_traceback = traceback.format_exc()
             print(f"Process chat stream error: {e}")
             print(f"详细错误信息:\n{error_traceback}")
-            yield f"data: {json.dumps({'type': 'error', 'message': f'处理请求时出错: {str(e)}'})}\n\n"
+            yield error_event(f'处理请求时出错: {str(e)}')
 
-    def _process_agent_stream(
+    async def aprocess_chat_stream_with_session(
         self,
         user_id,
         session_id,
-        provider_id,
-        persistence,
-        user_message,
-        original_message,
-        file_ids,
-        seed_messages,
+        message,
+        file_ids=None,
+        llm_provider=None,
         knowledge_base_ids=None,
+        cancel_event=None,
     ):
+        """`process_chat_stream_with_session()` 的 asyncio 版本（ASGI 入口使用）。
+
+        Agent 走 `arun_agent_stream()`；会话校验、落库等同步 MySQL 操作放到线程池，
+        不阻塞事件循环。
+        """
         try:
-            assistant_content = ''
-            usage = None
-            tool_calls = []
-
-            for chunk in self.agent_service.run_agent_stream(
-                provider_id=provider_id,
-                session_id=session_id,
-                user_message=user_message,
-                seed_messages=seed_messages,
-                user_id=user_id,
-                knowledge_base_ids=knowledge_base_ids,
-            ):
-                yield chunk
-
-                if chunk.startswith('data: '):
-                    try:
-                        data = json.loads(chunk[6:].strip())
-                        if data.get('type') == 'content':
-                            assistant_content += data.get('content', '')
-                        elif data.get('type') == 'usage':
-                            usage = data.get('usage')
-                        elif data.get('type') == 'done':
-                            tool_calls = data.get('tool_calls', [])
-                    except (json.JSONDecodeError, KeyError):
-                        pass
+            prelude, turn = await asyncio.to_thread(
+                self._prepare_turn,
+                user_id, session_id, message, file_ids, llm_provider, knowledge_base_ids,
+            )
+            for event in prelude:
+                yield event
+            if turn is None:
+                return
 
-            if assistant_content:
-                metadata = {'tool_calls': tool_calls} if tool_calls else None
-                persistence.save_turn(
-                    original_message,
-                    assistant_content,
-                    user_file_ids=file_ids if file_ids else None,
-                    metadata=metadata,
-                )
+            try:
+                cached_answer = await asyncio.to_thread(self._lookup_cached_answer, turn)
+                if cached_answer:
+                    events = _aiter_events(replay_events(cached_answer))
+                else:
+                    events = self.agent_service.arun_agent_stream(
+                        provider_id=turn.provider_id,
+                        session_id=turn.session_id,
+                        user_message=turn.user_message,
+                        user_id=user_id,
+                        knowledge_base_ids=knowledge_base_ids,
+                        seed_loader=turn.persistence.get_bootstrap_messages,
+                        cancel_event=cancel_event,
+                    )
+                async for event in events:
+                    yield event
+                    turn.observe(event)
+                    if self._checkpoint_due(turn):
+                        await asyncio.to_thread(self._checkpoint_turn, turn)
+
+                title_event = await asyncio.to_thread(self._finish_turn, turn)
+                if title_event:
+                    yield title_event
+            except Exception as e:
+                print(f"Process agent stream error: {e}")
+                await asyncio.to_thread(self._finish_messages, turn)
+                yield error_event(f'Agent 处理错误: {str(e)}')
+        except Exception as e:
+            error_traceback = traceback.format_exc()
+            print(f"Process chat stream error: {e}")
+            print(f"详细错误信息:\n{error_traceback}")
+            yield error_event(f'处理请求时出错: {str(e)}')
 
-            if usage:
-                provider_config = self.llm_service.get_provider_config(provider_id)
-                model_name = provider_config.get('model_name', provider_id)
-                self.save_token_usage(user_id, usage, model_name)
+    def _prepare_turn(self, user_id, session_id, message, file_ids, llm_provider, knowledge_base_ids):
+        """会话准备、权限校验、确定 LLM、构建 Agent 输入。
 
-            db = get_session()
-            try:
-                msg_count = db.query(ChatMessage).filter(
-                    ChatMessage.session_id == session_id
-                ).count()
-            finally:
-                db.close()
+        返回值: `(prelude_events, turn)`；失败时 `turn` 为 None，`prelude_events` 含 error 事件。
+        """
+        prelude = []
+        created_session = not session_id
+        # ── 会话准备（新对话时自动建会话）──
+        if not session_id:
+            # 前端首次发消息时 session_id 为空，用消息前 30 字作为标题
+            title = self.generate_title_from_message(message)
+            session_id = self.create_session(user_id, title, llm_provider)
+            if not session_id:
+                prelude.append(error_event('创建会话失败'))
+                return prelude, None
+            # 通知前端新会话 ID，便于后续请求带上 session_id
+            prelude.append(session_id_event(session_id))
 
-            if msg_count == 2:
-                title = self.generate_title_from_message(original_message)
-                self.update_session_title(session_id, user_id, title)
-                yield f"data: {json.dumps({'type': 'session_title', 'title': title})}\n\n"
+        # ── 校验会话归属 + 确定 LLM 提供商 ──
+        db = get_session()
+        try:
+            # 必须同时匹配 session_id 与 user_id，防止越权访问他人会话
+            session = db.query(ChatSession).filter(
+                ChatSession.id == session_id,
+                ChatSession.user_id == user_id
+            ).first()
+            if not session:
+                prelude.append(error_event('会话不存在或无权限'))
+                return prelude, None
+            # 冗余统计为 0 即首轮，结束时据此生成标题
+            is_first_turn = not session.message_count
+
+            if llm_provider:
+                # 请求显式指定模型时，更新会话记录并优先使用
+                provider_id = llm_provider
+                if hasattr(session, 'llm_provider'):
+                    session.llm_provider = provider_id
+                    db.commit()
+            else:
+                # 未指定则沿用会话已保存的 provider，再回退到全局默认
+                provider_id = getattr(session, 'llm_provider', None) or self.config.LLM_DEFAULT_PROVIDER
+        finally:
+            db.close()
+
+        # ── 构建 Agent 输入 ──
+        persistence = ChatPersistenceService(session_id=session_id, user_id=user_id)
+        # 将用户文本 + 附件内容拼成 LangChain HumanMessage（支持多模态图片）
+        user_message = persistence.build_user_message(message, file_ids, provider_id)
+        turn = _ChatTurn(
+            user_id=user_id,
+            session_id=session_id,
+            provider_id=provider_id,
+            persistence=persistence,
+            user_message=user_message,
+            original_message=message,  # 存库用原始文本，不含文件注入前缀
+            file_ids=file_ids,
+            knowledge_base_ids=knowledge_base_ids,
+            is_first_turn=is_first_turn,
+            # 新建会话时已用首条消息作为标题，结束时无需再更新
+            title_pending=is_first_turn and not created_session,
+        )
+        if self.config.CHAT_PERSIST_MODE == 'write_behind':
+            _user_message_id, turn.assistant_message_id = persistence.begin_turn(
+                message, file_ids if file_ids else None
+            )
+            turn.checkpointed_at = time.monotonic()
+        return prelude, turn
+
+    def _process_agent_stream(self, turn):
+        try:
+            cached_answer = self._lookup_cached_answer(turn)
+            if cached_answer:
+                events = replay_events(cached_answer)
+            else:
+                events = self.agent_service.run_agent_stream(
+                    provider_id=turn.provider_id,
+                    session_id=turn.session_id,
+                    user_message=turn.user_message,
+                    user_id=turn.user_id,
+                    knowledge_base_ids=turn.knowledge_base_ids,
+                    # PG checkpoint 为空时才从 MySQL 拉最近历史做 bootstrap
+                    seed_loader=turn.persistence.get_bootstrap_messages,
+                    cancel_event=turn.cancel_event,
+                )
+            for event in events:
+                yield event
+                turn.observe(event)
+                if self._checkpoint_due(turn):
+                    self._checkpoint_turn(turn)
+
+            title_event = self._finish_turn(turn)
+            if title_event:
+                yield title_event
 
         except Exception as e:
             print(f"Process agent stream error: {e}")
-            yield f"data: {json.dumps({'type': 'error', 'message': f'Agent 处理错误: {str(e)}'})}\n\n"
+            self._finish_messages(turn)
+            yield error_event(f'Agent 处理错误: {str(e)}')
+
+    def _lookup_cached_answer(self, turn) -> Optional[str]:
+        """符合条件的首轮提问先查语义缓存；命中返回缓存回答，否则保留 embedding 供结束时写入。
+
+        命中的轮次之后由 MySQL 历史 bootstrap checkpoint，追问仍有上下文。
+        """
+        cache = get_response_cache()
+        if not cache.eligible(
+            is_first_turn=turn.is_first_turn,
+            file_ids=turn.file_ids,
+            knowledge_base_ids=turn.knowledge_base_ids,
+        ):
+            return None
+        turn.cache_embedding = cache.embed(turn.original_message)
+        return cache.lookup(turn.provider_id, turn.user_id, turn.cache_embedding)
+
+    def _store_cached_answer(self, turn) -> None:
+        """未命中的首轮回答正常结束且未调用工具时写入语义缓存。"""
+        if turn.cache_embedding is None or turn.cached or turn.cancelled or turn.tool_calls:
+            return
+        get_response_cache().store(
+            turn.provider_id,
+            turn.user_id,
+            turn.original_message,
+            turn.cache_embedding,
+            ''.join(turn.content_parts),
+        )
+
+    def _checkpoint_due(self, turn) -> bool:
+        return (
+            turn.assistant_message_id is not None
+            and len(turn.content_parts) > turn.persisted_parts
+            and time.monotonic() - turn.checkpointed_at >= self.config.CHAT_PERSIST_INTERVAL
+        )
+
+    def _checkpoint_turn(self, turn) -> None:
+        """write_behind：把上次落库之后的正文追加到 assistant 占位消息。"""
+        upto = len(turn.content_parts)
+        delta = ''.join(turn.content_parts[turn.persisted_parts:upto])
+        if turn.persistence.append_assistant_content(turn.assistant_message_id, delta):
+            turn.persisted_parts = upto
+        turn.checkpointed_at = time.monotonic()
+
+    def _finish_messages(self, turn) -> None:
+        """保存本轮消息：write_behind 只补齐剩余正文与 metadata，否则整轮 `save_turn()`。"""
+        assistant_content = ''.join(turn.content_parts)
+        metadata = {'tool_calls': turn.tool_calls} if turn.tool_calls else {}
+        if turn.cancelled:
+            metadata['cancelled'] = True
+        if turn.cached:
+            metadata['cached'] = True
+
+        if turn.assistant_message_id is not None:
+            turn.persistence.finish_turn(
+                turn.assistant_message_id,
+                ''.join(turn.content_parts[turn.persisted_parts:]),
+                assistant_content,
+                metadata=metadata or None,
+            )
+        elif assistant_content:
+            turn.persistence.save_turn(
+                turn.original_message,
+                assistant_content,
+                user_file_ids=turn.file_ids if turn.file_ids else None,
+                metadata=metadata or None,
+            )
+
+    def _finish_turn(self, turn):
+        """Agent 流结束后：保存本轮消息、记录用量、首轮返回标题事件（否则返回 None）。
+
+        被取消的轮次保存已生成的部分回答（metadata 标记 `cancelled`），用量为 Agent 的估算值。
+        """
+        self._finish_messages(turn)
+
+        if turn.usage:
+            provider_config = self.llm_service.get_provider_config(turn.provider_id)
+            model_name = provider_config.get('model_name', turn.provider_id)
+            self.save_token_usage(turn.user_id, turn.usage, model_name, session_id=turn.session_id)
+        self._store_cached_answer(turn)
+
+        if not turn.is_first_turn:
+            return None
+        title = self.generate_title_from_message(turn.original_message)
+        if turn.title_pending:
+            self.update_session_title(turn.session_id, turn.user_id, title)
+        return session_title_event(title)
+
+
+@dataclass
+class _ChatTurn:
+    """一轮对话的输入与流式累积结果（同步 / 异步路径共用）。"""
+
+    user_id: int
+    session_id: int
+    provider_id: str
+    persistence: ChatPersistenceService
+    user_message: Any
+    original_message: str
+    file_ids: Optional[List[int]] = None
+    knowledge_base_ids: Optional[List[int]] = None
+    content_parts: List[str] = field(default_factory=list)
+    usage: Optional[Dict] = None
+    tool_calls: List[Dict] = field(default_factory=list)
+    cancelled: bool = False
+    # 语义缓存：本轮回答来自缓存 / 提问的 embedding（符合缓存条件时才有）
+    cached: bool = False
+    cache_embedding: Optional[List[float]] = None
+    cancel_event: Optional[threading.Event] = None
+    is_first_turn: bool = False
+    title_pending: bool = False
+    # write_behind：assistant 占位消息 ID、已落库的正文片段数、上次落库时刻
+    assistant_message_id: Optional[int] = None
+    persisted_parts: int = 0
+    checkpointed_at: float = 0.0
+
+    def observe(self, event) -> None:
+        if event.type == CONTENT:
+            self.content_parts.append(event.data['content'])
+        elif event.type == USAGE:
+            self.usage = event.data.get('usage')
+        elif event.type == DONE:
+            self.tool_calls = event.data.get('tool_calls', [])
+            self.cancelled = bool(event.data.get('cancelled'))
+            self.cached = bool(event.data.get('cached'))
+
+
+async def _aiter_events(events):
+    """把同步事件迭代器包装为异步迭代器（缓存回放用）。"""
+    for event in events:
+        yield event
@@ -1,8 +1,16 @@
-"""LangGraph Postgres Checkpointer 单例管理。"""
+"""LangGraph Postgres Checkpointer 单例管理。
+
+- 同步 `PostgresSaver`：Flask / gunicorn 路径，共用 `get_postgres_pool()`
+- 异步 `AsyncPostgresSaver`：ASGI 流式入口（`backend.asgi`），在事件循环内创建独立的
+  `AsyncConnectionPool`，由 lifespan 打开与关闭
+"""
 import logging
 import threading
 
 from langgraph.checkpoint.postgres import PostgresSaver
+from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
 
 from backend.db.postgres_pool import get_postgres_pool
 
@@ -11,6 +19,9 @@ logger = logging.getLogger(__name__)
 _checkpointer = None
 _lock = threading.Lock()
 
+_async_checkpointer = None
+_async_pool = None
+
 
 def init_checkpointer(config) -> PostgresSaver:
     """初始化 Postgres checkpointer 并建表（幂等）。"""
@@ -38,6 +49,48 @@ def get_checkpointer() -> PostgresSaver:
     return _checkpointer
 
 
+async def init_async_checkpointer(config) -> AsyncPostgresSaver:
+    """在当前事件循环内创建异步连接池与 checkpointer（表结构由同步初始化负责）。"""
+    global _async_checkpointer, _async_pool
+    if _async_checkpointer is not None:
+        return _async_checkpointer
+
+    _async_pool = AsyncConnectionPool(
+        conninfo=config.POSTGRES_URI,
+        min_size=config.POSTGRES_POOL_MIN_SIZE,
+        max_size=config.POSTGRES_POOL_MAX_SIZE,
+        timeout=config.POSTGRES_POOL_TIMEOUT,
+        open=False,
+        max_idle=300,
+        reconnect_timeout=300,
+        kwargs={
+            "autocommit": True,
+            "prepare_threshold": 0,
+            "row_factory": dict_row,
+            "connect_timeout": 10,
+        },
+    )
+    await _async_pool.open()
+    _async_checkpointer = AsyncPostgresSaver(_async_pool)
+    logger.info("Async Postgres checkpointer 已初始化: %s", config.POSTGRES_HOST)
+    return _async_checkpointer
+
+
+def get_async_checkpointer() -> AsyncPostgresSaver:
+    """获取异步 checkpointer；必须先在 ASGI lifespan 中调用 `init_async_checkpointer()`。"""
+    if _async_checkpointer is None:
+        raise RuntimeError("Async checkpointer 未初始化，请在 ASGI lifespan 中调用 init_async_checkpointer")
+    return _async_checkpointer
+
+
+async def close_async_checkpointer() -> None:
+    global _async_checkpointer, _async_pool
+    if _async_pool is not None:
+        await _async_pool.close()
+    _async_checkpointer = None
+    _async_pool = None
+
+
 def delete_thread(session_id: int) -> None:
     """删除会话对应的 Agent checkpoint thread。"""
     try:
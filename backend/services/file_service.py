@@ -5,6 +5,7 @@
    - `FileExtractor`  支持 txt/pdf/docx/xlsx 及图片格式识别
 2) 文件 CRUD
    - `FileService.save_file()` / `get_file()` / `delete_file()` / `get_user_files()`
+   - 磁盘存储委托 `ContentStore`（流式写入 + SHA-256 内容去重）
 3) 聊天上下文
    - `format_file_context()` / `get_file_contexts_from_ids()`
 """
@@ -17,6 +18,7 @@ from typing import Dict, List, Optional
 from ..config import Config
 from ..db import get_session
 from ..db import UploadedFile
+from .file_storage import ContentStore, FileTooLargeError
 
 
 class FileExtractor:
@@ -195,6 +197,7 @@ class FileService:
     def __init__(self):
         self.config = Config()
         self.extractor = FileExtractor()
+        self.content_store = ContentStore()
         
         # 文件上传目录
         self.upload_dir = os.path.join(
@@ -257,32 +260,30 @@ class FileService:
         try:
             filename = file.filename
             
-            # 获取文件大小
-            file.seek(0, 2)  # 移动到文件末尾
-            file_size = file.tell()
-            file.seek(0)  # 重置到文件开头
-            
             # 获取扩展名
             _, ext = os.path.splitext(filename)
             ext = ext.lower()
             is_image_file = self.extractor.is_image(ext)
             
-            # 验证文件
-            is_valid, error = self.validate_file(filename, file_size, is_image_file)
+            # 验证文件名与类型（大小在流式写入时校验）
+            is_valid, error = self.validate_file(filename, 0, is_image_file)
             if not is_valid:
                 return {'success': False, 'error': error}
             
             # 生成存储文件名
-            _, ext = os.path.splitext(filename)
-            ext = ext.lower()
             stored_filename = f'{uuid.uuid4().hex}{ext}'
             
             # 获取用户上传目录
             user_dir = self.get_user_upload_dir(user_id)
             file_path = os.path.join(user_dir, stored_filename)
             
-            # 保存文件
-            file.save(file_path)
+            # 分块写入并计算 SHA-256，超过 MAX_FILE_SIZE 立即中止；相同内容硬链接到同一 blob
+            try:
+                stored = self.content_store.save(file.stream, file_path, self.config.MAX_FILE_SIZE)
+            except FileTooLargeError:
+                _, error = self.validate_file(filename, self.config.MAX_FILE_SIZE + 1, is_image_file)
+                return {'success': False, 'error': error}
+            file_size = stored.size
             
             # 获取MIME类型
             mime_type, _ = mimetypes.guess_type(filename)
@@ -295,7 +296,12 @@ class FileService:
                 extraction_status = 'success'  # 图片文件标记为成功，但不需要提取文本
                 text_length = 0
             else:
-                extracted_text, extraction_status = self.extractor.extract(file_path, ext)
+                # 命中已有内容时复用其提取结果，避免重复解析同一文件
+                reused = self._find_extraction(stored.sha256, ext) if stored.deduplicated else None
+                if reused:
+                    extracted_text, extraction_status = reused
+                else:
+                    extracted_text, extraction_status = self.extractor.extract(file_path, ext)
                 text_length = len(extracted_text) if extracted_text else 0
             
             # 保存到数据库
@@ -309,6 +315,7 @@ class FileService:
                     file_size=file_size,
                     file_type=mime_type,
                     file_extension=ext,
+                    content_hash=stored.sha256,
                     extracted_text=extracted_text,
                     text_length=text_length,
                     extraction_status=extraction_status,
@@ -331,8 +338,7 @@ class FileService:
             except Exception as e:
                 db.rollback()
                 # 删除已保存的文件
-                if os.path.exists(file_path):
-                    os.remove(file_path)
+                self.content_store.release(file_path, stored.sha256)
                 raise e
             finally:
                 db.close()
@@ -341,6 +347,24 @@ class FileService:
             print(f"Save file error: {e}")
             return {'success': False, 'error': f'保存文件失败: {str(e)}'}
     
+    def _find_extraction(self, content_hash: str, ext: str) -> Optional[tuple[str, str]]:
+        """按内容哈希查找已提取过的文本，返回 `(extracted_text, extraction_status)`。"""
+        db = get_session()
+        try:
+            row = db.query(
+                UploadedFile.extracted_text,
+                UploadedFile.extraction_status,
+            ).filter(
+                UploadedFile.content_hash == content_hash,
+                UploadedFile.file_extension == ext,
+                UploadedFile.extraction_status.in_(('success', 'too_large')),
+            ).first()
+            if not row:
+                return None
+            return row.extracted_text or '', row.extraction_status
+        finally:
+            db.close()
+    
     def get_file(self, file_id: int, user_id: int) -> dict:
         """获取文件元数据（不含磁盘路径）。
 
@@ -415,9 +439,8 @@ class FileService:
             if not file_obj:
                 return {'success': False, 'error': '文件不存在或无权限'}
             
-            # 删除物理文件
-            if os.path.exists(file_obj.file_path):
-                os.remove(file_obj.file_path)
+            # 删除物理文件（blob 无其他引用时一并回收）
+            self.content_store.release(file_obj.file_path, file_obj.content_hash)
             
             # 删除数据库记录
             db.delete(file_obj)
@@ -0,0 +1,148 @@
+"""上传文件磁盘存储 — 流式落盘、SHA-256 与内容寻址去重。
+
+职责总览：
+1) 流式写入
+   - `ContentStore.save()`  分块写入临时文件，边写边计算 SHA-256，超过上限立即中止
+   - `ContentStore.import_file()`  登记已在磁盘上的文件（如断点续传拼接结果）
+2) 内容寻址去重
+   - blob 路径 `uploads/.blobs/<sha256[:2]>/<sha256>`，相同内容在磁盘只保留一份
+   - 业务路径（uuid 文件名）通过硬链接指向 blob，`file_path` 语义保持不变
+3) 引用计数
+   - 引用数即 blob inode 的硬链接数（`st_nlink`），由文件系统维护
+   - `ContentStore.release()` 删除业务路径后，若仅剩 blob 自身则回收
+
+调用方：
+- `FileService.save_file()` / `delete_file()`
+- `KnowledgeService.upload_document()` / `complete_upload()` / `delete_document()` / `delete_knowledge_base()`
+
+已知局限：
+- 不支持硬链接的文件系统（或跨设备）时退化为独立文件，不参与去重
+- 历史文件（无 `content_hash`）删除时只删除业务路径
+"""
+import hashlib
+import logging
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import Optional
+
+from ..config.settings import UPLOAD_BLOB_DIR
+
+logger = logging.getLogger(__name__)
+
+
+class FileTooLargeError(ValueError):
+    """写入过程中累计字节数超过上限。"""
+
+
+@dataclass
+class StoredContent:
+    """一次落盘的结果。"""
+
+    sha256: str
+    size: int
+    path: str
+    deduplicated: bool = False
+
+
+class ContentStore:
+    """基于硬链接的内容寻址存储。"""
+
+    CHUNK_SIZE = 1024 * 1024  # 1MB
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = str(root or UPLOAD_BLOB_DIR)
+        self.tmp_dir = os.path.join(self.root, ".tmp")
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def blob_path(self, sha256: str) -> str:
+        """返回内容哈希对应的 blob 路径。"""
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    def save(self, stream, dest_path: str, max_size: int) -> StoredContent:
+        """将可读流分块写入 `dest_path`，同时计算 SHA-256 并去重。
+
+        用法:
+        - 参数:
+            - stream: 具有 `read(n)` 的二进制流（如 Flask `FileStorage.stream`）
+            - dest_path: 业务路径（uuid 文件名）
+            - max_size: 最大字节数，写入中超过即抛出 `FileTooLargeError`
+        - 返回值: `StoredContent`
+        """
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                while True:
+                    chunk = stream.read(self.CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > max_size:
+                        raise FileTooLargeError(f"文件超过大小限制（{max_size} 字节）")
+                    digest.update(chunk)
+                    tmp.write(chunk)
+        except BaseException:
+            self._silent_remove(tmp_path)
+            raise
+
+        sha256 = digest.hexdigest()
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        deduplicated = self._materialize(tmp_path, sha256, dest_path)
+        return StoredContent(sha256=sha256, size=size, path=dest_path, deduplicated=deduplicated)
+
+    def import_file(self, src_path: str, dest_path: str) -> StoredContent:
+        """登记同一文件系统上已存在的文件（会被移动/链接，调用后不再保留 `src_path`）。
+
+        用法:
+        - 调用方: 断点续传 complete 阶段，分片已拼接为完整文件
+        - 返回值: `StoredContent`
+        """
+        with open(src_path, "rb") as f:
+            sha256 = hashlib.file_digest(f, "sha256").hexdigest()
+        size = os.path.getsize(src_path)
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        deduplicated = self._materialize(src_path, sha256, dest_path)
+        return StoredContent(sha256=sha256, size=size, path=dest_path, deduplicated=deduplicated)
+
+    def release(self, path: str, sha256: Optional[str] = None) -> None:
+        """删除业务路径；blob 不再被引用时一并回收。"""
+        self._silent_remove(path)
+        if not sha256:
+            return
+        blob = self.blob_path(sha256)
+        try:
+            if os.stat(blob).st_nlink <= 1:
+                os.remove(blob)
+        except FileNotFoundError:
+            pass
+        except OSError as exc:
+            logger.warning("回收 blob 失败 %s: %s", blob, exc)
+
+    def _materialize(self, tmp_path: str, sha256: str, dest_path: str) -> bool:
+        """把临时文件登记为 blob 并硬链接到业务路径，返回是否命中已有内容。"""
+        blob = self.blob_path(sha256)
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        existed = False
+        try:
+            try:
+                os.link(tmp_path, blob)
+            except FileExistsError:
+                existed = True
+            os.link(blob, dest_path)
+        except OSError as exc:
+            # 不支持硬链接，或 blob 恰好被并发回收：退化为独立文件
+            logger.warning("硬链接失败，按独立文件保存 %s: %s", dest_path, exc)
+            os.replace(tmp_path, dest_path)
+            return False
+        self._silent_remove(tmp_path)
+        return existed
+
+    @staticmethod
+    def _silent_remove(path: str) -> None:
+        if path and os.path.exists(path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -9,6 +9,7 @@
 - `bm25_retriever`     BM25 关键词检索
 - `rerank_client`      Rerank API 客户端
 - `hybrid_search`      混合检索引擎（向量 + BM25 + RRF + Rerank）
+- `resumable_upload`   大文件断点续传（分片落盘与拼接）
 
 对外常用导出见 `__all__`；完整业务编排见上层 `KnowledgeService`。
 """
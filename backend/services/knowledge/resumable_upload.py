@@ -0,0 +1,268 @@
+"""知识库大文件断点续传 — 分片落盘、状态查询与零拷贝拼接。
+
+职责总览：
+1) 会话管理
+   - `ResumableUploadStore.create()`  创建上传会话，写入 manifest.json
+   - `ResumableUploadStore.get()`     读取会话并列出已上传分片（客户端据此续传）
+   - `ResumableUploadStore.abort()`   删除会话目录
+   - `ResumableUploadStore.claim()` / `release()`  complete 前以 `O_EXCL` 创建 `completing` 认领文件
+     （内容为认领时间），并发的 complete 只有一个能认领；文档记录未落库时删除认领文件，会话与分片保留以便重试。
+     认领超过 `KB_UPLOAD_CLAIM_TIMEOUT` 秒视为执行方已崩溃，可被接管
+2) 分片写入
+   - `ResumableUploadStore.write_part()`  流式写入单个分片，先写 `.partial` 再原子 rename
+3) 拼接
+   - `ResumableUploadStore.assemble()`  按序拼接全部分片（优先 `os.copy_file_range`，
+     数据不经过用户态），返回完整文件路径，交由 `KnowledgeService` 走原入库流程
+
+磁盘布局（与上传文件同一文件系统，便于 `ContentStore.import_file()` 硬链接）：
+  uploads/.uploads/<upload_id>/manifest.json
+  uploads/.uploads/<upload_id>/completing            （complete 进行中）
+  uploads/.uploads/<upload_id>/part-00001
+  uploads/.uploads/<upload_id>/assembled
+
+设计说明：
+- 会话状态只存磁盘，多个 gunicorn worker 之间天然共享，无需 Redis
+- 每个分片是一次独立的短请求；断线只需重传未完成的分片
+
+相关配置（`Config` / `.env`）：
+- `KB_UPLOAD_PART_SIZE`    分片大小（字节，默认 5MB）
+- `KB_UPLOAD_SESSION_TTL`  会话过期时间（秒，默认 86400），过期目录在创建新会话时清理
+- `KB_UPLOAD_CLAIM_TIMEOUT`  complete 认领超时（秒，默认 1800），超时的认领可被新的 complete 接管
+"""
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from ...config.settings import UPLOAD_DIR
+
+_UPLOAD_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+class ResumableUploadStore:
+    """磁盘上的分片上传会话。"""
+
+    CHUNK_SIZE = 1024 * 1024  # 1MB
+
+    def __init__(self, config, root: Optional[str] = None):
+        self.part_size = config.KB_UPLOAD_PART_SIZE
+        self.session_ttl = config.KB_UPLOAD_SESSION_TTL
+        self.claim_timeout = config.KB_UPLOAD_CLAIM_TIMEOUT
+        self.max_file_size = config.MAX_FILE_SIZE
+        self.root = str(root or (UPLOAD_DIR / ".uploads"))
+        os.makedirs(self.root, exist_ok=True)
+
+    def create(self, *, user_id: int, kb_id: int, filename: str, file_size: int) -> Dict:
+        """创建上传会话。
+
+        用法:
+        - 调用方: `KnowledgeService.init_upload()`
+        - 返回值: 会话 dict（含 `upload_id`、`part_size`、`total_parts`、`uploaded_parts`）
+        """
+        if file_size <= 0:
+            raise ValueError("文件大小无效")
+        if file_size > self.max_file_size:
+            raise ValueError("文件大小超过限制")
+
+        self.cleanup_expired()
+        upload_id = uuid.uuid4().hex
+        os.makedirs(self._session_dir(upload_id))
+        manifest = {
+            "upload_id": upload_id,
+            "user_id": user_id,
+            "knowledge_base_id": kb_id,
+            "filename": filename,
+            "file_size": file_size,
+            "part_size": self.part_size,
+            "total_parts": (file_size + self.part_size - 1) // self.part_size,
+            "created_at": time.time(),
+        }
+        with open(self._manifest_path(upload_id), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        return {**manifest, "uploaded_parts": []}
+
+    def get(self, upload_id: str, *, user_id: int, kb_id: int) -> Optional[Dict]:
+        """读取会话；不存在、已过期或不属于该用户/知识库时返回 None。"""
+        manifest = self._load_manifest(upload_id)
+        if not manifest:
+            return None
+        if manifest["user_id"] != user_id or manifest["knowledge_base_id"] != kb_id:
+            return None
+        if time.time() - manifest["created_at"] > self.session_ttl:
+            self.abort(upload_id)
+            return None
+        return {**manifest, "uploaded_parts": self._uploaded_parts(manifest)}
+
+    def write_part(self, manifest: Dict, part_number: int, stream) -> int:
+        """流式写入第 `part_number` 个分片（1 起），返回写入字节数。
+
+        - 分片大小必须与会话约定一致（最后一片为余数），否则丢弃并报错
+        - 先写 `.partial` 再 rename，断线不会留下残缺分片
+        """
+        expected = self._expected_part_size(manifest, part_number)
+        part_path = self._part_path(manifest["upload_id"], part_number)
+        partial_path = f"{part_path}.partial"
+        written = 0
+        try:
+            with open(partial_path, "wb") as f:
+                while True:
+                    chunk = stream.read(self.CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    written += len(chunk)
+                    if written > expected:
+                        raise ValueError(f"分片 {part_number} 超过约定大小 {expected} 字节")
+                    f.write(chunk)
+            if written != expected:
+                raise ValueError(f"分片 {part_number} 大小不完整：{written}/{expected} 字节")
+            os.replace(partial_path, part_path)
+        except BaseException:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            raise
+        return written
+
+    def assemble(self, manifest: Dict) -> str:
+        """校验分片齐全后按序拼接，返回完整文件路径。"""
+        uploaded = set(self._uploaded_parts(manifest))
+        missing = [n for n in range(1, manifest["total_parts"] + 1) if n not in uploaded]
+        if missing:
+            preview = ", ".join(str(n) for n in missing[:10])
+            raise ValueError(f"分片未上传完整，缺少: {preview}")
+
+        upload_id = manifest["upload_id"]
+        assembled_path = os.path.join(self._session_dir(upload_id), "assembled")
+        with open(assembled_path, "wb", buffering=0) as dst:
+            for part_number in range(1, manifest["total_parts"] + 1):
+                with open(self._part_path(upload_id, part_number), "rb", buffering=0) as src:
+                    _append_file(src, dst)
+        if os.path.getsize(assembled_path) != manifest["file_size"]:
+            raise ValueError("拼接后文件大小与声明不一致")
+        return assembled_path
+
+    def claim(self, upload_id: str) -> bool:
+        """认领会话准备 complete；已被其他请求认领且未超时时返回 False。"""
+        if not _UPLOAD_ID_RE.match(upload_id or ""):
+            return False
+        if self._create_claim(upload_id):
+            return True
+        if not self._claim_stale(upload_id):
+            return False
+        # 执行方崩溃遗留的认领：改名是原子的，并发接管时只有一个请求成功
+        stale_path = f"{self._completing_path(upload_id)}.{uuid.uuid4().hex}"
+        try:
+            os.rename(self._completing_path(upload_id), stale_path)
+        except FileNotFoundError:
+            return False
+        os.remove(stale_path)
+        return self._create_claim(upload_id)
+
+    def is_claimed(self, upload_id: str) -> bool:
+        """会话是否正被 complete（未超时的认领）。"""
+        return os.path.exists(self._completing_path(upload_id)) and not self._claim_stale(upload_id)
+
+    def release(self, upload_id: str) -> None:
+        """文档记录未落库的 complete 失败后释放认领，会话可补传分片并重试 complete。"""
+        try:
+            os.remove(self._completing_path(upload_id))
+        except FileNotFoundError:
+            pass
+
+    def _create_claim(self, upload_id: str) -> bool:
+        try:
+            fd = os.open(self._completing_path(upload_id), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "w") as f:
+            f.write(str(time.time()))
+        return True
+
+    def _claim_stale(self, upload_id: str) -> bool:
+        try:
+            with open(self._completing_path(upload_id), "r", encoding="utf-8") as f:
+                claimed_at = float(f.read() or 0)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError):
+            # 认领文件刚创建、时间尚未写入
+            return False
+        return time.time() - claimed_at > self.claim_timeout
+
+    def abort(self, upload_id: str) -> None:
+        """删除会话目录（完成、取消或过期时调用）。"""
+        if not _UPLOAD_ID_RE.match(upload_id or ""):
+            return
+        shutil.rmtree(self._session_dir(upload_id), ignore_errors=True)
+
+    def cleanup_expired(self) -> None:
+        """清理超过 `KB_UPLOAD_SESSION_TTL` 未完成的会话目录。"""
+        deadline = time.time() - self.session_ttl
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            try:
+                if os.path.isdir(path) and os.path.getmtime(path) < deadline:
+                    shutil.rmtree(path, ignore_errors=True)
+            except OSError:
+                continue
+
+    def _expected_part_size(self, manifest: Dict, part_number: int) -> int:
+        total_parts = manifest["total_parts"]
+        if part_number < 1 or part_number > total_parts:
+            raise ValueError(f"分片序号超出范围（1-{total_parts}）")
+        if part_number < total_parts:
+            return manifest["part_size"]
+        return manifest["file_size"] - manifest["part_size"] * (total_parts - 1)
+
+    def _uploaded_parts(self, manifest: Dict) -> List[int]:
+        upload_id = manifest["upload_id"]
+        return [
+            n
+            for n in range(1, manifest["total_parts"] + 1)
+            if os.path.exists(self._part_path(upload_id, n))
+        ]
+
+    def _load_manifest(self, upload_id: str) -> Optional[Dict]:
+        if not _UPLOAD_ID_RE.match(upload_id or ""):
+            return None
+        try:
+            with open(self._manifest_path(upload_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def _session_dir(self, upload_id: str) -> str:
+        return os.path.join(self.root, upload_id)
+
+    def _manifest_path(self, upload_id: str) -> str:
+        return os.path.join(self._session_dir(upload_id), "manifest.json")
+
+    def _completing_path(self, upload_id: str) -> str:
+        return os.path.join(self._session_dir(upload_id), "completing")
+
+    def _part_path(self, upload_id: str, part_number: int) -> str:
+        return os.path.join(self._session_dir(upload_id), f"part-{part_number:05d}")
+
+
+def _append_file(src, dst) -> None:
+    """把 `src` 全部内容追加到 `dst` 当前位置。
+
+    优先 `os.copy_file_range`（内核内拷贝，部分文件系统可直接共享数据块），
+    不可用时退回用户态分块拷贝。
+    """
+    remaining = os.fstat(src.fileno()).st_size
+    if hasattr(os, "copy_file_range"):
+        try:
+            while remaining > 0:
+                copied = os.copy_file_range(src.fileno(), dst.fileno(), remaining)
+                if copied == 0:
+                    break
+                remaining -= copied
+            if remaining == 0:
+                return
+        except OSError:
+            if remaining != os.fstat(src.fileno()).st_size:
+                raise
+    shutil.copyfileobj(src, dst, ResumableUploadStore.CHUNK_SIZE)
@@ -2,19 +2,29 @@
 import os
 import uuid
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional
 
 from sqlalchemy import func
 
 from ..config import Config
 from ..db import KbDocument, KnowledgeBase, get_session
+from .file_storage import ContentStore, FileTooLargeError, StoredContent
 from .knowledge.chunker import split_text
 from .knowledge.document_extractor import KbDocumentExtractor
 from .knowledge.embedding_client import EmbeddingClient
 from .knowledge.hybrid_search import HybridSearchEngine
+from .knowledge.resumable_upload import ResumableUploadStore
 from .knowledge.vector_store import VectorStore
 
 
+class DocumentProcessingError(ValueError):
+    """文档记录已落库但解析 / 向量化失败；`document` 为失败文档（status=failed）。"""
+
+    def __init__(self, message: str, document: Dict):
+        super().__init__(message)
+        self.document = document
+
+
 class KnowledgeService:
     """知识库业务：元数据在 MySQL，向量 chunk 在 PostgreSQL。"""
 
@@ -24,6 +34,8 @@ class KnowledgeService:
         self.embedding_client = EmbeddingClient(self.config)
         self.search_engine = HybridSearchEngine(self.config)
         self.vector_store = VectorStore(self.config)
+        self.content_store = ContentStore()
+        self.upload_store = ResumableUploadStore(self.config)
 
         project_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
         self.upload_root = os.path.join(project_root, "uploads", "knowledge")
@@ -116,7 +128,7 @@ class KnowledgeService:
                 .all()
             )
             for doc in docs:
-                self._remove_file(doc.file_path)
+                self._remove_file(doc.file_path, doc.content_hash)
             self.vector_store.delete_chunks_for_kb(kb_id, user_id)
             db.delete(kb)
             db.commit()
@@ -151,17 +163,97 @@ class KnowledgeService:
             raise ValueError("未选择文件")
 
         filename = file_storage.filename
-        extension = os.path.splitext(filename)[1].lower()
-        if not self.extractor.is_supported(extension):
-            supported = ", ".join(self.extractor.get_supported_extensions())
-            raise ValueError(f"不支持的文件格式，当前支持: {supported}")
+        extension = self._validate_extension(filename)
+
+        def _store(file_path: str):
+            try:
+                return self.content_store.save(
+                    file_storage.stream, file_path, self.config.MAX_FILE_SIZE
+                )
+            except FileTooLargeError as exc:
+                raise ValueError("文件大小超过限制") from exc
+
+        return self._ingest_document(kb_id, user_id, filename, extension, _store)
+
+    def init_upload(self, kb_id: int, user_id: int, filename: str, file_size: int) -> Dict:
+        """创建断点续传会话（大文件分片上传第 1 步）。"""
+        filename = (filename or "").strip()
+        if not filename:
+            raise ValueError("未选择文件")
+        self._validate_extension(filename)
+        if not self.get_knowledge_base(kb_id, user_id):
+            raise ValueError("知识库不存在或无权限")
+        return self.upload_store.create(
+            user_id=user_id, kb_id=kb_id, filename=filename, file_size=int(file_size or 0)
+        )
+
+    def get_upload(self, kb_id: int, user_id: int, upload_id: str) -> Optional[Dict]:
+        """查询续传会话及已上传分片，客户端据此跳过已完成部分。"""
+        return self.upload_store.get(upload_id, user_id=user_id, kb_id=kb_id)
+
+    def upload_part(
+        self, kb_id: int, user_id: int, upload_id: str, part_number: int, stream
+    ) -> Optional[Dict]:
+        """写入单个分片（第 2 步，可重复、可乱序）。"""
+        manifest = self.upload_store.get(upload_id, user_id=user_id, kb_id=kb_id)
+        if not manifest:
+            return None
+        if self.upload_store.is_claimed(upload_id):
+            raise ValueError("该上传正在完成中，不能再写入分片")
+        size = self.upload_store.write_part(manifest, part_number, stream)
+        return {"upload_id": upload_id, "part_number": part_number, "size": size}
+
+    def complete_upload(self, kb_id: int, user_id: int, upload_id: str) -> Optional[Dict]:
+        """拼接分片并走与普通上传相同的入库流程（第 3 步）。
+
+        先认领会话，并发的重复 complete 直接报错。文档记录落库后（无论解析是否成功）删除会话，
+        解析失败抛出带失败文档的 `DocumentProcessingError`；记录未落库的失败保留会话与分片供重试，
+        避免重试产生重复文档。
+        """
+        manifest = self.upload_store.get(upload_id, user_id=user_id, kb_id=kb_id)
+        if not manifest:
+            return None
+        filename = manifest["filename"]
+        extension = self._validate_extension(filename)
+        if not self.upload_store.claim(upload_id):
+            raise ValueError("该上传正在完成中，请勿重复提交")
+        try:
+            assembled_path = self.upload_store.assemble(manifest)
+            document = self._ingest_document(
+                kb_id,
+                user_id,
+                filename,
+                extension,
+                lambda file_path: self.content_store.import_file(assembled_path, file_path),
+            )
+        except DocumentProcessingError:
+            self.upload_store.abort(upload_id)
+            raise
+        except BaseException:
+            self.upload_store.release(upload_id)
+            raise
+        self.upload_store.abort(upload_id)
+        return document
+
+    def abort_upload(self, kb_id: int, user_id: int, upload_id: str) -> bool:
+        """取消续传会话并删除已上传分片。"""
+        if not self.upload_store.get(upload_id, user_id=user_id, kb_id=kb_id):
+            return False
+        self.upload_store.abort(upload_id)
+        return True
 
-        file_storage.seek(0, os.SEEK_END)
-        file_size = file_storage.tell()
-        file_storage.seek(0)
-        if file_size > self.config.MAX_FILE_SIZE:
-            raise ValueError("文件大小超过限制")
+    def _ingest_document(
+        self,
+        kb_id: int,
+        user_id: int,
+        filename: str,
+        extension: str,
+        store: Callable[[str], StoredContent],
+    ) -> Dict:
+        """落盘（由 `store` 写入目标路径）→ 建文档记录 → 解析、分块、向量化。
 
+        记录落库后解析失败抛出 `DocumentProcessingError`（文档保留为 failed），其余失败抛出 `ValueError`。
+        """
         db = get_session()
         doc = None
         try:
@@ -173,7 +265,7 @@ class KnowledgeService:
             os.makedirs(kb_dir, exist_ok=True)
             stored_filename = f"{uuid.uuid4().hex}{extension}"
             file_path = os.path.join(kb_dir, stored_filename)
-            file_storage.save(file_path)
+            stored = store(file_path)
 
             doc = KbDocument(
                 knowledge_base_id=kb_id,
@@ -181,19 +273,26 @@ class KnowledgeService:
                 original_filename=filename,
                 stored_filename=stored_filename,
                 file_path=file_path,
-                file_size=file_size,
+                file_size=stored.size,
                 file_extension=extension,
+                content_hash=stored.sha256,
                 status="processing",
             )
-            db.add(doc)
-            db.commit()
-            db.refresh(doc)
+            try:
+                db.add(doc)
+                db.commit()
+                db.refresh(doc)
+            except Exception:
+                # 文档记录未落库时文件无人引用：删除业务路径，blob 无其他引用时一并回收
+                db.rollback()
+                self._remove_file(file_path, stored.sha256)
+                raise
 
             try:
                 self._process_document(db, kb, doc)
             except Exception as exc:
                 db.refresh(doc)
-                raise ValueError(str(exc)) from exc
+                raise DocumentProcessingError(str(exc), self._serialize_document(doc)) from exc
 
             db.refresh(doc)
             return self._serialize_document(doc)
@@ -224,7 +323,7 @@ class KnowledgeService:
                 return False
 
             self.vector_store.delete_chunks_for_document(doc.id)
-            self._remove_file(doc.file_path)
+            self._remove_file(doc.file_path, doc.content_hash)
             db.delete(doc)
             kb.document_count = max(0, (kb.document_count or 0) - 1)
             db.commit()
@@ -485,6 +584,7 @@ class KnowledgeService:
             return {
                 "file_path": doc.file_path,
                 "original_filename": doc.original_filename,
+                "content_hash": doc.content_hash,
             }
         finally:
             db.close()
@@ -609,6 +709,13 @@ class KnowledgeService:
             db.commit()
             raise
 
+    def _validate_extension(self, filename: str) -> str:
+        extension = os.path.splitext(filename)[1].lower()
+        if not self.extractor.is_supported(extension):
+            supported = ", ".join(self.extractor.get_supported_extensions())
+            raise ValueError(f"不支持的文件格式，当前支持: {supported}")
+        return extension
+
     @staticmethod
     def _get_owned_kb(db, kb_id: int, user_id: int) -> Optional[KnowledgeBase]:
         return (
@@ -617,13 +724,8 @@ class KnowledgeService:
             .first()
         )
 
-    @staticmethod
-    def _remove_file(file_path: str) -> None:
-        if file_path and os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-            except OSError:
-                pass
+    def _remove_file(self, file_path: str, content_hash: Optional[str] = None) -> None:
+        self.content_store.release(file_path, content_hash)
 
     @staticmethod
     def _serialize_kb(kb: KnowledgeBase) -> Dict:
@@ -0,0 +1,138 @@
+"""LLM 提供商 HTTP 客户端 — 每个 worker 进程、每个提供商共享一对 httpx 连接池。
+
+职责总览：
+1) 客户端
+   - `LLMHttpClients.get()`  返回提供商的 `(httpx.Client, httpx.AsyncClient)`，传给 BaseChatOpenAI 的
+     `http_client` / `http_async_client`；同一提供商的端点池成员与摘要中间件共用同一连接池
+   - 连接上限、keep-alive 数量与空闲过期由 `LLM_HTTP_*` 配置；安装了 `h2` 时启用 HTTP/2
+     （ALPN 协商，提供商不支持时自动回落 HTTP/1.1）
+2) fork 安全
+   - 按 `os.getpid()` 懒创建：gunicorn fork 出的 worker 首次调用时各自新建，不继承父进程的 socket
+3) 连接复用统计
+   - 请求钩子给每个请求挂 httpcore `trace`，统计请求数、新建 TCP 连接数、TLS 握手数与 HTTP/2 请求数
+   - `LLMHttpClients.stats()`  `reuse_rate = 1 - 新建连接 / 请求数`，供 `GET /api/llm/routing` 展示
+
+调用方：
+- `LLMService._create_llm()` / `_create_pooled_llm()`
+
+已知局限：
+- 统计为当前 worker 进程数据
+- AsyncClient 绑定首次使用它的事件循环，只用于 ASGI 入口的单一事件循环
+"""
+import importlib.util
+import logging
+import os
+import threading
+from typing import Dict, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+_COUNTERS = ("requests", "new_connections", "tls_handshakes", "http2_requests")
+# httpcore trace 事件 → 计数字段
+_TRACE_EVENTS = {
+    "connection.connect_tcp.complete": "new_connections",
+    "connection.start_tls.complete": "tls_handshakes",
+    "http2.send_request_headers.complete": "http2_requests",
+}
+
+
+class _ConnectionStats:
+    """单个提供商连接池的计数（同步 / 异步客户端共用）。"""
+
+    def __init__(self):
+        self.counts = dict.fromkeys(_COUNTERS, 0)
+        self._lock = threading.Lock()
+
+    def incr(self, name: str) -> None:
+        with self._lock:
+            self.counts[name] += 1
+
+    def _trace(self, event_name: str, info) -> None:
+        counter = _TRACE_EVENTS.get(event_name)
+        if counter:
+            self.incr(counter)
+
+    async def _atrace(self, event_name: str, info) -> None:
+        self._trace(event_name, info)
+
+    def on_request(self, request: httpx.Request) -> None:
+        self.incr("requests")
+        request.extensions["trace"] = self._trace
+
+    async def aon_request(self, request: httpx.Request) -> None:
+        self.incr("requests")
+        request.extensions["trace"] = self._atrace
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            counts = dict(self.counts)
+        requests = counts["requests"]
+        counts["reuse_rate"] = round(1 - counts["new_connections"] / requests, 4) if requests else 0.0
+        return counts
+
+
+class LLMHttpClients:
+    """进程级 httpx 客户端注册表（按提供商）。"""
+
+    def __init__(self, config):
+        self.config = config
+        self.http2 = bool(config.LLM_HTTP2) and importlib.util.find_spec("h2") is not None
+        if config.LLM_HTTP2 and not self.http2:
+            logger.warning("LLM_HTTP2 已开启但未安装 h2，LLM 连接使用 HTTP/1.1")
+        self._clients: Dict[str, Tuple[httpx.Client, httpx.AsyncClient, _ConnectionStats]] = {}
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def get(self, provider_id: str) -> Tuple[httpx.Client, httpx.AsyncClient]:
+        """返回当前进程内该提供商的同步 / 异步客户端（不存在或 fork 后首次调用时创建）。"""
+        with self._lock:
+            if self._pid != os.getpid():
+                # fork 后的子进程：丢弃继承的客户端引用，不关闭（socket 仍属于父进程）
+                self._clients = {}
+                self._pid = os.getpid()
+            if provider_id not in self._clients:
+                self._clients[provider_id] = self._create(provider_id)
+            client, async_client, _stats = self._clients[provider_id]
+            return client, async_client
+
+    def _create(self, provider_id: str) -> Tuple[httpx.Client, httpx.AsyncClient, _ConnectionStats]:
+        limits = httpx.Limits(
+            max_connections=self.config.LLM_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=self.config.LLM_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=self.config.LLM_HTTP_KEEPALIVE_EXPIRY,
+        )
+        # 实际请求超时由 BaseChatOpenAI 的 timeout 逐请求指定，这里只是兜底
+        timeout = httpx.Timeout(self.config.LLM_HTTP_READ_TIMEOUT, connect=self.config.LLM_HTTP_CONNECT_TIMEOUT)
+        stats = _ConnectionStats()
+        client = httpx.Client(
+            limits=limits,
+            timeout=timeout,
+            http2=self.http2,
+            event_hooks={"request": [stats.on_request]},
+        )
+        async_client = httpx.AsyncClient(
+            limits=limits,
+            timeout=timeout,
+            http2=self.http2,
+            event_hooks={"request": [stats.aon_request]},
+        )
+        logger.info(
+            "LLM HTTP 客户端已创建: provider=%s pid=%s http2=%s max_connections=%s keepalive=%s",
+            provider_id,
+            os.getpid(),
+            self.http2,
+            self.config.LLM_HTTP_MAX_CONNECTIONS,
+            self.config.LLM_HTTP_MAX_KEEPALIVE,
+        )
+        return client, async_client, stats
+
+    def stats(self) -> list:
+        with self._lock:
+            if self._pid != os.getpid():
+                return []
+            return [
+                {"provider_id": provider_id, "http2": self.http2, **stats.snapshot()}
+                for provider_id, (_client, _async_client, stats) in self._clients.items()
+            ]
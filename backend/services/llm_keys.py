@@ -0,0 +1,105 @@
+"""LLM API Key 池 — 从 `api_keys` 表加载密钥，记录每个 Key 的分钟级 token 用量。
+
+职责总览：
+1) 加载
+   - `load_active_keys()`  读取某提供商全部启用的 Key（含每个 Key 的并发 / TPM 上限）
+   - `key_signature()`     Key 集合的指纹，`LLMService` 定期比较以热更新端点池
+2) TPM 预算
+   - `TokenBudget.add()`   调用结束后把实际用量计入当前分钟桶
+   - `TokenBudget.used()`  批量读取各 Key 当前分钟已用 token（选路时判断是否超预算）
+   - 有 Redis 时各 worker 共享计数（`llm:key_tpm:<key_id>:<分钟>`），否则按进程计数
+
+调用方：
+- `LLMService._create_llm()` / `_reload_endpoints()`：Key 变为端点池成员（见 `llm_router`）
+- `ProviderRouter`：选路时跳过达到并发或 TPM 上限的 Key，调用结束后记录用量
+
+已知局限：
+- TPM 按自然分钟固定桶计数，分钟边界附近可能短时超出上限
+- 并发上限按 worker 进程独立计数
+"""
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+from ..db import ApiKey, get_session
+
+TPM_KEY_PREFIX = "llm:key_tpm:"
+# 分钟桶过期时间（秒），留出跨分钟读取的余量
+_BUCKET_TTL = 120
+
+
+def load_active_keys(provider_id: str) -> Optional[List[Dict]]:
+    """读取提供商启用中的 Key；查询失败返回 None（调用方保留现有端点池）。"""
+    db = None
+    try:
+        db = get_session()
+        rows = (
+            db.query(ApiKey)
+            .filter(ApiKey.provider == provider_id, ApiKey.is_active.is_(True))
+            .order_by(ApiKey.id)
+            .all()
+        )
+        return [
+            {
+                "id": row.id,
+                "api_key": row.api_key,
+                "max_concurrency": row.max_concurrency,
+                "tpm_limit": row.tpm_limit,
+            }
+            for row in rows
+            if row.api_key
+        ]
+    except Exception as e:
+        print(f"Load api keys error: {e}")
+        return None
+    finally:
+        if db is not None:
+            db.close()
+
+
+def key_signature(keys: Iterable[Dict]) -> tuple:
+    return tuple((k["id"], k["api_key"], k["max_concurrency"], k["tpm_limit"]) for k in keys)
+
+
+class TokenBudget:
+    """每个 Key 当前分钟已用 token 计数。"""
+
+    def __init__(self, redis_client=None):
+        self.redis_client = redis_client
+        self._local: Dict[tuple, int] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _minute() -> int:
+        return int(time.time() // 60)
+
+    def add(self, key_id: int, tokens: int) -> None:
+        if not tokens:
+            return
+        minute = self._minute()
+        if self.redis_client is not None:
+            try:
+                key = f"{TPM_KEY_PREFIX}{key_id}:{minute}"
+                pipe = self.redis_client.pipeline()
+                pipe.incrby(key, tokens)
+                pipe.expire(key, _BUCKET_TTL)
+                pipe.execute()
+                return
+            except Exception as e:
+                print(f"Token budget redis error: {e}")
+        with self._lock:
+            self._local = {k: v for k, v in self._local.items() if k[1] >= minute - 1}
+            self._local[(key_id, minute)] = self._local.get((key_id, minute), 0) + tokens
+
+    def used(self, key_ids: List[int]) -> Dict[int, int]:
+        if not key_ids:
+            return {}
+        minute = self._minute()
+        if self.redis_client is not None:
+            try:
+                values = self.redis_client.mget([f"{TPM_KEY_PREFIX}{key_id}:{minute}" for key_id in key_ids])
+                return {key_id: int(value or 0) for key_id, value in zip(key_ids, values)}
+            except Exception as e:
+                print(f"Token budget redis error: {e}")
+        with self._lock:
+            return {key_id: self._local.get((key_id, minute), 0) for key_id in key_ids}
@@ -0,0 +1,382 @@
+"""LLM 端点池路由 — 同一逻辑模型的多个 base_url / API Key 之间按延迟与错误率选路。
+
+职责总览：
+1) 端点统计
+   - `LLMEndpoint`      单个端点的 BaseChatOpenAI 实例与统计：首 token 延迟 EWMA、错误率 EWMA、
+     进行中请求数、累计请求 / 失败 / 转移次数、冷却截止时刻；来自 `api_keys` 表的端点
+     还带 Key ID 与并发 / TPM 上限
+2) 选路
+   - `ProviderRouter.ranked()`  按得分排序：`(首token延迟 + 0.05s) × (1 + 进行中) / (1 - 错误率)`，
+     未测量过的端点延迟按 0 计（优先探测），冷却中的端点排在最后（全部冷却时仍会尝试）；
+     达到并发或当前分钟 TPM 上限的 Key 不参与本次选路
+   - `ProviderRouter.begin()`  在同一把锁内检查并发上限并占用名额；轮到某个端点时它已满
+     （被其他请求抢先）则跳过，故障转移同样逐个重新检查
+   - 全部 Key 都已满时等待最多 `acquire_timeout` 秒，仍无可用 Key 则抛出 `LLMPoolExhausted`
+3) 故障转移
+   - `RoutedChatModel`  LangChain 聊天模型包装：按排名依次尝试端点，连接失败 / 超时 / 429 / 5xx
+     且尚未产出任何 chunk 时换下一个端点；已开始输出后出错直接抛出（避免重复正文）
+   - 429 的 Key 进入冷却，后续请求轮换到其他 Key
+4) 热更新
+   - 每 `reload_interval` 秒调用 `reloader` 检查 Key 是否变化，变化时原地替换端点列表
+     （沿用未变端点的统计；进行中的调用继续使用旧端点直到结束）
+5) 统计
+   - `ProviderRouter.snapshot()`  供 `GET /api/llm/routing` 展示（不含 API Key）
+
+调用方：
+- `LLMService._create_llm()`：提供商配置了多个 `endpoints`、`api_keys` 表中有启用的 Key，
+  或开启了 Key 热更新（`LLM_KEY_RELOAD_INTERVAL > 0`，池内可能只有一个默认成员）时返回 `RoutedChatModel`
+
+已知局限：
+- 统计与并发计数为进程内数据，各 gunicorn worker 独立学习；TPM 计数有 Redis 时跨 worker 共享
+- 非流式调用（如摘要中间件）只计错误率，不计入首 token 延迟
+"""
+import asyncio
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+import openai
+from langchain_core.language_models import BaseChatModel
+from langchain_openai.chat_models.base import BaseChatOpenAI
+from pydantic import ConfigDict
+
+# 首 token 前遇到这些错误时转移到下一个端点（APITimeoutError 是 APIConnectionError 的子类）
+FAILOVER_ERRORS = (
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+# 得分中的延迟下限（秒），避免新端点 / 极快端点的进行中请求数失去作用
+_LATENCY_FLOOR = 0.05
+# 错误率上限，避免分母为 0
+_MAX_ERROR_RATE = 0.95
+# 全部 Key 已满时重新选路的间隔（秒）
+ACQUIRE_POLL_INTERVAL = 0.2
+
+
+class LLMPoolExhausted(RuntimeError):
+    """端点池内所有 Key 均已达到并发或 TPM 上限。"""
+
+
+class LLMEndpoint:
+    """端点池中的一个 OpenAI 兼容端点。"""
+
+    def __init__(
+            self,
+            name: str,
+            llm: BaseChatOpenAI,
+            key_id: Optional[int] = None,
+            max_concurrency: int = 0,
+            tpm_limit: int = 0,
+            pooled: bool = True,
+    ):
+        self.name = name
+        self.llm = llm
+        # 多成员池的实例不做同端点重试；池内只有一个成员时使用单端点设置
+        self.pooled = pooled
+        # 来自 api_keys 表的端点：Key ID 与上限（0 表示不限）
+        self.key_id = key_id
+        self.max_concurrency = max_concurrency
+        self.tpm_limit = tpm_limit
+        self.latency_ewma: Optional[float] = None
+        self.error_rate = 0.0
+        self.inflight = 0
+        self.requests = 0
+        self.failures = 0
+        self.failovers = 0
+        self.cooldown_until = 0.0
+
+    def score(self) -> float:
+        latency = (self.latency_ewma or 0.0) + _LATENCY_FLOOR
+        return latency * (1 + self.inflight) / (1 - min(self.error_rate, _MAX_ERROR_RATE))
+
+
+class ProviderRouter:
+    """一个提供商的端点池：线程安全地记录统计并给出尝试顺序。"""
+
+    def __init__(
+            self,
+            provider_id: str,
+            endpoints: List[LLMEndpoint],
+            alpha: float,
+            cooldown: float,
+            budget=None,
+            acquire_timeout: float = 0.0,
+            reloader: Optional[Callable[[], Optional[List[LLMEndpoint]]]] = None,
+            reload_interval: float = 0.0,
+    ):
+        self.provider_id = provider_id
+        self.endpoints = endpoints
+        self.alpha = alpha
+        self.cooldown = cooldown
+        self.budget = budget
+        self.acquire_timeout = acquire_timeout
+        self.reloader = reloader
+        self.reload_interval = reload_interval
+        self._next_reload = time.monotonic() + reload_interval
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+
+    @staticmethod
+    def endpoint_name(base_url: str, index: int) -> str:
+        return f"{urlparse(base_url).netloc or base_url}#{index}"
+
+    @staticmethod
+    def key_endpoint_name(base_url: str, key_id: int) -> str:
+        return f"{urlparse(base_url).netloc or base_url}#key{key_id}"
+
+    def ranked(self) -> List[LLMEndpoint]:
+        """本次调用的尝试顺序；达到并发或 TPM 上限的 Key 被排除（可能返回空列表）。"""
+        self._maybe_reload()
+        tpm_used = self._tpm_used()
+        now = time.monotonic()
+        with self._lock:
+            available = [
+                e for e in self.endpoints
+                if not (e.max_concurrency and e.inflight >= e.max_concurrency)
+                and not (e.tpm_limit and tpm_used.get(e.key_id, 0) >= e.tpm_limit)
+            ]
+            return sorted(available, key=lambda e: (e.cooldown_until > now, e.score()))
+
+    def _tpm_used(self) -> Dict[int, int]:
+        if self.budget is None:
+            return {}
+        key_ids = [e.key_id for e in self.endpoints if e.tpm_limit and e.key_id is not None]
+        return self.budget.used(key_ids)
+
+    def _maybe_reload(self) -> None:
+        """到期时检查 Key 变化；同一时刻只有一个线程执行，其余线程不等待。"""
+        if self.reloader is None or time.monotonic() < self._next_reload:
+            return
+        if not self._reload_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_reload = time.monotonic() + self.reload_interval
+            endpoints = self.reloader()
+            if endpoints is not None:
+                with self._lock:
+                    self.endpoints = endpoints
+        finally:
+            self._reload_lock.release()
+
+    def record_tokens(self, endpoint: LLMEndpoint, tokens: int) -> None:
+        if self.budget is not None and endpoint.key_id is not None:
+            self.budget.add(endpoint.key_id, tokens)
+
+    def begin(self, endpoint: LLMEndpoint) -> Optional[float]:
+        """原子地检查并发上限并占用一个名额，返回开始时刻；Key 已满返回 None。"""
+        with self._lock:
+            if endpoint.max_concurrency and endpoint.inflight >= endpoint.max_concurrency:
+                return None
+            endpoint.inflight += 1
+            endpoint.requests += 1
+        return time.monotonic()
+
+    def end(self, endpoint: LLMEndpoint) -> None:
+        with self._lock:
+            endpoint.inflight -= 1
+
+    def record_success(self, endpoint: LLMEndpoint, latency: Optional[float] = None) -> None:
+        with self._lock:
+            if latency is not None:
+                endpoint.latency_ewma = latency if endpoint.latency_ewma is None else (
+                    self.alpha * latency + (1 - self.alpha) * endpoint.latency_ewma
+                )
+            endpoint.error_rate *= 1 - self.alpha
+            endpoint.cooldown_until = 0.0
+
+    def record_failure(self, endpoint: LLMEndpoint, failover: bool = False) -> None:
+        with self._lock:
+            endpoint.error_rate = self.alpha + (1 - self.alpha) * endpoint.error_rate
+            endpoint.failures += 1
+            if failover:
+                endpoint.failovers += 1
+                endpoint.cooldown_until = time.monotonic() + self.cooldown
+
+    def snapshot(self) -> Dict:
+        tpm_used = self._tpm_used()
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "provider_id": self.provider_id,
+                "endpoints": [
+                    {
+                        "name": e.name,
+                        "key_id": e.key_id,
+                        "max_concurrency": e.max_concurrency,
+                        "tpm_limit": e.tpm_limit,
+                        "tpm_used": tpm_used.get(e.key_id, 0),
+                        "latency_ewma_ms": round(e.latency_ewma * 1000, 1) if e.latency_ewma is not None else None,
+                        "error_rate": round(e.error_rate, 4),
+                        "inflight": e.inflight,
+                        "requests": e.requests,
+                        "failures": e.failures,
+                        "failovers": e.failovers,
+                        "cooling_down": e.cooldown_until > now,
+                        "score": round(e.score(), 4),
+                    }
+                    for e in self.endpoints
+                ],
+            }
+
+
+class RoutedChatModel(BaseChatModel):
+    """把调用路由到端点池中当前最优的 BaseChatOpenAI，首 token 前失败时故障转移。"""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True, protected_namespaces=())
+
+    router: Any
+    model_name: str = ""
+    streaming: bool = True
+
+    @property
+    def _llm_type(self) -> str:
+        return "routed-openai-compatible"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"provider_id": self.router.provider_id, "model_name": self.model_name}
+
+    def bind_tools(self, tools, *, tool_choice=None, **kwargs):
+        """工具格式化沿用 BaseChatOpenAI，绑定参数随调用透传给被选中的端点。"""
+        bound = self.router.endpoints[0].llm.bind_tools(tools, tool_choice=tool_choice, **kwargs)
+        return self.bind(**bound.kwargs)
+
+    def _attempts(self):
+        """依次产出已占用并发名额的 `(端点, 开始时刻)`；本轮没有任何端点可占用时等待后重新选路。"""
+        deadline = time.monotonic() + self.router.acquire_timeout
+        while True:
+            attempted = False
+            for endpoint in self.router.ranked():
+                started = self.router.begin(endpoint)
+                if started is None:
+                    continue
+                attempted = True
+                yield endpoint, started
+            if attempted:
+                return
+            if time.monotonic() >= deadline:
+                raise LLMPoolExhausted(f"模型提供商 {self.router.provider_id} 的 API Key 均已达到并发或 TPM 上限")
+            time.sleep(ACQUIRE_POLL_INTERVAL)
+
+    async def _aattempts(self):
+        """`_attempts()` 的异步版本。"""
+        deadline = time.monotonic() + self.router.acquire_timeout
+        while True:
+            attempted = False
+            # 选路可能读 Redis（TPM）或 MySQL（Key 热更新），放到线程池
+            for endpoint in await asyncio.to_thread(self.router.ranked):
+                started = self.router.begin(endpoint)
+                if started is None:
+                    continue
+                attempted = True
+                yield endpoint, started
+            if attempted:
+                return
+            if time.monotonic() >= deadline:
+                raise LLMPoolExhausted(f"模型提供商 {self.router.provider_id} 的 API Key 均已达到并发或 TPM 上限")
+            await asyncio.sleep(ACQUIRE_POLL_INTERVAL)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        last_error = None
+        for endpoint, started in self._attempts():
+            emitted = False
+            tokens = 0
+            try:
+                for chunk in endpoint.llm._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                    if not emitted:
+                        emitted = True
+                        self.router.record_success(endpoint, time.monotonic() - started)
+                    tokens += _chunk_tokens(chunk)
+                    yield chunk
+                if not emitted:
+                    self.router.record_success(endpoint, time.monotonic() - started)
+                return
+            except FAILOVER_ERRORS as e:
+                self.router.record_failure(endpoint, failover=not emitted)
+                if emitted:
+                    raise
+                print(f"LLM endpoint {endpoint.name} failed before first token, failing over: {e}")
+                last_error = e
+            finally:
+                self.router.end(endpoint)
+                self.router.record_tokens(endpoint, tokens)
+        raise last_error
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        last_error = None
+        async for endpoint, started in self._aattempts():
+            emitted = False
+            tokens = 0
+            try:
+                async for chunk in endpoint.llm._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                    if not emitted:
+                        emitted = True
+                        self.router.record_success(endpoint, time.monotonic() - started)
+                    tokens += _chunk_tokens(chunk)
+                    yield chunk
+                if not emitted:
+                    self.router.record_success(endpoint, time.monotonic() - started)
+                return
+            except FAILOVER_ERRORS as e:
+                self.router.record_failure(endpoint, failover=not emitted)
+                if emitted:
+                    raise
+                print(f"LLM endpoint {endpoint.name} failed before first token, failing over: {e}")
+                last_error = e
+            finally:
+                self.router.end(endpoint)
+                self.router.record_tokens(endpoint, tokens)
+        raise last_error
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        last_error = None
+        for endpoint, _started in self._attempts():
+            tokens = 0
+            try:
+                result = endpoint.llm._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+                self.router.record_success(endpoint)
+                tokens = _result_tokens(result)
+                return result
+            except FAILOVER_ERRORS as e:
+                self.router.record_failure(endpoint, failover=True)
+                print(f"LLM endpoint {endpoint.name} failed, failing over: {e}")
+                last_error = e
+            finally:
+                self.router.end(endpoint)
+                self.router.record_tokens(endpoint, tokens)
+        raise last_error
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        last_error = None
+        async for endpoint, _started in self._aattempts():
+            tokens = 0
+            try:
+                result = await endpoint.llm._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+                self.router.record_success(endpoint)
+                tokens = _result_tokens(result)
+                return result
+            except FAILOVER_ERRORS as e:
+                self.router.record_failure(endpoint, failover=True)
+                print(f"LLM endpoint {endpoint.name} failed, failing over: {e}")
+                last_error = e
+            finally:
+                self.router.end(endpoint)
+                self.router.record_tokens(endpoint, tokens)
+        raise last_error
+
+
+def _chunk_tokens(chunk) -> int:
+    """流式 chunk 上的用量（开启 `stream_usage` 时仅最后一个 chunk 带 usage_metadata）。"""
+    usage = getattr(chunk.message, "usage_metadata", None)
+    return int(usage.get("total_tokens", 0)) if usage else 0
+
+
+def _result_tokens(result) -> int:
+    total = 0
+    for generation in result.generations:
+        usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+        if usage:
+            total += int(usage.get("total_tokens", 0))
+    return total
@@ -6,13 +6,30 @@
    - `get_available_providers()`  返回可用提供商列表
 2) 配置
    - `get_provider_config()`  读取指定提供商配置
+3) 端点池
+   - 提供商配置了多个 `endpoints` 时 `get_llm()` 返回 `RoutedChatModel`（见 `llm_router`），
+     按首 token 延迟与错误率选端点，首 token 前失败自动转移
+   - `api_keys` 表中有该提供商启用的 Key 时，这些 Key 替代 `DEEPSEEK_API_KEY` 成为池成员，
+     各自受并发 / TPM 上限约束；每 `LLM_KEY_RELOAD_INTERVAL` 秒检查表内变化并热更新
+   - 开启热更新时即使首次使用时表内没有 Key 也创建端点池（仅一个默认成员），之后新增的 Key
+     会在下次检查时加入；只有一个成员时沿用单端点的重试与超时设置
+   - `get_routing_stats()`  各端点池的路由统计
+4) HTTP 连接
+   - 所有 BaseChatOpenAI 使用 `LLMHttpClients` 中按提供商共享的 httpx 客户端（见 `llm_http`），
+     连接超时与读超时分开配置；fork 后的 worker 首次调用时重建模型实例与连接池
 """
+import os
 import threading
-from typing import Dict, List
+from typing import Dict, List, Optional
 
+import httpx
 from langchain_core.language_models import BaseChatModel
 from langchain_openai.chat_models.base import BaseChatOpenAI
 
+from .llm_http import LLMHttpClients
+from .llm_keys import TokenBudget, key_signature, load_active_keys
+from .llm_router import LLMEndpoint, ProviderRouter, RoutedChatModel
+
 
 class LLMService:
     """统一管理多个 LLM 提供商，全局单例，跨请求共享模型实例缓存。"""
@@ -43,6 +60,10 @@ class LLMService:
         
         self.config = config
         self._llm_instances = {}  # 全局缓存模型实例（跨请求共享）
+        self._routers: Dict[str, ProviderRouter] = {}  # 配置了端点池的提供商
+        self._key_signatures: Dict[str, tuple] = {}  # 各提供商当前生效的 api_keys 指纹
+        self._http_clients = LLMHttpClients(config)
+        self._pid = os.getpid()
         self._initialized = True
     
     def get_llm(self, provider_id: str) -> BaseChatModel:
@@ -53,11 +74,15 @@ class LLMService:
         - 参数: `provider_id` — 如 `deepseek`
         - 返回值: LangChain `BaseChatOpenAI` 实例
         """
+        if self._pid != os.getpid():
+            # fork 出的 worker 不沿用父进程创建的模型实例（其 httpx 连接属于父进程）
+            self._llm_instances, self._routers, self._key_signatures = {}, {}, {}
+            self._pid = os.getpid()
         if provider_id not in self._llm_instances:
             self._llm_instances[provider_id] = self._create_llm(provider_id)
         return self._llm_instances[provider_id]
     
-    def _create_llm(self, provider_id: str) -> BaseChatOpenAI:
+    def _create_llm(self, provider_id: str) -> BaseChatModel:
         """
         创建模型实例
         
@@ -65,7 +90,7 @@ class LLMService:
             provider_id: 模型提供商ID
             
         Returns:
-            BaseChatOpenAI 实例
+            BaseChatOpenAI 实例；配置了多个端点时为 RoutedChatModel
         """
         if provider_id not in self.config.LLM_PROVIDERS:
             raise ValueError(f"不支持的模型提供商: {provider_id}")
@@ -74,24 +99,206 @@ class LLMService:
         if not provider_config.get('enabled', True):
             raise ValueError(f"模型提供商 {provider_id} 已禁用")
         
+        endpoints = provider_config.get('endpoints') or []
+        keys = load_active_keys(provider_id) or []
+        # 开启 Key 热更新时总是建端点池，表内暂时没有 Key 的提供商之后也能接入新 Key
+        if keys or len(endpoints) > 1 or self.config.LLM_KEY_RELOAD_INTERVAL > 0:
+            return self._create_routed_llm(provider_id, provider_config, keys)
+
         # 获取 API Key
+        base_url = provider_config['base_url']
         api_key = self._get_api_key(provider_id)
-        
+        if endpoints:
+            base_url = endpoints[0]['base_url']
+            api_key = endpoints[0].get('api_key') or api_key
+        return self._create_single_llm(provider_id, provider_config, base_url, api_key)
+
+    def _create_single_llm(
+            self,
+            provider_id: str,
+            provider_config: Dict,
+            base_url: str,
+            api_key: str,
+    ) -> BaseChatOpenAI:
+        """单端点实例：无处可转移，由 SDK 对同一端点重试，读超时使用 `LLM_HTTP_READ_TIMEOUT`。"""
         # OpenAI 兼容 API（DeepSeek 等）使用 BaseChatOpenAI，而非官方 OpenAI 专用的 ChatOpenAI
         # profile.max_input_tokens 供 SummarizationMiddleware 的 fraction 触发使用
         max_context = provider_config.get('max_context_length', 32768)
-        llm = BaseChatOpenAI(
-            base_url=provider_config['base_url'],
+        http_client, http_async_client = self._http_clients.get(provider_id)
+        return BaseChatOpenAI(
+            base_url=base_url,
             api_key=api_key,
             model=provider_config['model_name'],
             # temperature=0.7,  # 这里不设置温度,使用后端用户提供的默认值
             streaming=True,
-            timeout=600,  # 设置超时时间为 600 秒
+            # 自定义 base_url 时默认不请求流式 usage；开启后才能拿到用量与缓存命中 token 数
+            stream_usage=True,
+            # 读超时即首 token 与 token 间隔上限（默认 600 秒）；连接超时单独设置，握手卡住时尽快失败
+            timeout=httpx.Timeout(
+                self.config.LLM_HTTP_READ_TIMEOUT,
+                connect=self.config.LLM_HTTP_CONNECT_TIMEOUT,
+            ),
             max_retries=2,
+            http_client=http_client,
+            http_async_client=http_async_client,
             profile={"max_input_tokens": max_context},
         )
-        
-        return llm
+
+    def _create_routed_llm(self, provider_id: str, provider_config: Dict, keys: List[Dict]) -> RoutedChatModel:
+        """把端点池成员包装为 RoutedChatModel，并挂上 TPM 计数与 Key 热更新。"""
+        router = ProviderRouter(
+            provider_id,
+            self._build_endpoints(provider_id, provider_config, keys, existing={}),
+            alpha=self.config.LLM_POOL_EWMA_ALPHA,
+            cooldown=self.config.LLM_POOL_COOLDOWN,
+            budget=TokenBudget(self.config.REDIS_CLIENT),
+            acquire_timeout=self.config.LLM_KEY_ACQUIRE_TIMEOUT,
+            reloader=(lambda: self._reload_endpoints(provider_id)) if self.config.LLM_KEY_RELOAD_INTERVAL > 0 else None,
+            reload_interval=self.config.LLM_KEY_RELOAD_INTERVAL,
+        )
+        self._routers[provider_id] = router
+        self._key_signatures[provider_id] = key_signature(keys)
+        return RoutedChatModel(
+            router=router,
+            model_name=provider_config['model_name'],
+            streaming=True,
+            profile={"max_input_tokens": provider_config.get('max_context_length', 32768)},
+        )
+
+    def _build_endpoints(
+            self,
+            provider_id: str,
+            provider_config: Dict,
+            keys: List[Dict],
+            existing: Dict[str, LLMEndpoint],
+    ) -> List[LLMEndpoint]:
+        """端点池成员：配置的 `endpoints` + `api_keys` 表中的 Key（连到提供商 `base_url`）。
+
+        表中无 Key 时回退到 `DEEPSEEK_API_KEY`；`existing` 中同名、密钥未变且池规模（单成员 / 多成员）
+        未变的端点原样沿用（保留统计）。
+        """
+        default_key = provider_config.get('api_key')
+        endpoints = provider_config.get('endpoints') or []
+        if not endpoints and not keys:
+            endpoints = [{'base_url': provider_config['base_url'], 'api_key': ''}]
+        pooled = len(endpoints) + len(keys) > 1
+
+        members = []
+        for index, endpoint in enumerate(endpoints):
+            name = ProviderRouter.endpoint_name(endpoint['base_url'], index)
+            member = existing.get(name)
+            if member is not None and member.pooled == pooled:
+                members.append(member)
+                continue
+            api_key = endpoint.get('api_key') or default_key
+            if not api_key:
+                raise ValueError(f"模型提供商 {provider_id} 的端点 {endpoint['base_url']} 未配置 API Key")
+            members.append(LLMEndpoint(
+                name,
+                self._create_member_llm(provider_id, provider_config, endpoint['base_url'], api_key, pooled),
+                pooled=pooled,
+            ))
+
+        for key in keys:
+            name = ProviderRouter.key_endpoint_name(provider_config['base_url'], key['id'])
+            max_concurrency = key['max_concurrency']
+            if max_concurrency is None:
+                max_concurrency = self.config.LLM_KEY_MAX_CONCURRENCY
+            tpm_limit = key['tpm_limit']
+            if tpm_limit is None:
+                tpm_limit = self.config.LLM_KEY_TPM_LIMIT
+
+            member = existing.get(name)
+            if (
+                    member is None
+                    or member.pooled != pooled
+                    or member.llm.openai_api_key.get_secret_value() != key['api_key']
+            ):
+                member = LLMEndpoint(
+                    name,
+                    self._create_member_llm(
+                        provider_id, provider_config, provider_config['base_url'], key['api_key'], pooled,
+                    ),
+                    key_id=key['id'],
+                    pooled=pooled,
+                )
+            member.max_concurrency = max_concurrency
+            member.tpm_limit = tpm_limit
+            members.append(member)
+        return members
+
+    def _create_member_llm(
+            self,
+            provider_id: str,
+            provider_config: Dict,
+            base_url: str,
+            api_key: str,
+            pooled: bool,
+    ) -> BaseChatOpenAI:
+        if pooled:
+            return self._create_pooled_llm(provider_id, provider_config, base_url, api_key)
+        return self._create_single_llm(provider_id, provider_config, base_url, api_key)
+
+    def _create_pooled_llm(
+            self,
+            provider_id: str,
+            provider_config: Dict,
+            base_url: str,
+            api_key: str,
+    ) -> BaseChatOpenAI:
+        """池内端点不做同端点重试（`max_retries=0`），读超时缩短为 `LLM_POOL_READ_TIMEOUT`，
+        失败时直接交给路由转移到下一个端点；同一提供商的成员共用一个 httpx 连接池。
+        """
+        http_client, http_async_client = self._http_clients.get(provider_id)
+        return BaseChatOpenAI(
+            base_url=base_url,
+            api_key=api_key,
+            model=provider_config['model_name'],
+            streaming=True,
+            stream_usage=True,
+            timeout=httpx.Timeout(
+                600,
+                connect=self.config.LLM_POOL_CONNECT_TIMEOUT,
+                read=self.config.LLM_POOL_READ_TIMEOUT,
+            ),
+            max_retries=0,
+            http_client=http_client,
+            http_async_client=http_async_client,
+            profile={"max_input_tokens": provider_config.get('max_context_length', 32768)},
+        )
+
+    def _reload_endpoints(self, provider_id: str) -> Optional[List[LLMEndpoint]]:
+        """`api_keys` 表有变化时返回新的成员列表，否则返回 None（由 `ProviderRouter` 定期调用）。"""
+        keys = load_active_keys(provider_id)
+        signature = key_signature(keys) if keys is not None else None
+        if signature is None or signature == self._key_signatures.get(provider_id):
+            return None
+
+        router = self._routers.get(provider_id)
+        if router is None:
+            return None
+        existing = {endpoint.name: endpoint for endpoint in router.endpoints}
+        try:
+            members = self._build_endpoints(provider_id, self.config.LLM_PROVIDERS[provider_id], keys, existing)
+        except ValueError as e:
+            print(f"Reload api keys error: {e}")
+            return None
+        self._key_signatures[provider_id] = signature
+        print(f"API key pool for {provider_id} reloaded: {len(keys)} active key(s)")
+        return members
+
+    def get_routing_stats(self) -> List[Dict]:
+        """返回已创建的端点池路由统计（关闭 Key 热更新时，单端点提供商不在其中）。
+
+        用法:
+        - 调用方: `GET /api/llm/routing`
+        - 返回值: `[{ provider_id, endpoints: [{ name, latency_ewma_ms, error_rate, ... }] }]`
+        """
+        return [router.snapshot() for router in self._routers.values()]
+
+    def get_http_stats(self) -> List[Dict]:
+        """当前 worker 各提供商 httpx 连接池的请求数、新建连接数与复用率。"""
+        return self._http_clients.stats()
     
     def _get_api_key(self, provider_id: str) -> str:
         """从配置读取 API Key（DeepSeek 来自 DEEPSEEK_API_KEY 环境变量）。"""
@@ -0,0 +1,327 @@
+"""语义回答缓存 — 相似问题直接回放历史回答，跳过 LLM。
+
+职责总览：
+1) 资格判断
+   - `ResponseCache.eligible()`  仅新会话首轮、无附件、未选知识库的提问参与缓存
+     （回答只取决于问题本身与固定的系统提示，不含会话上下文或用户数据）
+2) 查找与写入
+   - `ResponseCache.lookup()`  归一化问题 → embedding → 同一提供商、同一缓存范围下未过期的最近邻，
+     余弦相似度 ≥ `RESPONSE_CACHE_THRESHOLD` 时返回缓存回答
+   - `ResponseCache.store()`   回答正常结束且未调用工具时写入，同一问题覆盖旧回答并续期
+3) 回放
+   - `replay_events()`  把缓存回答切片为 content 事件 + `done(cached=True)`，与 Agent 流格式一致
+4) 命中率
+   - `ResponseCache.stats()`  Redis 计数器 hits / misses / stores 与 hit_rate（管理统计展示）
+
+数据表 `chat_response_cache`（PostgreSQL，与知识库共用连接池）：
+- `provider_id` 隔离不同模型的回答；`expires_at` 过期后不再命中，写入时顺带清理
+- `scope` 隔离缓存范围：`RESPONSE_CACHE_SCOPE=user`（默认）时为 `user:<用户ID>`，只回放本人问过的回答；
+  `global` 时为空字符串，所有用户共享同一提供商下的回答
+- embedding 维度随 `KB_EMBEDDING_DIMENSION`，变化或缺少 `scope` 列（旧表）时直接重建表（缓存可丢弃）
+
+相关配置（`Config` / `.env`）：
+- `RESPONSE_CACHE_ENABLED`    是否启用（默认关闭；还需配置 `KB_EMBEDDING_API_URL`）
+- `RESPONSE_CACHE_THRESHOLD`  命中所需的最小余弦相似度
+- `RESPONSE_CACHE_TTL`        缓存回答有效期（秒）
+- `RESPONSE_CACHE_SCOPE`      `user` 按用户隔离；`global` 跨用户共享
+
+已知局限：
+- 每个符合条件的首轮提问多一次 embedding 请求；embedding 或 PG 异常时视为未命中
+- 时效性问题若未触发工具调用，仍可能在 TTL 内回放旧回答
+- `global` 范围下，一个用户提问中的个人信息及其回答会回放给问了相似问题的其他用户；
+  资格判断只排除附件与知识库，无法识别正文中的个人信息，多用户部署请保持 `user`
+- `user` 范围按 `(provider_id, scope)` B-tree 取出本人的缓存行后精确计算距离（不走 HNSW，
+  避免近邻候选被其他用户的条目占满而漏掉本人的相似问题）；单个用户缓存条数大时查找变慢
+"""
+import hashlib
+import logging
+import re
+from typing import Dict, Iterator, List, Optional
+
+from .chat_events import ChatEvent, content_event, done_event
+from .knowledge.embedding_client import EmbeddingClient
+
+logger = logging.getLogger(__name__)
+
+STATS_KEY = "chat:response_cache:stats"
+# 回放时每个 content 事件的字符数，保持前端逐段渲染的体验
+REPLAY_CHUNK_CHARS = 32
+# 首尾标点不影响语义，归一化时去掉
+_EDGE_PUNCTUATION = " \t\r\n?？!！.。,，;；~"
+
+
+def normalize_question(message: str) -> str:
+    """小写、合并空白、去掉首尾标点。"""
+    text = re.sub(r"\s+", " ", (message or "").lower())
+    return text.strip(_EDGE_PUNCTUATION)
+
+
+def replay_events(answer: str) -> Iterator[ChatEvent]:
+    """把缓存回答切片为 content 事件，最后一条 done 带 `cached` 标记。"""
+    for start in range(0, len(answer), REPLAY_CHUNK_CHARS):
+        yield content_event(answer[start:start + REPLAY_CHUNK_CHARS])
+    done = done_event([])
+    done.data["cached"] = True
+    yield done
+
+
+class ResponseCache:
+    """基于 pgvector 的语义回答缓存。"""
+
+    _schema_dimension: Optional[int] = None
+
+    def __init__(self, config):
+        self.config = config
+        self.redis_client = config.REDIS_CLIENT
+        self.embedding_client = EmbeddingClient(config)
+        self.threshold = config.RESPONSE_CACHE_THRESHOLD
+        self.ttl = config.RESPONSE_CACHE_TTL
+        self.scope = config.RESPONSE_CACHE_SCOPE
+        self._store = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.config.RESPONSE_CACHE_ENABLED) and self.embedding_client.enabled
+
+    def eligible(self, *, is_first_turn: bool, file_ids=None, knowledge_base_ids=None) -> bool:
+        """只缓存与上下文无关的提问：新会话首轮、无附件、未选知识库。"""
+        return self.enabled and is_first_turn and not file_ids and not knowledge_base_ids
+
+    def embed(self, message: str) -> Optional[List[float]]:
+        """归一化后向量化；失败返回 None（调用方按未命中处理）。"""
+        question = normalize_question(message)
+        if not question:
+            return None
+        try:
+            return self.embedding_client.embed_query(question)
+        except Exception as e:
+            print(f"Response cache embedding error: {e}")
+            return None
+
+    def scope_for(self, user_id: int) -> str:
+        """缓存范围：`user` 时按用户隔离，`global` 时所有用户共享（空字符串）。"""
+        return "" if self.scope == "global" else f"user:{user_id}"
+
+    def lookup(self, provider_id: str, user_id: int, embedding: Optional[List[float]]) -> Optional[str]:
+        """返回相似度达到阈值的缓存回答，并计入 hits / misses。"""
+        answer = None
+        if embedding is not None:
+            try:
+                answer = self._search(provider_id, self.scope_for(user_id), embedding)
+            except Exception as e:
+                print(f"Response cache lookup error: {e}")
+        self._incr("hits" if answer else "misses")
+        return answer
+
+    def store(
+            self,
+            provider_id: str,
+            user_id: int,
+            message: str,
+            embedding: Optional[List[float]],
+            answer: str,
+    ) -> None:
+        """写入一条回答；同一提供商、同一范围下归一化文本相同的问题覆盖旧记录。"""
+        question = normalize_question(message)
+        if embedding is None or not question or not answer:
+            return
+        scope = self.scope_for(user_id)
+        question_hash = hashlib.sha256(question.encode("utf-8")).hexdigest()
+        vector = self._vector_store()._vector_literal(embedding)
+
+        def _insert(conn):
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM chat_response_cache WHERE expires_at < NOW()")
+                cur.execute(
+                    """
+                    INSERT INTO chat_response_cache
+                        (provider_id, scope, question_hash, question, embedding, answer, expires_at)
+                    VALUES (%s, %s, %s, %s, %s::vector, %s, NOW() + make_interval(secs => %s))
+                    ON CONFLICT (provider_id, scope, question_hash) DO UPDATE
+                    SET embedding = EXCLUDED.embedding,
+                        answer = EXCLUDED.answer,
+                        created_at = NOW(),
+                        expires_at = EXCLUDED.expires_at
+                    """,
+                    (provider_id, scope, question_hash, question, vector, answer, self.ttl),
+                )
+            conn.commit()
+
+        try:
+            self._run_pg(_insert)
+            self._incr("stores")
+        except Exception as e:
+            print(f"Response cache store error: {e}")
+
+    def stats(self) -> Dict:
+        """命中率统计；未连接 Redis 时各项为 0。"""
+        counters = {}
+        if self.redis_client is not None:
+            try:
+                counters = self.redis_client.hgetall(STATS_KEY) or {}
+            except Exception as e:
+                print(f"Response cache stats error: {e}")
+        hits = int(counters.get("hits", 0))
+        misses = int(counters.get("misses", 0))
+        lookups = hits + misses
+        return {
+            "enabled": self.enabled,
+            "scope": self.scope,
+            "hits": hits,
+            "misses": misses,
+            "stores": int(counters.get("stores", 0)),
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def _search(self, provider_id: str, scope: str, embedding: List[float]) -> Optional[str]:
+        vector = self._vector_store()._vector_literal(embedding)
+
+        def _query(conn):
+            with conn.cursor() as cur:
+                if scope:
+                    # 按用户隔离：HNSW 只返回约 ef_search 个全局近邻，再按范围过滤会漏掉本人的条目；
+                    # MATERIALIZED 强制先用 B-tree 取出该范围的行，再精确排序
+                    cur.execute(
+                        """
+                        WITH candidates AS MATERIALIZED (
+                            SELECT answer, embedding
+                            FROM chat_response_cache
+                            WHERE provider_id = %s AND scope = %s AND expires_at > NOW()
+                        )
+                        SELECT answer, 1 - (embedding <=> %s::vector) AS similarity
+                        FROM candidates
+                        ORDER BY embedding <=> %s::vector
+                        LIMIT 1
+                        """,
+                        (provider_id, scope, vector, vector),
+                    )
+                else:
+                    cur.execute(
+                        """
+                        SELECT answer, 1 - (embedding <=> %s::vector) AS similarity
+                        FROM chat_response_cache
+                        WHERE provider_id = %s AND scope = %s AND expires_at > NOW()
+                        ORDER BY embedding <=> %s::vector
+                        LIMIT 1
+                        """,
+                        (vector, provider_id, scope, vector),
+                    )
+                return cur.fetchone()
+
+        row = self._run_pg(_query)
+        if row is None or float(row[1]) < self.threshold:
+            return None
+        return row[0]
+
+    def _vector_store(self):
+        """复用 `VectorStore` 的连接池、重试与向量字面量；首次使用时建表，建表失败下次调用重试。"""
+        if self._store is None:
+            from .knowledge.vector_store import VectorStore
+
+            store = VectorStore(self.config)
+            self._ensure_schema(store)
+            self._store = store
+        return self._store
+
+    def _run_pg(self, operation):
+        return self._vector_store()._run_pg(operation)
+
+    def _ensure_schema(self, store) -> None:
+        """建表与索引；embedding 维度与配置不一致或缺少 `scope` 列时重建表。"""
+        dimension = self.config.KB_EMBEDDING_DIMENSION
+        if ResponseCache._schema_dimension == dimension:
+            return
+
+        def _init_schema(conn):
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT atttypmod
+                    FROM pg_attribute a
+                    JOIN pg_class c ON a.attrelid = c.oid
+                    WHERE c.relname = 'chat_response_cache' AND a.attname = 'embedding'
+                    """
+                )
+                row = cur.fetchone()
+                cur.execute(
+                    """
+                    SELECT 1
+                    FROM information_schema.columns
+                    WHERE table_name = 'chat_response_cache' AND column_name = 'scope'
+                    """
+                )
+                has_scope = cur.fetchone() is not None
+                if row and row[0] and row[0] > 0 and int(row[0]) != dimension:
+                    logger.warning("chat_response_cache.embedding 维度 %s -> %s，重建缓存表", row[0], dimension)
+                    cur.execute("DROP TABLE chat_response_cache")
+                elif row and not has_scope:
+                    logger.warning("chat_response_cache 缺少 scope 列（按用户隔离前的旧表），重建缓存表")
+                    cur.execute("DROP TABLE chat_response_cache")
+                cur.execute(
+                    f"""
+                    CREATE TABLE IF NOT EXISTS chat_response_cache (
+                        id SERIAL PRIMARY KEY,
+                        provider_id VARCHAR(100) NOT NULL,
+                        scope VARCHAR(64) NOT NULL DEFAULT '',
+                        question_hash CHAR(64) NOT NULL,
+                        question TEXT NOT NULL,
+                        embedding vector({dimension}) NOT NULL,
+                        answer TEXT NOT NULL,
+                        created_at TIMESTAMPTZ DEFAULT NOW(),
+                        expires_at TIMESTAMPTZ NOT NULL,
+                        UNIQUE (provider_id, scope, question_hash)
+                    )
+                    """
+                )
+                cur.execute(
+                    """
+                    CREATE INDEX IF NOT EXISTS idx_response_cache_expires
+                        ON chat_response_cache (expires_at)
+                    """
+                )
+                cur.execute(
+                    """
+                    CREATE INDEX IF NOT EXISTS idx_response_cache_scope
+                        ON chat_response_cache (provider_id, scope, expires_at)
+                    """
+                )
+                cur.execute(
+                    """
+                    CREATE INDEX IF NOT EXISTS idx_response_cache_embedding_hnsw
+                        ON chat_response_cache
+                        USING hnsw (embedding vector_cosine_ops)
+                    """
+                )
+            conn.commit()
+
+        store._run_pg(_init_schema)
+        ResponseCache._schema_dimension = dimension
+
+    def _incr(self, field: str) -> None:
+        if self.redis_client is None:
+            return
+        try:
+            self.redis_client.hincrby(STATS_KEY, field, 1)
+        except Exception as e:
+            print(f"Response cache stats error: {e}")
+
+
+RESPONSE_CACHE_KEY = "response_cache"
+
+
+def register_response_cache(app, config) -> ResponseCache:
+    """在应用工厂中注册进程级 ResponseCache（PG 表在首次查找时创建）。"""
+    cache = ResponseCache(config)
+    app.extensions[RESPONSE_CACHE_KEY] = cache
+    return cache
+
+
+def get_response_cache() -> ResponseCache:
+    from flask import current_app
+
+    try:
+        return current_app.extensions[RESPONSE_CACHE_KEY]
+    except RuntimeError as exc:
+        raise RuntimeError("必须在 Flask 应用上下文中访问 ResponseCache") from exc
+    except KeyError as exc:
+        raise RuntimeError("ResponseCache 未初始化，请在 create_app 中调用 register_response_cache") from exc
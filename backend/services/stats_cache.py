@@ -0,0 +1,112 @@
+"""统计结果缓存 — 进程内 TTL + Redis 共享。
+
+职责总览：
+1) 读写
+   - `StatsCache.get_or_compute()`  按 key 读取缓存，未命中时调用 `compute()` 并写入两级缓存
+   - 值必须可 JSON 序列化；Redis 不可用时只使用进程内缓存
+2) 事件失效
+   - `StatsCache.generation()`  读取全局 / 单用户的数据版本号，拼入缓存 key
+   - `StatsCache.invalidate_usage()`  新 `TokenUsage` 落库后递增版本号，旧 key 自然失效
+   - 版本号存 Redis，所有 worker 共享；稳态下刷新统计页只读 Redis，不访问 MySQL
+
+调用方：
+- `StatsService.get_usage_series()`
+- `/api/stats/admin`、`/api/stats/user`
+- `TokenUsageWriter.flush()`（失效）
+"""
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+
+class StatsCache:
+    """统计接口的短 TTL 两级缓存。"""
+
+    key_prefix = "stats:cache:"
+    generation_prefix = "stats:gen:"
+    max_local_entries = 512
+
+    def __init__(self):
+        self._local: Dict[str, Tuple[float, Any]] = {}
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def generation(self, user_id: Optional[int] = None) -> str:
+        """返回用量数据版本号；`user_id` 为空时为全局版本。"""
+        scope = "global" if user_id is None else f"user:{user_id}"
+        redis_client = self._get_redis_client()
+        if redis_client:
+            try:
+                return f"r{redis_client.get(self.generation_prefix + scope) or 0}"
+            except Exception as e:
+                print(f"读取统计版本号失败: {e}")
+        with self._lock:
+            return f"l{self._generations.get(scope, 0)}"
+
+    def invalidate_usage(self, user_ids: Iterable[int], redis_client=None) -> None:
+        """新的用量记录落库后调用：递增全局与相关用户的版本号。
+
+        后台线程没有应用上下文，需显式传入 `redis_client`。
+        """
+        scopes = ["global"] + [f"user:{user_id}" for user_id in set(user_ids)]
+        with self._lock:
+            for scope in scopes:
+                self._generations[scope] = self._generations.get(scope, 0) + 1
+        redis_client = redis_client or self._get_redis_client()
+        if redis_client:
+            try:
+                pipe = redis_client.pipeline(transaction=False)
+                for scope in scopes:
+                    pipe.incr(self.generation_prefix + scope)
+                pipe.execute()
+            except Exception as e:
+                print(f"更新统计版本号失败: {e}")
+
+    def get_or_compute(self, key: str, ttl: int, compute: Callable[[], Any]) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._local.get(key)
+        if entry and entry[0] > now:
+            return entry[1]
+
+        redis_client = self._get_redis_client()
+        if redis_client:
+            try:
+                raw = redis_client.get(f"{self.key_prefix}{key}")
+                if raw:
+                    value = json.loads(raw)
+                    self._set_local(key, value, ttl)
+                    return value
+            except Exception as e:
+                print(f"读取统计缓存失败: {e}")
+
+        value = compute()
+        self._set_local(key, value, ttl)
+        if redis_client:
+            try:
+                redis_client.set(f"{self.key_prefix}{key}", json.dumps(value, default=str), ex=ttl)
+            except Exception as e:
+                print(f"写入统计缓存失败: {e}")
+        return value
+
+    def _set_local(self, key: str, value: Any, ttl: int) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if len(self._local) >= self.max_local_entries:
+                self._local = {k: v for k, v in self._local.items() if v[0] > now}
+                if len(self._local) >= self.max_local_entries:
+                    self._local.clear()
+            self._local[key] = (now + ttl, value)
+
+    @staticmethod
+    def _get_redis_client():
+        try:
+            from backend.config import get_config
+
+            return get_config().REDIS_CLIENT
+        except Exception:
+            return None
+
+
+stats_cache = StatsCache()
@@ -5,13 +5,99 @@
    - `StatsService.get_user_stats()`  单用户今日/本周/本月/累计 Token
 2) 管理统计
    - `StatsService.get_admin_stats()`  全局统计与最近 API 用量明细
+   - `StatsService.get_usage_series()`  任意时间范围按 天/小时/模型/用户 分组的用量序列
+3) 提示缓存
+   - 各统计均带 `cached`（提供商报告的前缀缓存命中 token）与 `cache_hit_rate`（cached / prompt）
+   - `StatsService.get_session_usage()`  单个会话的用量与缓存命中率（读明细表，走会话索引）
+
+今日/本周/本月/累计均读日汇总表 `token_usage_daily`（见 `usage_rollup`），
+一次条件聚合查询得到全部窗口；日期边界使用 MySQL `CURDATE()`，与 `request_time` 同一时钟。
 """
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 
-from sqlalchemy import func
+from sqlalchemy import case, func, text
 
 from ..db import get_session
-from ..db import TokenUsage
+from ..db import TokenUsage, TokenUsageDaily, TokenUsageHourly, User
+from .stats_cache import stats_cache
+
+USAGE_GROUP_BY = ("day", "hour", "model", "user")
+# 已结束的历史窗口数据不再变化，可长时间缓存
+_HISTORICAL_CACHE_TTL = 3600
+
+_PERIODS = ("today", "week", "month", "total")
+_METRICS = (
+    ("prompt", TokenUsageDaily.prompt_tokens),
+    ("completion", TokenUsageDaily.completion_tokens),
+    ("total", TokenUsageDaily.total_tokens),
+    ("cached", TokenUsageDaily.cached_tokens),
+    ("count", TokenUsageDaily.request_count),
+)
+
+
+def _period_condition(period):
+    if period == "today":
+        return TokenUsageDaily.bucket_date == func.curdate()
+    if period == "week":
+        return TokenUsageDaily.bucket_date >= func.date_sub(func.curdate(), text("INTERVAL 7 DAY"))
+    if period == "month":
+        return TokenUsageDaily.bucket_date >= func.date_sub(func.curdate(), text("INTERVAL 30 DAY"))
+    return None
+
+
+def _cache_hit_rate(cached, prompt):
+    return round(cached / prompt, 4) if prompt else 0.0
+
+
+def _empty_period_stats():
+    return {
+        period: {**{name: 0 for name, _ in _METRICS}, "cache_hit_rate": 0.0}
+        for period in _PERIODS
+    }
+
+
+def _sum_columns(model):
+    return (
+        func.coalesce(func.sum(model.prompt_tokens), 0).label("prompt"),
+        func.coalesce(func.sum(model.completion_tokens), 0).label("completion"),
+        func.coalesce(func.sum(model.total_tokens), 0).label("total"),
+        func.coalesce(func.sum(model.cached_tokens), 0).label("cached"),
+        func.coalesce(func.sum(model.request_count), 0).label("count"),
+    )
+
+
+def _sum_row_to_dict(row):
+    return {
+        "prompt": int(row.prompt),
+        "completion": int(row.completion),
+        "total": int(row.total),
+        "cached": int(row.cached),
+        "cache_hit_rate": _cache_hit_rate(int(row.cached), int(row.prompt)),
+        "count": int(row.count),
+    }
+
+
+def _query_period_stats(db, user_id=None):
+    """一次查询汇总各窗口的 prompt/completion/total/cached/count。"""
+    columns = []
+    for period in _PERIODS:
+        condition = _period_condition(period)
+        for name, column in _METRICS:
+            expr = column if condition is None else case((condition, column), else_=0)
+            columns.append(func.coalesce(func.sum(expr), 0).label(f"{period}_{name}"))
+
+    query = db.query(*columns)
+    if user_id is not None:
+        query = query.filter(TokenUsageDaily.user_id == user_id)
+    row = query.one()
+
+    stats = {
+        period: {name: int(getattr(row, f"{period}_{name}")) for name, _ in _METRICS}
+        for period in _PERIODS
+    }
+    for values in stats.values():
+        values["cache_hit_rate"] = _cache_hit_rate(values["cached"], values["prompt"])
+    return stats
 
 
 class StatsService:
@@ -28,35 +114,8 @@ class StatsService:
         """
         db = get_session()
         try:
-            today = datetime.utcnow().date()
-            week_ago = today - timedelta(days=7)
-            month_ago = today - timedelta(days=30)
-            
-            today_usage = db.query(func.sum(TokenUsage.total_tokens)).filter(
-                TokenUsage.user_id == user_id,
-                func.date(TokenUsage.request_time) == today
-            ).scalar() or 0
-            
-            week_usage = db.query(func.sum(TokenUsage.total_tokens)).filter(
-                TokenUsage.user_id == user_id,
-                TokenUsage.request_time >= week_ago
-            ).scalar() or 0
-            
-            month_usage = db.query(func.sum(TokenUsage.total_tokens)).filter(
-                TokenUsage.user_id == user_id,
-                TokenUsage.request_time >= month_ago
-            ).scalar() or 0
-            
-            total_usage = db.query(func.sum(TokenUsage.total_tokens)).filter(
-                TokenUsage.user_id == user_id
-            ).scalar() or 0
-            
-            return {
-                'today': today_usage,
-                'week': week_usage,
-                'month': month_usage,
-                'total': total_usage
-            }
+            stats = _query_period_stats(db, user_id=user_id)
+            return {period: stats[period]["total"] for period in _PERIODS}
         except Exception as e:
             print(f"Get user stats error: {e}")
             return {'today': 0, 'week': 0, 'month': 0, 'total': 0}
@@ -73,48 +132,8 @@ class StatsService:
         """
         db = get_session()
         try:
-            today = datetime.utcnow().date()
-            week_ago = today - timedelta(days=7)
-            month_ago = today - timedelta(days=30)
-            
-            # 今日统计
-            today_stats = db.query(
-                func.sum(TokenUsage.prompt_tokens).label('prompt'),
-                func.sum(TokenUsage.completion_tokens).label('completion'),
-                func.sum(TokenUsage.total_tokens).label('total'),
-                func.count(TokenUsage.id).label('count')
-            ).filter(
-                func.date(TokenUsage.request_time) == today
-            ).first()
-            
-            # 本周统计
-            week_stats = db.query(
-                func.sum(TokenUsage.prompt_tokens).label('prompt'),
-                func.sum(TokenUsage.completion_tokens).label('completion'),
-                func.sum(TokenUsage.total_tokens).label('total'),
-                func.count(TokenUsage.id).label('count')
-            ).filter(
-                TokenUsage.request_time >= week_ago
-            ).first()
-            
-            # 本月统计
-            month_stats = db.query(
-                func.sum(TokenUsage.prompt_tokens).label('prompt'),
-                func.sum(TokenUsage.completion_tokens).label('completion'),
-                func.sum(TokenUsage.total_tokens).label('total'),
-                func.count(TokenUsage.id).label('count')
-            ).filter(
-                TokenUsage.request_time >= month_ago
-            ).first()
-            
-            # 总统计
-            total_stats = db.query(
-                func.sum(TokenUsage.prompt_tokens).label('prompt'),
-                func.sum(TokenUsage.completion_tokens).label('completion'),
-                func.sum(TokenUsage.total_tokens).label('total'),
-                func.count(TokenUsage.id).label('count')
-            ).first()
-            
+            stats = _query_period_stats(db)
+
             # 最近10条使用记录
             recent_usage = db.query(TokenUsage).order_by(
                 TokenUsage.request_time.desc()
@@ -124,45 +143,127 @@ class StatsService:
             # API Key 管理已移除，不再返回
             
             return {
-                'stats': {
-                    'today': {
-                        'prompt': today_stats.prompt or 0,
-                        'completion': today_stats.completion or 0,
-                        'total': today_stats.total or 0,
-                        'count': today_stats.count or 0
-                    },
-                    'week': {
-                        'prompt': week_stats.prompt or 0,
-                        'completion': week_stats.completion or 0,
-                        'total': week_stats.total or 0,
-                        'count': week_stats.count or 0
-                    },
-                    'month': {
-                        'prompt': month_stats.prompt or 0,
-                        'completion': month_stats.completion or 0,
-                        'total': month_stats.total or 0,
-                        'count': month_stats.count or 0
-                    },
-                    'total': {
-                        'prompt': total_stats.prompt or 0,
-                        'completion': total_stats.completion or 0,
-                        'total': total_stats.total or 0,
-                        'count': total_stats.count or 0
-                    }
-                },
+                'stats': stats,
                 'recent_usage': recent_usage
             }
         except Exception as e:
             print(f"Get admin stats error: {e}")
             return {
-                'stats': {
-                    'today': {'prompt': 0, 'completion': 0, 'total': 0, 'count': 0},
-                    'week': {'prompt': 0, 'completion': 0, 'total': 0, 'count': 0},
-                    'month': {'prompt': 0, 'completion': 0, 'total': 0, 'count': 0},
-                    'total': {'prompt': 0, 'completion': 0, 'total': 0, 'count': 0}
-                },
+                'stats': _empty_period_stats(),
                 'recent_usage': []
             }
         finally:
             db.close()
 
+    @staticmethod
+    def get_session_usage(session_id, user_id=None):
+        """单个会话的累计用量与提示缓存命中率。
+
+        用法:
+        - 调用方: `GET /api/stats/sessions/<session_id>`
+        - 参数: `user_id` 非空时只统计该用户的记录（会话归属校验）
+        - 返回值: `{ prompt, completion, total, cached, cache_hit_rate, count }`
+        """
+        db = get_session()
+        try:
+            query = db.query(
+                func.coalesce(func.sum(TokenUsage.prompt_tokens), 0).label("prompt"),
+                func.coalesce(func.sum(TokenUsage.completion_tokens), 0).label("completion"),
+                func.coalesce(func.sum(TokenUsage.total_tokens), 0).label("total"),
+                func.coalesce(func.sum(TokenUsage.cached_tokens), 0).label("cached"),
+                func.count(TokenUsage.id).label("count"),
+            ).filter(TokenUsage.session_id == session_id)
+            if user_id is not None:
+                query = query.filter(TokenUsage.user_id == user_id)
+            return _sum_row_to_dict(query.one())
+        finally:
+            db.close()
+
+    @staticmethod
+    def get_usage_series(start: date, end: date, group_by: str, cache_ttl: int = 30):
+        """按时间范围与分组维度返回用量序列（读汇总表，结果带服务端缓存）。
+
+        用法:
+        - 调用方: `GET /api/stats/admin/usage`
+        - 参数:
+            - start / end: 起止日期（含两端）
+            - group_by: `day` | `hour` | `model` | `user`
+            - cache_ttl: 范围包含今天时的缓存秒数；纯历史范围缓存 1 小时
+        - 返回值: `[{ bucket|model|user_id..., prompt, completion, total, cached, cache_hit_rate, count }]`
+        """
+        if group_by not in USAGE_GROUP_BY:
+            raise ValueError(f"group_by 仅支持: {', '.join(USAGE_GROUP_BY)}")
+
+        key = f"usage:{group_by}:{start.isoformat()}:{end.isoformat()}"
+        if end >= date.today():
+            # 包含今天的范围随新用量变化：版本号拼入 key，落库后立即失效
+            ttl = cache_ttl
+            key = f"{key}:{stats_cache.generation()}"
+        else:
+            ttl = _HISTORICAL_CACHE_TTL
+        return stats_cache.get_or_compute(
+            key, ttl, lambda: StatsService._query_usage_series(start, end, group_by)
+        )
+
+    @staticmethod
+    def _query_usage_series(start: date, end: date, group_by: str):
+        db = get_session()
+        try:
+            if group_by == "hour":
+                # 半开区间 [start 00:00, end+1 00:00)，可直接走 (bucket_start, ...) 唯一索引
+                bucket = TokenUsageHourly.bucket_start
+                rows = (
+                    db.query(bucket.label("bucket"), *_sum_columns(TokenUsageHourly))
+                    .filter(
+                        bucket >= datetime.combine(start, datetime.min.time()),
+                        bucket < datetime.combine(end + timedelta(days=1), datetime.min.time()),
+                    )
+                    .group_by(bucket)
+                    .order_by(bucket)
+                    .all()
+                )
+                return [{"bucket": row.bucket.isoformat(), **_sum_row_to_dict(row)} for row in rows]
+
+            in_range = (
+                TokenUsageDaily.bucket_date >= start,
+                TokenUsageDaily.bucket_date <= end,
+            )
+            if group_by == "day":
+                bucket = TokenUsageDaily.bucket_date
+                rows = (
+                    db.query(bucket.label("bucket"), *_sum_columns(TokenUsageDaily))
+                    .filter(*in_range)
+                    .group_by(bucket)
+                    .order_by(bucket)
+                    .all()
+                )
+                return [{"bucket": row.bucket.isoformat(), **_sum_row_to_dict(row)} for row in rows]
+
+            if group_by == "model":
+                rows = (
+                    db.query(TokenUsageDaily.model.label("model"), *_sum_columns(TokenUsageDaily))
+                    .filter(*in_range)
+                    .group_by(TokenUsageDaily.model)
+                    .order_by(func.sum(TokenUsageDaily.total_tokens).desc())
+                    .all()
+                )
+                return [{"model": row.model, **_sum_row_to_dict(row)} for row in rows]
+
+            rows = (
+                db.query(
+                    TokenUsageDaily.user_id.label("user_id"),
+                    User.username.label("username"),
+                    *_sum_columns(TokenUsageDaily),
+                )
+                .outerjoin(User, User.id == TokenUsageDaily.user_id)
+                .filter(*in_range)
+                .group_by(TokenUsageDaily.user_id, User.username)
+                .order_by(func.sum(TokenUsageDaily.total_tokens).desc())
+                .all()
+            )
+            return [
+                {"user_id": row.user_id, "username": row.username, **_sum_row_to_dict(row)}
+                for row in rows
+            ]
+        finally:
+            db.close()
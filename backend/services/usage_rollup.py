@@ -0,0 +1,195 @@
+"""Token 用量预聚合 — 小时/日汇总表的增量维护与回填。
+
+职责总览：
+1) 增量维护
+   - `apply_usage_rollups()`  与 `token_usage` 批量写入同一事务，把新记录按
+     （时间桶, 用户, 模型）在内存合并后累加进 `token_usage_hourly` / `token_usage_daily`
+2) 回填（不在启动路径上执行）
+   - `record_backfill_target()`  启动时只做索引查询：汇总表为空时记录需回填的 `token_usage.id` 上限，
+     有未完成的回填时记录日志提示
+   - `backfill_usage_rollups()`  由 `scripts/backfill_usage_rollups.py` 调用，按 id 区间分批回填，
+     每批与进度（`token_usage_rollup_state`）同一事务提交，中断后可续跑
+
+设计说明：
+- 时间桶由记录自身的 `request_time` 计算（与明细行写入的值相同），汇总与明细可逐桶对账
+- 统计接口只读汇总表，数据量随（天数 × 用户 × 模型）增长，与请求次数无关
+"""
+import logging
+from collections import defaultdict
+from typing import Dict, Iterable
+
+from sqlalchemy import text
+
+from ..db import TokenUsageDaily, TokenUsageHourly, TokenUsageRollupState, get_session
+
+logger = logging.getLogger(__name__)
+
+_UPSERT_TEMPLATE = """
+INSERT INTO {table} ({bucket_column}, user_id, model,
+                     prompt_tokens, completion_tokens, total_tokens, cached_tokens, request_count)
+SELECT {bucket_expr} AS bucket, user_id, COALESCE(model, ''),
+       SUM(COALESCE(prompt_tokens, 0)), SUM(COALESCE(completion_tokens, 0)),
+       SUM(COALESCE(total_tokens, 0)), SUM(COALESCE(cached_tokens, 0)), COUNT(*)
+FROM token_usage
+{where}
+GROUP BY bucket, user_id, COALESCE(model, '')
+ON DUPLICATE KEY UPDATE
+    {table}.prompt_tokens = {table}.prompt_tokens + VALUES(prompt_tokens),
+    {table}.completion_tokens = {table}.completion_tokens + VALUES(completion_tokens),
+    {table}.total_tokens = {table}.total_tokens + VALUES(total_tokens),
+    {table}.cached_tokens = {table}.cached_tokens + VALUES(cached_tokens),
+    {table}.request_count = {table}.request_count + VALUES(request_count)
+"""
+
+_ROLLUPS = (
+    (TokenUsageHourly.__tablename__, "bucket_start", "DATE_FORMAT(request_time, '%Y-%m-%d %H:00:00')"),
+    (TokenUsageDaily.__tablename__, "bucket_date", "DATE(request_time)"),
+)
+
+_INCREMENT_TEMPLATE = """
+INSERT INTO {table} ({bucket_column}, user_id, model,
+                     prompt_tokens, completion_tokens, total_tokens, cached_tokens, request_count)
+VALUES (:bucket, :user_id, :model, :prompt_tokens, :completion_tokens, :total_tokens,
+        :cached_tokens, :request_count)
+ON DUPLICATE KEY UPDATE
+    prompt_tokens = prompt_tokens + VALUES(prompt_tokens),
+    completion_tokens = completion_tokens + VALUES(completion_tokens),
+    total_tokens = total_tokens + VALUES(total_tokens),
+    cached_tokens = cached_tokens + VALUES(cached_tokens),
+    request_count = request_count + VALUES(request_count)
+"""
+
+_BACKFILL_LOCK = "token_usage_rollup_backfill"
+# 回填每批处理的 token_usage id 区间长度
+BACKFILL_BATCH_SIZE = 10000
+
+
+def _upsert_statements(where: str):
+    for table, bucket_column, bucket_expr in _ROLLUPS:
+        yield text(
+            _UPSERT_TEMPLATE.format(
+                table=table, bucket_column=bucket_column, bucket_expr=bucket_expr, where=where
+            )
+        )
+
+
+def apply_usage_rollups(db, records: Iterable[Dict]) -> None:
+    """把一批用量记录累加进汇总表（调用方负责写明细与 commit）。
+
+    用法:
+    - 调用方: `TokenUsageWriter.flush()`
+    - 参数: `records` — 含 `user_id`、`model`、`*_tokens`（含 `cached_tokens`）、`request_time` 的 dict
+    """
+    hourly = defaultdict(lambda: [0, 0, 0, 0, 0])
+    daily = defaultdict(lambda: [0, 0, 0, 0, 0])
+    for record in records:
+        request_time = record["request_time"]
+        model = record.get("model") or ""
+        values = (
+            record.get("prompt_tokens") or 0,
+            record.get("completion_tokens") or 0,
+            record.get("total_tokens") or 0,
+            record.get("cached_tokens") or 0,
+            1,
+        )
+        for buckets, bucket in (
+            (hourly, request_time.replace(minute=0, second=0, microsecond=0)),
+            (daily, request_time.date()),
+        ):
+            sums = buckets[(bucket, record["user_id"], model)]
+            for i, value in enumerate(values):
+                sums[i] += value
+
+    for (table, bucket_column, _), buckets in zip(_ROLLUPS, (hourly, daily)):
+        if not buckets:
+            continue
+        db.execute(
+            text(_INCREMENT_TEMPLATE.format(table=table, bucket_column=bucket_column)),
+            [
+                {
+                    "bucket": bucket,
+                    "user_id": user_id,
+                    "model": model,
+                    "prompt_tokens": sums[0],
+                    "completion_tokens": sums[1],
+                    "total_tokens": sums[2],
+                    "cached_tokens": sums[3],
+                    "request_count": sums[4],
+                }
+                for (bucket, user_id, model), sums in sorted(buckets.items())
+            ],
+        )
+
+
+def record_backfill_target() -> None:
+    """记录汇总表需回填的明细范围；有待回填数据时提示运行回填脚本（只做索引查询）。
+
+    用法:
+    - 调用方: `create_app()` 初始化数据库之后
+    - 汇总表为空时以当前 `MAX(token_usage.id)` 为回填目标（`INSERT IGNORE`，多 worker 以先写入者为准），
+      之后的明细由 `apply_usage_rollups()` 增量维护
+    """
+    db = get_session()
+    try:
+        state = db.get(TokenUsageRollupState, 1)
+        if state is None:
+            target_id = 0
+            if db.query(TokenUsageDaily.id).first() is None:
+                target_id = db.execute(text("SELECT COALESCE(MAX(id), 0) FROM token_usage")).scalar() or 0
+            db.execute(
+                text(
+                    "INSERT IGNORE INTO token_usage_rollup_state (id, backfill_target_id, backfilled_id) "
+                    "VALUES (1, :target_id, 0)"
+                ),
+                {"target_id": int(target_id)},
+            )
+            db.commit()
+            state = db.get(TokenUsageRollupState, 1)
+        if state is not None and state.backfilled_id < state.backfill_target_id:
+            logger.warning(
+                "Token 用量汇总表尚未回填历史明细（token_usage.id %s-%s），统计结果不完整；"
+                "请运行 python scripts/backfill_usage_rollups.py",
+                state.backfilled_id + 1,
+                state.backfill_target_id,
+            )
+    except Exception as e:
+        db.rollback()
+        logger.error("Token 用量汇总表回填检查失败: %s", e, exc_info=True)
+    finally:
+        db.close()
+
+
+def backfill_usage_rollups(batch_size: int = BACKFILL_BATCH_SIZE) -> int:
+    """把 `backfill_target_id` 之前的明细按 id 区间分批累加进汇总表，返回本次回填到的 id。
+
+    用法:
+    - 调用方: `scripts/backfill_usage_rollups.py`
+    - 每批的汇总 upsert 与进度更新同一事务提交，中断后重跑从 `backfilled_id` 继续，不会重复累加
+    - `GET_LOCK` 防止多个回填进程同时执行；已在执行时抛出 RuntimeError
+    """
+    db = get_session()
+    try:
+        acquired = db.execute(text("SELECT GET_LOCK(:name, 0)"), {"name": _BACKFILL_LOCK}).scalar()
+        if not acquired:
+            raise RuntimeError("已有回填进程在执行")
+        try:
+            while True:
+                state = db.query(TokenUsageRollupState).filter(TokenUsageRollupState.id == 1).first()
+                if state is None:
+                    raise RuntimeError("未找到回填目标，请先启动一次应用（create_app 会记录回填范围）")
+                low, target = int(state.backfilled_id), int(state.backfill_target_id)
+                if low >= target:
+                    return low
+                high = min(low + batch_size, target)
+                for statement in _upsert_statements(f"WHERE id > {low} AND id <= {high}"):
+                    db.execute(statement)
+                state.backfilled_id = high
+                db.commit()
+                logger.info("Token 用量汇总表已回填至 token_usage.id=%s / %s", high, target)
+        finally:
+            db.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": _BACKFILL_LOCK})
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
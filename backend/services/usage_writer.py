@@ -0,0 +1,158 @@
+"""Token 用量缓冲写入 — 批量 INSERT，移出聊天请求的关键路径。
+
+职责总览：
+1) 缓冲
+   - `TokenUsageWriter.record()`  记录一次调用的用量（立即返回，`request_time` 取记录时刻）
+2) 批量落库
+   - `TokenUsageWriter.flush()`   单事务 executemany 写 `token_usage` 并累加汇总表，
+     提交后使统计缓存失效（`stats_cache.invalidate_usage()`）
+   - 后台线程每 `TOKEN_USAGE_FLUSH_INTERVAL` 秒刷新一次；缓冲达到
+     `TOKEN_USAGE_BATCH_SIZE` 条时立即唤醒
+3) 退出保护
+   - `atexit` 中停止后台线程并做最后一次 flush（gunicorn 优雅退出 / Ctrl+C）
+   - 写库失败的记录放回缓冲重试，缓冲上限为 `TOKEN_USAGE_MAX_BUFFER`，超出丢弃最旧记录
+
+调用方：
+- `ChatService.save_token_usage()`
+
+已知局限：
+- 进程被强制杀死（SIGKILL / OOM）时最多丢失一个刷新周期内的记录
+- `TOKEN_USAGE_BATCH_SIZE <= 1` 时退化为同步写入
+"""
+import atexit
+import os
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import insert
+
+from ..db import TokenUsage, get_session
+from .stats_cache import stats_cache
+from .usage_rollup import apply_usage_rollups
+
+
+class TokenUsageWriter:
+    """进程内 Token 用量缓冲与后台批量写入。"""
+
+    def __init__(
+        self,
+        batch_size: int = 50,
+        flush_interval: float = 2.0,
+        max_buffer: int = 10000,
+        redis_client=None,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.redis_client = redis_client
+        self._buffer: List[Dict] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def record(self, user_id: int, usage_data: Dict, model_name: str, session_id: Optional[int] = None) -> None:
+        """缓冲一条用量记录（`usage_data["cached_tokens"]` 为提示缓存命中数，可缺省）。"""
+        record = {
+            "user_id": user_id,
+            "session_id": session_id,
+            "prompt_tokens": usage_data.get("prompt_tokens", 0),
+            "completion_tokens": usage_data.get("completion_tokens", 0),
+            "total_tokens": usage_data.get("total_tokens", 0),
+            "cached_tokens": usage_data.get("cached_tokens", 0),
+            "model": model_name,
+            "request_time": datetime.now().replace(microsecond=0),
+        }
+        if self.batch_size <= 1:
+            self._write([record])
+            return
+
+        self._ensure_started()
+        with self._lock:
+            self._buffer.append(record)
+            pending = len(self._buffer)
+        if pending >= self.batch_size:
+            self._wakeup.set()
+
+    def flush(self) -> int:
+        """把缓冲中的记录写入数据库，返回成功写入条数。"""
+        with self._flush_lock:
+            with self._lock:
+                records, self._buffer = self._buffer, []
+            if not records:
+                return 0
+            if self._write(records):
+                return len(records)
+            with self._lock:
+                merged = records + self._buffer
+                dropped = len(merged) - self.max_buffer
+                self._buffer = merged[-self.max_buffer:]
+            if dropped > 0:
+                print(f"Token usage buffer full, dropped {dropped} records")
+            return 0
+
+    def close(self) -> None:
+        """停止后台线程并写出剩余记录。"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+            self._thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+
+    def _write(self, records: List[Dict]) -> bool:
+        db = get_session()
+        try:
+            db.execute(insert(TokenUsage), records)
+            apply_usage_rollups(db, records)
+            db.commit()
+        except Exception as e:
+            print(f"Save token usage error: {e}")
+            db.rollback()
+            return False
+        finally:
+            db.close()
+        stats_cache.invalidate_usage(
+            (record["user_id"] for record in records), redis_client=self.redis_client
+        )
+        return True
+
+    def _ensure_started(self) -> None:
+        # fork 之后线程不会被继承：按 pid 判断当前 worker 是否已启动后台线程
+        if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="token-usage-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_token_usage_writer(config) -> TokenUsageWriter:
+    """返回进程级 `TokenUsageWriter`（首次调用时按配置创建并注册退出 flush）。"""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = TokenUsageWriter(
+                    batch_size=config.TOKEN_USAGE_BATCH_SIZE,
+                    flush_interval=config.TOKEN_USAGE_FLUSH_INTERVAL,
+                    max_buffer=config.TOKEN_USAGE_MAX_BUFFER,
+                    redis_client=config.REDIS_CLIENT,
+                )
+                atexit.register(_writer.close)
+    return _writer
@@ -4,15 +4,21 @@
 1) http        — 客户端 IP 提取
 2) user         — 用户认证与序列化
 3) rate_limit   — 聊天 API Redis 限流
+4) file_response — 上传文件下载（X-Accel-Redirect / ETag / 缓存）
+5) user_cache   — 已登录用户信息两级缓存（进程内 + Redis）
 """
+from backend.utils.file_response import send_upload
 from backend.utils.http import get_client_ip
 from backend.utils.rate_limit import chat_rate_limiter, rate_limit_chat
 from backend.utils.user import get_current_user, serialize_user
+from backend.utils.user_cache import invalidate_user
 
 __all__ = [
     "chat_rate_limiter",
     "get_client_ip",
     "get_current_user",
+    "invalidate_user",
     "rate_limit_chat",
+    "send_upload",
     "serialize_user",
 ]
@@ -0,0 +1,101 @@
+"""上传文件下载响应 — 零拷贝转交与 HTTP 缓存。
+
+职责总览：
+1) 鉴权之后的文件发送
+   - `send_upload()`  路由完成权限校验后调用，按 `FILE_SERVE_MODE` 选择发送方式：
+     - `app`         由 Flask `send_file` 在 worker 内发送（默认，支持 Range）
+     - `x-accel`     返回空响应 + `X-Accel-Redirect`，由 nginx internal location 直接 sendfile
+     - `x-sendfile`  返回空响应 + `X-Sendfile`（Apache / lighttpd）
+2) HTTP 缓存
+   - 强 ETag 使用内容 SHA-256（`content_hash`），缺失时退回 Werkzeug 默认 ETag
+   - 上传文件以 uuid 命名、内容不可变，统一返回 `Cache-Control: private, max-age=..., immutable`
+   - `If-None-Match` 命中时在 worker 内直接返回 304，不再转交 nginx
+
+相关配置（`Config` / `.env`）：
+- `FILE_SERVE_MODE`       发送方式（app / x-accel / x-sendfile）
+- `FILE_ACCEL_PREFIX`     nginx internal location 前缀，需与 `frontend/nginx.conf` 一致
+- `FILE_CACHE_MAX_AGE`    浏览器缓存时长（秒）
+"""
+import mimetypes
+import os
+from typing import Optional
+from urllib.parse import quote
+
+from flask import Response, request, send_file
+
+from backend.config import get_config
+from backend.config.settings import UPLOAD_DIR
+
+
+def send_upload(
+    path: str,
+    *,
+    mimetype: Optional[str] = None,
+    content_hash: Optional[str] = None,
+    as_attachment: bool = False,
+    download_name: Optional[str] = None,
+) -> Response:
+    """发送 `uploads/` 下已通过鉴权的文件。
+
+    用法:
+    - 调用方: `GET /api/files/<id>/image`、`GET /api/knowledge-bases/<kb>/documents/<doc>/download`
+    - 参数:
+        - path: 文件绝对路径（`UploadedFile.file_path` / `KbDocument.file_path`）
+        - content_hash: 内容 SHA-256，作为强 ETag
+    - 返回值: Flask `Response`
+    """
+    config = get_config()
+    mode = config.FILE_SERVE_MODE
+    cache_control = f"private, max-age={config.FILE_CACHE_MAX_AGE}, immutable"
+
+    if mode in ("x-accel", "x-sendfile") and content_hash:
+        if request.if_none_match.contains(content_hash):
+            response = Response(status=304)
+            response.set_etag(content_hash)
+            response.headers["Cache-Control"] = cache_control
+            return response
+
+    internal_uri = _accel_uri(path, config.FILE_ACCEL_PREFIX) if mode == "x-accel" else None
+    if internal_uri or mode == "x-sendfile":
+        filename = download_name or os.path.basename(path)
+        response = Response(
+            mimetype=mimetype or mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        )
+        if internal_uri:
+            response.headers["X-Accel-Redirect"] = internal_uri
+        else:
+            response.headers["X-Sendfile"] = os.path.abspath(path)
+        if content_hash:
+            response.set_etag(content_hash)
+        response.headers["Cache-Control"] = cache_control
+        response.headers["Content-Disposition"] = _content_disposition(filename, as_attachment)
+        return response
+
+    response = send_file(
+        path,
+        mimetype=mimetype,
+        as_attachment=as_attachment,
+        download_name=download_name,
+        conditional=True,
+        etag=content_hash or True,
+        max_age=None,
+    )
+    response.headers["Cache-Control"] = cache_control
+    return response
+
+
+def _accel_uri(path: str, prefix: str) -> Optional[str]:
+    """把 `uploads/` 下的绝对路径映射为 nginx internal URI；不在该目录下时返回 None。"""
+    root = os.path.realpath(UPLOAD_DIR)
+    real = os.path.realpath(path)
+    if os.path.commonpath([root, real]) != root:
+        return None
+    relative = os.path.relpath(real, root).replace(os.sep, "/")
+    return prefix.rstrip("/") + "/" + quote(relative)
+
+
+def _content_disposition(filename: str, as_attachment: bool) -> str:
+    disposition = "attachment" if as_attachment else "inline"
+    if filename.isascii() and '"' not in filename and "\\" not in filename:
+        return f'{disposition}; filename="{filename}"'
+    return f"{disposition}; filename*=UTF-8''{quote(filename)}"
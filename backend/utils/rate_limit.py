@@ -1,26 +1,154 @@
-﻿"""聊天 API Redis 限流工具。"""
+﻿"""聊天 API Redis 限流工具。
+
+- 所有窗口由一段 Lua 脚本原子判定：一次往返完成清理、计数、写入与 retry-after 计算，
+  被拒绝的请求不计入任何窗口
+- 存储算法由 `RATE_LIMIT_ALGORITHM` 选择（三种脚本入参与返回值一致）：
+  - `sliding_log`     sorted set 记录每次请求，精确；内存随请求数线性增长（默认）
+  - `sliding_window`  每窗口一个 hash，仅保留当前/上一个固定桶计数，按时间加权估算
+  - `gcra`            每窗口一个浮点数（理论到达时间 TAT），匀速放行 + 窗口内突发
+- Redis 不可用时退化为进程内令牌桶（按 worker 独立计数），不再直接放行
+- 三种算法的内存与吞吐对比见 `scripts/bench_rate_limit.py`
+"""
 import json
+import threading
 import time
 import uuid
 from functools import wraps
-from typing import Tuple
+from typing import Dict, List, Tuple
 
-from flask import Response
+from flask import Response, request
 
 from backend.utils.user import get_current_user
 
+# 三种脚本约定一致 —— KEYS[i]: 第 i 个窗口的 key；
+# ARGV: now, member, 然后每个窗口依次为 window_seconds, max_requests
+# 返回 {0, 0, 0} 表示放行；{1, i, retry_after_ms} 表示被第 i 个窗口（1 起）拒绝
+_SLIDING_LOG_SCRIPT = """
+local now = tonumber(ARGV[1])
+local member = ARGV[2]
+for i, key in ipairs(KEYS) do
+    local window = tonumber(ARGV[1 + i * 2])
+    local limit = tonumber(ARGV[2 + i * 2])
+    redis.call('ZREMRANGEBYSCORE', key, 0, now - window)
+    if redis.call('ZCARD', key) >= limit then
+        local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+        local retry = window
+        if oldest[2] then
+            retry = math.max(0, tonumber(oldest[2]) + window - now)
+        end
+        return {1, i, math.ceil(retry * 1000)}
+    end
+end
+for i, key in ipairs(KEYS) do
+    local window = tonumber(ARGV[1 + i * 2])
+    redis.call('ZADD', key, now, member)
+    redis.call('EXPIRE', key, window + 60)
+end
+return {0, 0, 0}
+"""
+
+# hash 字段为固定桶序号 floor(now / window)，估算值 = 上一桶 × 剩余比例 + 当前桶
+_SLIDING_WINDOW_SCRIPT = """
+local now = tonumber(ARGV[1])
+local buckets = {}
+for i, key in ipairs(KEYS) do
+    local window = tonumber(ARGV[1 + i * 2])
+    local limit = tonumber(ARGV[2 + i * 2])
+    local bucket = math.floor(now / window)
+    local elapsed = now - bucket * window
+    local current = tonumber(redis.call('HGET', key, bucket) or '0')
+    local previous = tonumber(redis.call('HGET', key, bucket - 1) or '0')
+    if previous * (1 - elapsed / window) + current + 1 > limit then
+        local retry = window - elapsed
+        if previous > 0 and current + 1 <= limit then
+            retry = math.max(0, window * (1 - (limit - 1 - current) / previous) - elapsed)
+        end
+        return {1, i, math.ceil(retry * 1000)}
+    end
+    buckets[i] = bucket
+end
+for i, key in ipairs(KEYS) do
+    local window = tonumber(ARGV[1 + i * 2])
+    redis.call('HINCRBY', key, buckets[i], 1)
+    for _, field in ipairs(redis.call('HKEYS', key)) do
+        if tonumber(field) < buckets[i] - 1 then
+            redis.call('HDEL', key, field)
+        end
+    end
+    redis.call('EXPIRE', key, window * 2)
+end
+return {0, 0, 0}
+"""
+
+# 发射间隔 T = window / limit；请求使 TAT 前移 T，TAT - window 超过 now 即拒绝
+_GCRA_SCRIPT = """
+local now = tonumber(ARGV[1])
+local tats = {}
+for i, key in ipairs(KEYS) do
+    local window = tonumber(ARGV[1 + i * 2])
+    local limit = tonumber(ARGV[2 + i * 2])
+    local tat = tonumber(redis.call('GET', key) or '0')
+    if tat < now then
+        tat = now
+    end
+    local new_tat = tat + window / limit
+    local allow_at = new_tat - window
+    if allow_at > now then
+        return {1, i, math.ceil((allow_at - now) * 1000)}
+    end
+    tats[i] = new_tat
+end
+for i, key in ipairs(KEYS) do
+    redis.call('SET', key, tostring(tats[i]), 'PX', math.ceil((tats[i] - now) * 1000) + 1000)
+end
+return {0, 0, 0}
+"""
+
+_SCRIPTS = {
+    "sliding_log": ("", _SLIDING_LOG_SCRIPT),
+    "sliding_window": (":sw", _SLIDING_WINDOW_SCRIPT),
+    "gcra": (":gcra", _GCRA_SCRIPT),
+}
+
+
+class LocalTokenBucketLimiter:
+    """Redis 不可用时的进程内兜底：每个窗口一个令牌桶（容量 = 上限，匀速回填）。"""
+
+    def __init__(self):
+        self._buckets: Dict[Tuple[int, int], Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def check(self, user_id: int, limits: List[Tuple[int, int, str]]) -> Tuple[bool, int, float]:
+        """返回 `(是否放行, 拒绝窗口下标, 剩余秒数)`；拒绝时不消耗任何窗口的令牌。"""
+        now = time.monotonic()
+        with self._lock:
+            refilled = []
+            for index, (window_seconds, max_requests, _) in enumerate(limits):
+                rate = max_requests / window_seconds
+                tokens, updated_at = self._buckets.get((user_id, window_seconds), (max_requests, now))
+                tokens = min(max_requests, tokens + (now - updated_at) * rate)
+                if tokens < 1:
+                    return False, index, (1 - tokens) / rate
+                refilled.append(((user_id, window_seconds), tokens))
+            for key, tokens in refilled:
+                self._buckets[key] = (tokens - 1, now)
+        return True, -1, 0.0
+
 
 class RedisRateLimiter:
-    """基于 Redis sorted set 的多层级滑动窗口限流器。"""
+    """基于 Redis Lua 脚本的多层级滑动窗口限流器。"""
 
-    def __init__(self, redis_client=None):
+    def __init__(self, redis_client=None, algorithm: str = None):
         self.redis_client = redis_client
+        self.algorithm = algorithm
         self.limits = [
             (60, 6, "1分钟内最多6次"),
             (86400, 100, "1天"),
             (604800, 300, "1周"),
         ]
         self.key_prefix = "rate_limit:chat:"
+        self.local_limiter = LocalTokenBucketLimiter()
+        self._scripts = {}
 
     def _get_redis_client(self):
         if self.redis_client:
@@ -35,55 +163,87 @@ class RedisRateLimiter:
 
         return None
 
-    def _check_single_limit(
-        self, user_id: int, window_seconds: int, max_requests: int
-    ) -> Tuple[bool, float]:
-        redis_client = self._get_redis_client()
-        if not redis_client:
-            return True, 0.0
+    def _get_algorithm(self) -> str:
+        algorithm = self.algorithm
+        if not algorithm:
+            try:
+                from backend.config import get_config
 
-        try:
-            current_time = time.time()
-            key = f"{self.key_prefix}{user_id}:{window_seconds}"
-
-            pipe = redis_client.pipeline()
-            pipe.zremrangebyscore(key, 0, current_time - window_seconds)
-            pipe.zcard(key)
-            results = pipe.execute()
-            current_count = results[1]
-
-            if current_count >= max_requests:
-                oldest_times = redis_client.zrange(key, 0, 0, withscores=True)
-                if oldest_times:
-                    oldest_time = oldest_times[0][1]
-                    next_allowed_time = oldest_time + window_seconds
-                    remaining_seconds = max(0, next_allowed_time - current_time)
-                    return False, remaining_seconds
-                return False, window_seconds
-
-            member = f"{user_id}:{current_time}:{uuid.uuid4().hex[:8]}"
-            redis_client.zadd(key, {member: current_time})
-            redis_client.expire(key, window_seconds + 60)
-            return True, 0.0
-
-        except Exception as e:
-            print(f"Redis限流检查失败: {e}")
-            return True, 0.0
+                algorithm = get_config().RATE_LIMIT_ALGORITHM
+            except Exception:
+                algorithm = "sliding_log"
+        if algorithm not in _SCRIPTS:
+            print(f"未知的限流算法 {algorithm}，使用 sliding_log")
+            algorithm = "sliding_log"
+        return algorithm
+
+    def _get_script(self, redis_client, algorithm: str):
+        # Script 对象内部缓存 SHA，EVALSHA 遇到 NOSCRIPT 时自动重新加载
+        script = self._scripts.get((id(redis_client), algorithm))
+        if script is None:
+            script = redis_client.register_script(_SCRIPTS[algorithm][1])
+            self._scripts[(id(redis_client), algorithm)] = script
+        return script
+
+    def _check_redis(self, redis_client, user_id: int) -> Tuple[bool, int, float]:
+        algorithm = self._get_algorithm()
+        key_suffix = _SCRIPTS[algorithm][0]
+        current_time = time.time()
+        keys = [
+            f"{self.key_prefix}{user_id}:{window_seconds}{key_suffix}"
+            for window_seconds, _, _ in self.limits
+        ]
+        args = [current_time, f"{user_id}:{current_time}:{uuid.uuid4().hex[:8]}"]
+        for window_seconds, max_requests, _ in self.limits:
+            args.extend([window_seconds, max_requests])
+
+        denied, index, retry_ms = self._get_script(redis_client, algorithm)(keys=keys, args=args)
+        if int(denied):
+            return False, int(index) - 1, int(retry_ms) / 1000
+        return True, -1, 0.0
 
     def is_allowed(self, user_id: int) -> Tuple[bool, str, float]:
-        for window_seconds, max_requests, description in self.limits:
-            is_allowed, remaining_seconds = self._check_single_limit(
-                user_id, window_seconds, max_requests
-            )
-            if not is_allowed:
-                return False, description, remaining_seconds
+        redis_client = self._get_redis_client()
+        result = None
+        if redis_client:
+            try:
+                result = self._check_redis(redis_client, user_id)
+            except Exception as e:
+                print(f"Redis限流检查失败，改用本地令牌桶: {e}")
+        if result is None:
+            result = self.local_limiter.check(user_id, self.limits)
 
+        is_allowed, index, remaining_seconds = result
+        if not is_allowed:
+            return False, self.limits[index][2], remaining_seconds
         return True, "", 0.0
 
 
 chat_rate_limiter = RedisRateLimiter()
 
 
+def format_rate_limit_message(limit_description: str, remaining_seconds: float) -> str:
+    """429 提示文案：已触发的限制层级 + 可再次访问的等待时间。"""
+    remaining_seconds_int = int(remaining_seconds) + 1
+
+    if remaining_seconds_int < 60:
+        time_str = f"{remaining_seconds_int} 秒"
+    elif remaining_seconds_int < 3600:
+        minutes = remaining_seconds_int // 60
+        time_str = f"{minutes} 分钟"
+    elif remaining_seconds_int < 86400:
+        hours = remaining_seconds_int // 3600
+        time_str = f"{hours} 小时"
+    else:
+        days = remaining_seconds_int // 86400
+        time_str = f"{days} 天"
+
+    return (
+        f"访问过于频繁，已达到{limit_description}的访问限制。"
+        f"请稍后再试，您可以在 {time_str} 后再次访问。"
+    )
+
+
 def rate_limit_chat(f):
     """聊天 API 装饰器：按用户 ID 多层级限流。"""
     @wraps(f)
@@ -91,30 +251,15 @@ def rate_limit_chat(f):
         user = get_current_user()
         if not user:
             return f(*args, **kwargs)
+        # 断线续传只回放已有运行的事件，不触发新的生成
+        if request.headers.get("Last-Event-ID"):
+            return f(*args, **kwargs)
 
         user_id = user["id"]
         is_allowed, limit_description, remaining_seconds = chat_rate_limiter.is_allowed(user_id)
 
         if not is_allowed:
-            remaining_seconds_int = int(remaining_seconds) + 1
-
-            if remaining_seconds_int < 60:
-                time_str = f"{remaining_seconds_int} 秒"
-            elif remaining_seconds_int < 3600:
-                minutes = remaining_seconds_int // 60
-                time_str = f"{minutes} 分钟"
-            elif remaining_seconds_int < 86400:
-                hours = remaining_seconds_int // 3600
-                time_str = f"{hours} 小时"
-            else:
-                days = remaining_seconds_int // 86400
-                time_str = f"{days} 天"
-
-            error_message = (
-                f"访问过于频繁，已达到{limit_description}的访问限制。"
-                f"请稍后再试，您可以在 {time_str} 后再次访问。"
-            )
-
+            error_message = format_rate_limit_message(limit_description, remaining_seconds)
             return Response(
                 f'data: {json.dumps({"type": "error", "message": error_message})}\n\n',
                 mimetype="text/event-stream",
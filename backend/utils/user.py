@@ -1,6 +1,9 @@
 ﻿"""用户认证与序列化工具。"""
+from flask import g, has_request_context
+
 from backend.db import User, get_session
 from backend.services.auth_token import get_bearer_token, verify_user_token
+from backend.utils.user_cache import user_principal_cache
 
 
 def serialize_user(user: dict | None) -> dict | None:
@@ -29,8 +32,30 @@ def _user_row_to_dict(user: User) -> dict:
 
 
 def get_current_user():
-    """从 Bearer Token 读取当前登录用户。"""
-    token = get_bearer_token()
+    """从 Bearer Token 读取当前登录用户。
+
+    - 同一请求内结果记在 `flask.g`，装饰器与视图函数重复调用不再重复解析
+    - 用户信息优先读 `user_principal_cache`，未命中才查询 `users` 表
+    """
+    if has_request_context() and "current_user" in g:
+        return g.current_user
+
+    user = _resolve_current_user()
+    if has_request_context():
+        g.current_user = user
+    return user
+
+
+def _resolve_current_user():
+    return resolve_user_from_token(get_bearer_token())
+
+
+def resolve_user_from_token(token: str):
+    """按 Bearer token 解析启用状态的用户 dict（不依赖请求上下文，需应用上下文）。
+
+    用法:
+    - 调用方: `get_current_user()`、ASGI 流式入口 `backend.asgi`
+    """
     if not token:
         return None
 
@@ -38,13 +63,21 @@ def get_current_user():
     if not payload:
         return None
 
+    cached = user_principal_cache.get(payload["user_id"])
+    if cached:
+        return cached
+
+    # 查询前记下版本号：查询期间用户被停用时，旧信息不会写回缓存
+    generation = user_principal_cache.generation(payload["user_id"])
     try:
         db = get_session()
         user = db.query(User).filter(User.id == payload["user_id"]).first()
         db.close()
 
         if user and user.is_active:
-            return _user_row_to_dict(user)
+            user_dict = _user_row_to_dict(user)
+            user_principal_cache.set(user_dict, generation)
+            return user_dict
     except Exception as e:
         print(f"Get user error: {e}")
 
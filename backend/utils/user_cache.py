@@ -0,0 +1,189 @@
+"""已登录用户信息缓存 — 认证请求免查 MySQL。
+
+职责总览：
+1) 两级缓存
+   - L1：进程内 TTL 字典（`AUTH_USER_LOCAL_TTL`，默认 15 秒），命中时零网络往返
+   - L2：Redis `auth:user:<id>`（`AUTH_USER_CACHE_TTL`，默认 300 秒），多 worker 共享
+   - 两级都未命中才查询 `users` 表；只缓存启用状态（`is_active`）的用户
+2) 失效
+   - `invalidate_user()`  递增用户的版本号（`auth:user:gen:<id>`），再删除 Redis 条目并清理本进程 L1
+   - 回源前先 `generation()` 读版本号，`set()` 时版本号已变（查询期间被失效）则不写入，
+     Redis 侧比较与写入在一个 Lua 脚本内完成，避免把失效前读到的旧信息写回缓存
+   - ORM 提交中包含 `User` 的更新/删除时自动调用（停用、改角色、登录刷新 last_login）
+   - 其他 worker 的 L1 最多滞后 `AUTH_USER_LOCAL_TTL` 秒
+
+调用方：
+- `utils.get_current_user()`
+"""
+import json
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from backend.db import User
+
+
+class UserPrincipalCache:
+    """进程内 TTL + Redis 共享的用户信息缓存。"""
+
+    key_prefix = "auth:user:"
+    generation_prefix = "auth:user:gen:"
+    # 版本号 key 的过期时间（秒），远大于一次回源查询的耗时
+    generation_ttl = 86400
+
+    # KEYS[1] 缓存 key，KEYS[2] 版本号 key；ARGV: 期望版本号、值、TTL
+    _SET_IF_GENERATION = """
+    if (redis.call('GET', KEYS[2]) or '0') == ARGV[1] then
+        redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+        return 1
+    end
+    return 0
+    """
+
+    def __init__(self):
+        self._local: Dict[int, Tuple[float, dict]] = {}
+        self._generations: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> Optional[dict]:
+        local_ttl, _ = self._ttls()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._local.get(user_id)
+            local_generation = self._generations.get(user_id, 0)
+        if entry and entry[0] > now:
+            return dict(entry[1])
+
+        redis_client = self._get_redis_client()
+        if redis_client:
+            try:
+                raw = redis_client.get(f"{self.key_prefix}{user_id}")
+            except Exception as e:
+                print(f"读取用户缓存失败: {e}")
+                raw = None
+            if raw:
+                user = _loads(raw)
+                self._set_local(user_id, user, local_ttl, local_generation)
+                return dict(user)
+        return None
+
+    def generation(self, user_id: int) -> Tuple[int, str]:
+        """回源查询前读取 `(本进程版本号, Redis 版本号)`，传给 `set()`。"""
+        with self._lock:
+            local_generation = self._generations.get(user_id, 0)
+        shared_generation = "0"
+        redis_client = self._get_redis_client()
+        if redis_client:
+            try:
+                shared_generation = redis_client.get(f"{self.generation_prefix}{user_id}") or "0"
+            except Exception as e:
+                print(f"读取用户缓存版本失败: {e}")
+        return local_generation, str(shared_generation)
+
+    def set(self, user: dict, generation: Tuple[int, str]) -> None:
+        """写入缓存；`generation` 之后用户已被失效时不写入。"""
+        local_generation, shared_generation = generation
+        local_ttl, shared_ttl = self._ttls()
+        self._set_local(user["id"], user, local_ttl, local_generation)
+        redis_client = self._get_redis_client()
+        if redis_client:
+            try:
+                redis_client.eval(
+                    self._SET_IF_GENERATION,
+                    2,
+                    f"{self.key_prefix}{user['id']}",
+                    f"{self.generation_prefix}{user['id']}",
+                    shared_generation,
+                    _dumps(user),
+                    shared_ttl,
+                )
+            except Exception as e:
+                print(f"写入用户缓存失败: {e}")
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._local.pop(user_id, None)
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+        redis_client = self._get_redis_client()
+        if redis_client:
+            try:
+                # 先递增版本号再删除：进行中的回源无论在删除前后写入都会被拒绝或清除
+                pipe = redis_client.pipeline(transaction=False)
+                pipe.incr(f"{self.generation_prefix}{user_id}")
+                pipe.expire(f"{self.generation_prefix}{user_id}", self.generation_ttl)
+                pipe.delete(f"{self.key_prefix}{user_id}")
+                pipe.execute()
+            except Exception as e:
+                print(f"清理用户缓存失败: {e}")
+
+    def _set_local(self, user_id: int, user: dict, ttl: int, generation: Optional[int] = None) -> None:
+        if ttl <= 0:
+            return
+        with self._lock:
+            if generation is not None and self._generations.get(user_id, 0) != generation:
+                return
+            self._local[user_id] = (time.monotonic() + ttl, dict(user))
+
+    @staticmethod
+    def _ttls() -> Tuple[int, int]:
+        try:
+            from backend.config import get_config
+
+            config = get_config()
+            return config.AUTH_USER_LOCAL_TTL, config.AUTH_USER_CACHE_TTL
+        except Exception:
+            return 15, 300
+
+    @staticmethod
+    def _get_redis_client():
+        try:
+            from backend.config import get_config
+
+            return get_config().REDIS_CLIENT
+        except Exception:
+            return None
+
+
+def _dumps(user: dict) -> str:
+    last_login = user.get("last_login")
+    return json.dumps(
+        {**user, "last_login": last_login.isoformat() if isinstance(last_login, datetime) else last_login}
+    )
+
+
+def _loads(raw: str) -> dict:
+    user = json.loads(raw)
+    if user.get("last_login"):
+        user["last_login"] = datetime.fromisoformat(user["last_login"])
+    return user
+
+
+user_principal_cache = UserPrincipalCache()
+
+
+def invalidate_user(user_id: int) -> None:
+    """用户被停用、角色变更或资料更新后调用，使缓存立即失效。"""
+    user_principal_cache.invalidate(user_id)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changed_users(session, flush_context):
+    changed = session.info.setdefault("changed_user_ids", set())
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User) and obj.id is not None:
+            changed.add(obj.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_users(session):
+    for user_id in session.info.pop("changed_user_ids", ()):
+        invalidate_user(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changed_users(session):
+    session.info.pop("changed_user_ids", None)
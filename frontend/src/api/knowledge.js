@@ -34,12 +34,83 @@ export async function fetchDocuments(kbId) {
   return data.documents || [];
 }
 
+// 超过该大小的文档走分片断点续传，避免单个长请求失败后整体重传
+const RESUMABLE_THRESHOLD = 8 * 1024 * 1024;
+
 export async function uploadKnowledgeDocument(kbId, file) {
+  if (file.size > RESUMABLE_THRESHOLD) {
+    return uploadKnowledgeDocumentResumable(kbId, file);
+  }
   const formData = new FormData();
   formData.append("file", file);
   return apiUpload(`/api/knowledge-bases/${kbId}/documents`, formData);
 }
 
+function resumableStorageKey(kbId, file) {
+  return `kb-upload:${kbId}:${file.name}:${file.size}:${file.lastModified}`;
+}
+
+async function putUploadPart(kbId, uploadId, partNumber, blob) {
+  const token = getToken();
+  const headers = { "Content-Type": "application/octet-stream" };
+  if (token) {
+    headers.Authorization = `Bearer ${token}`;
+  }
+  const response = await fetch(
+    buildUrl(`/api/knowledge-bases/${kbId}/uploads/${uploadId}/parts/${partNumber}`),
+    { method: "PUT", headers, body: blob },
+  );
+  if (!response.ok) {
+    const data = await response.json().catch(() => ({}));
+    if (response.status === 401) {
+      clearAuth();
+    }
+    throw new Error(data.error || data.message || `分片 ${partNumber} 上传失败`);
+  }
+}
+
+/**
+ * 分片断点续传：init → 逐片 PUT（跳过服务端已有分片）→ complete。
+ * upload_id 记在 localStorage，页面刷新或断网后重新选择同一文件即可续传。
+ */
+export async function uploadKnowledgeDocumentResumable(kbId, file) {
+  const storageKey = resumableStorageKey(kbId, file);
+  let upload = null;
+
+  const savedId = localStorage.getItem(storageKey);
+  if (savedId) {
+    try {
+      const data = await apiFetch(`/api/knowledge-bases/${kbId}/uploads/${savedId}`);
+      upload = data.upload;
+    } catch {
+      localStorage.removeItem(storageKey);
+    }
+  }
+  if (!upload) {
+    const data = await apiFetch(`/api/knowledge-bases/${kbId}/uploads`, {
+      method: "POST",
+      body: JSON.stringify({ filename: file.name, file_size: file.size }),
+    });
+    upload = data.upload;
+    localStorage.setItem(storageKey, upload.upload_id);
+  }
+
+  const done = new Set(upload.uploaded_parts || []);
+  for (let partNumber = 1; partNumber <= upload.total_parts; partNumber += 1) {
+    if (done.has(partNumber)) {
+      continue;
+    }
+    const start = (partNumber - 1) * upload.part_size;
+    await putUploadPart(kbId, upload.upload_id, partNumber, file.slice(start, start + upload.part_size));
+  }
+
+  const result = await apiFetch(`/api/knowledge-bases/${kbId}/uploads/${upload.upload_id}/complete`, {
+    method: "POST",
+  });
+  localStorage.removeItem(storageKey);
+  return result;
+}
+
 export async function deleteKnowledgeDocument(kbId, docId) {
   return apiFetch(`/api/knowledge-bases/${kbId}/documents/${docId}`, {
     method: "DELETE",
@@ -10,3 +10,18 @@ export async function fetchUserStats() {
 export async function fetchAdminStats() {
   return apiFetch("/api/stats/admin");
 }
+
+/**
+ * 用量时间序列（管理员）。
+ * @param {{ from?: string, to?: string, groupBy?: "day"|"hour"|"model"|"user" }} params
+ */
+export async function fetchAdminUsageSeries({ from, to, groupBy = "day" } = {}) {
+  const query = new URLSearchParams({ group_by: groupBy });
+  if (from) {
+    query.set("from", from);
+  }
+  if (to) {
+    query.set("to", to);
+  }
+  return apiFetch(`/api/stats/admin/usage?${query.toString()}`);
+}
@@ -5,15 +5,27 @@ import { useEffect, useRef } from "react";
 import MessageItem from "./MessageItem";
 import StreamingBlock from "./StreamingBlock";
 
-export default function MessageList({ messages, streamText, streamToolCalls, waitingReply, showWelcome }) {
+export default function MessageList({
+  messages,
+  streamText,
+  streamToolCalls,
+  waitingReply,
+  showWelcome,
+  hasOlder = false,
+  loadingOlder = false,
+  onLoadOlder,
+}) {
   const bottomRef = useRef(null);
   const hasStreamingTools = (streamToolCalls?.length ?? 0) > 0;
   const showStreaming = waitingReply || Boolean(String(streamText || "").trim()) || hasStreamingTools;
   const isEmpty = messages.length === 0 && !streamText && !hasStreamingTools;
 
+  // 只在末尾消息变化时滚到底部；向上加载更早消息不打断阅读位置
+  const lastMessageId = messages.length ? messages[messages.length - 1].id : null;
+
   useEffect(() => {
     bottomRef.current?.scrollIntoView({ behavior: "smooth" });
-  }, [messages, streamText, streamToolCalls, waitingReply]);
+  }, [lastMessageId, streamText, streamToolCalls, waitingReply]);
 
   return (
     <div className={`chat-messages ${isEmpty && showWelcome ? "chat-messages-empty" : ""}`}>
@@ -25,6 +37,14 @@ export default function MessageList({ messages, streamText, streamToolCalls, wai
 
       {!isEmpty && (
         <div className="message-stream">
+          {hasOlder && (
+            <div className="message-load-older">
+              <button type="button" onClick={onLoadOlder} disabled={loadingOlder}>
+                {loadingOlder ? "加载中..." : "加载更早的消息"}
+              </button>
+            </div>
+          )}
+
           {messages.map((msg) => (
             <MessageItem key={msg.id} message={msg} />
           ))}
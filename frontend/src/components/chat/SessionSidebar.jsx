@@ -1,5 +1,6 @@
 /**
  * 聊天侧栏：搜索 + 固定/最近分组；收起时显示图标栏（参考 ChatGPT）。
+ * 会话分页加载，「最近对话」滚动到底部时加载下一页。
  */
 import { useEffect, useMemo, useRef, useState } from "react";
 import { Button, Input, Tooltip } from "antd";
@@ -11,7 +12,20 @@ import {
 } from "@ant-design/icons";
 import CollapsibleSidebar from "../layout/CollapsibleSidebar";
 
-function SessionGroup({ title, count, collapsed, onToggle, children, emptyText, fill = false }) {
+// 距列表底部小于该像素数时加载下一页
+const LOAD_MORE_THRESHOLD = 48;
+
+function SessionGroup({
+  title,
+  count,
+  collapsed,
+  onToggle,
+  children,
+  emptyText,
+  fill = false,
+  onScroll,
+  footer = null,
+}) {
   return (
     <div className={`app-session-group ${fill ? "app-session-group-fill" : ""}`}>
       <button type="button" className="app-session-group-header" onClick={onToggle}>
@@ -20,8 +34,9 @@ function SessionGroup({ title, count, collapsed, onToggle, children, emptyText,
         <span className="app-sessions-count">{count}</span>
       </button>
       {!collapsed && (
-        <div className="app-sessions-list app-session-group-list">
+        <div className="app-sessions-list app-session-group-list" onScroll={onScroll}>
           {count === 0 ? <div className="app-sessions-empty">{emptyText}</div> : children}
+          {footer}
         </div>
       )}
     </div>
@@ -48,6 +63,9 @@ export default function SessionSidebar({
   onToggle,
   user,
   sessions,
+  hasMoreSessions = false,
+  loadingMoreSessions = false,
+  onLoadMoreSessions,
   sessionId,
   onNewChat,
   onSelectSession,
@@ -86,6 +104,17 @@ export default function SessionSidebar({
     }
   }, [collapsed, pendingSearchFocus]);
 
+  function handleRecentScroll(e) {
+    const el = e.currentTarget;
+    if (
+      hasMoreSessions &&
+      !loadingMoreSessions &&
+      el.scrollHeight - el.scrollTop - el.clientHeight < LOAD_MORE_THRESHOLD
+    ) {
+      onLoadMoreSessions?.();
+    }
+  }
+
   function handleCollapsedSearch() {
     if (collapsed) {
       setPendingSearchFocus(true);
@@ -206,6 +235,19 @@ export default function SessionSidebar({
               onToggle={() => setRecentCollapsed((v) => !v)}
               emptyText="暂无对话"
               fill
+              onScroll={handleRecentScroll}
+              footer={
+                hasMoreSessions && (
+                  <button
+                    type="button"
+                    className="app-sessions-more"
+                    onClick={onLoadMoreSessions}
+                    disabled={loadingMoreSessions}
+                  >
+                    {loadingMoreSessions ? "加载中..." : "加载更多"}
+                  </button>
+                )
+              }
             >
               {recentSessions.map((s) => (
                 <SessionItem
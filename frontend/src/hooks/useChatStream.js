@@ -6,6 +6,14 @@ import { getToken } from "../api/auth";
 import { buildUrl } from "../api/client";
 import { applyChatEvent, finalizeStreamIfNeeded } from "../services/chatEvents";
 
+// 设为 /api/chat/stream 时走 ASGI 异步流式入口（backend/asgi.py），默认 Flask /api/chat
+const CHAT_STREAM_PATH = import.meta.env.VITE_CHAT_STREAM_PATH || "/api/chat";
+// 断线后带 Last-Event-ID 重连续传（后端运行不中断，不会重新生成）
+const MAX_RESUME_ATTEMPTS = 5;
+const RESUME_RETRY_MS = 1000;
+
+class FatalStreamError extends Error {}
+
 export function createChatStreamController() {
   return new AbortController();
 }
@@ -23,6 +31,8 @@ export async function streamChatMessage({
   const token = getToken();
   let gotDone = false;
   let streamError = null;
+  let lastEventId = null;
+  let resumeAttempts = 0;
 
   const body = {
     message,
@@ -33,7 +43,7 @@ export async function streamChatMessage({
   };
 
   try {
-    await fetchEventSource(buildUrl("/api/chat"), {
+    await fetchEventSource(buildUrl(CHAT_STREAM_PATH), {
       method: "POST",
       headers: {
         "Content-Type": "application/json",
@@ -48,6 +58,9 @@ export async function streamChatMessage({
         }
         const text = await response.text().catch(() => "");
         let messageText = `请求失败: ${response.status}`;
+        if (response.status === 410) {
+          messageText = "流式运行已结束或已过期，请刷新会话";
+        }
         try {
           const line = text.split("\n").find((l) => l.startsWith("data: "));
           if (line) {
@@ -57,9 +70,13 @@ export async function streamChatMessage({
         } catch {
           // ignore
         }
-        throw new Error(messageText);
+        throw new FatalStreamError(messageText);
       },
       onmessage(ev) {
+        if (ev.id) {
+          lastEventId = ev.id;
+          resumeAttempts = 0;
+        }
         if (!ev.data?.trim()) {
           return;
         }
@@ -92,8 +109,25 @@ export async function streamChatMessage({
           gotDone = true;
         }
       },
+      onclose() {
+        // 连接在运行结束前被关闭（如 worker 重启）：交给 onerror 判断是否续传
+        if (!gotDone && !streamError && lastEventId) {
+          throw new Error("连接已断开");
+        }
+      },
       onerror(err) {
-        throw err;
+        // 网络中断：已收到过事件则重连续传（fetchEventSource 自动带上 Last-Event-ID）
+        if (
+          err instanceof FatalStreamError ||
+          err?.name === "AbortError" ||
+          !lastEventId ||
+          gotDone ||
+          resumeAttempts >= MAX_RESUME_ATTEMPTS
+        ) {
+          throw err;
+        }
+        resumeAttempts += 1;
+        return RESUME_RETRY_MS;
       },
     });
   } catch (err) {
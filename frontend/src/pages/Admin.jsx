@@ -41,6 +41,17 @@ function PeriodStats({ periodKey, data }) {
         <Col span={12}>
           <Statistic title="请求次数" value={data.count} valueStyle={{ fontSize: 18 }} />
         </Col>
+        <Col span={12}>
+          <Statistic title="缓存命中" value={data.cached} valueStyle={{ fontSize: 18 }} />
+        </Col>
+        <Col span={12}>
+          <Statistic
+            title="缓存命中率"
+            value={((data.cache_hit_rate || 0) * 100).toFixed(1)}
+            suffix="%"
+            valueStyle={{ fontSize: 18 }}
+          />
+        </Col>
       </Row>
     </Card>
   );
@@ -50,6 +61,7 @@ function AdminPage() {
   const [loading, setLoading] = useState(true);
   const [stats, setStats] = useState({});
   const [recentUsage, setRecentUsage] = useState([]);
+  const [responseCache, setResponseCache] = useState(null);
 
   useEffect(() => {
     let cancelled = false;
@@ -60,6 +72,7 @@ function AdminPage() {
         if (!cancelled) {
           setStats(data.stats || {});
           setRecentUsage(data.recent_usage || []);
+          setResponseCache(data.response_cache || null);
         }
       } catch (error) {
         if (!cancelled) {
@@ -105,6 +118,12 @@ function AdminPage() {
         key: "completion_tokens",
         width: 110,
       },
+      {
+        title: "缓存命中",
+        dataIndex: "cached_tokens",
+        key: "cached_tokens",
+        width: 100,
+      },
       {
         title: "Total",
         dataIndex: "total_tokens",
@@ -138,6 +157,36 @@ function AdminPage() {
             ))}
           </Row>
 
+          {responseCache?.enabled && (
+            <Card
+              className="gov-page-card"
+              title="语义回答缓存"
+              bordered={false}
+              size="small"
+              style={{ marginTop: 16 }}
+            >
+              <Row gutter={[8, 8]}>
+                <Col xs={12} md={6}>
+                  <Statistic title="命中" value={responseCache.hits} valueStyle={{ fontSize: 18 }} />
+                </Col>
+                <Col xs={12} md={6}>
+                  <Statistic title="未命中" value={responseCache.misses} valueStyle={{ fontSize: 18 }} />
+                </Col>
+                <Col xs={12} md={6}>
+                  <Statistic title="写入" value={responseCache.stores} valueStyle={{ fontSize: 18 }} />
+                </Col>
+                <Col xs={12} md={6}>
+                  <Statistic
+                    title="命中率"
+                    value={((responseCache.hit_rate || 0) * 100).toFixed(1)}
+                    suffix="%"
+                    valueStyle={{ fontSize: 18 }}
+                  />
+                </Col>
+              </Row>
+            </Card>
+          )}
+
           <Card
             className="gov-page-card"
             title="最近使用记录"
@@ -20,6 +20,7 @@ import ChatComposer from "../components/chat/ChatComposer";
 import { clearAuth } from "../api/auth";
 import { apiFetch } from "../api/client";
 import {
+  cancelChatRun,
   deleteSession,
   fetchLlmProviders,
   fetchSessionMessages,
@@ -33,6 +34,13 @@ import { useChatStore } from "../stores/chatStore";
 import "../styles/app-shell.css";
 import "../styles/chat.css";
 
+function normalizeMessages(list) {
+  return list.map((m) => ({
+    ...m,
+    id: m.id ?? `${m.role}-${m.created_at}`,
+  }));
+}
+
 function ChatPage() {
   const navigate = useNavigate();
   const [bootLoading, setBootLoading] = useState(true);
@@ -56,29 +64,77 @@ function ChatPage() {
   const isNewChatDraft = useChatStore((s) => s.isNewChatDraft);
 
   const reloadSessions = useCallback(async () => {
-    const list = await fetchSessions();
-    useChatStore.setState({ sessions: list });
-    return list;
+    const page = await fetchSessions();
+    useChatStore.setState({ sessions: page.sessions, sessionsCursor: page.nextCursor });
+    return page.sessions;
   }, []);
 
+  const sessionsCursor = useChatStore((s) => s.sessionsCursor);
+  const [loadingMoreSessions, setLoadingMoreSessions] = useState(false);
+
+  const loadMoreSessions = useCallback(async () => {
+    if (!sessionsCursor || loadingMoreSessions) {
+      return;
+    }
+    setLoadingMoreSessions(true);
+    try {
+      const page = await fetchSessions({ cursor: sessionsCursor });
+      useChatStore.setState((state) => {
+        // 翻页期间会话可能因新消息移到前面，按 id 去重
+        const seen = new Set(state.sessions.map((s) => s.id));
+        return {
+          sessions: [...state.sessions, ...page.sessions.filter((s) => !seen.has(s.id))],
+          sessionsCursor: page.nextCursor,
+        };
+      });
+    } catch (error) {
+      message.error(error instanceof Error ? error.message : "加载更多对话失败");
+    } finally {
+      setLoadingMoreSessions(false);
+    }
+  }, [sessionsCursor, loadingMoreSessions]);
+
+  const olderCursor = useChatStore((s) => s.olderCursor);
+  const [loadingOlder, setLoadingOlder] = useState(false);
+
   const loadMessages = useCallback(async (sid) => {
-    const list = await fetchSessionMessages(sid);
+    const page = await fetchSessionMessages(sid);
     useChatStore.setState({
-      messages: list.map((m) => ({
-        ...m,
-        id: m.id ?? `${m.role}-${m.created_at}`,
-      })),
+      messages: normalizeMessages(page.messages),
+      olderCursor: page.nextCursor,
       sessionId: sid,
       isNewChatDraft: false,
     });
   }, []);
 
+  const loadOlderMessages = useCallback(async () => {
+    const sid = useChatStore.getState().sessionId;
+    if (!sid || !olderCursor || loadingOlder) {
+      return;
+    }
+    setLoadingOlder(true);
+    try {
+      const page = await fetchSessionMessages(sid, { before: olderCursor });
+      if (useChatStore.getState().sessionId !== sid) {
+        return;
+      }
+      useChatStore.setState((state) => ({
+        messages: [...normalizeMessages(page.messages), ...state.messages],
+        olderCursor: page.nextCursor,
+      }));
+    } catch (error) {
+      message.error(error instanceof Error ? error.message : "加载更早消息失败");
+    } finally {
+      setLoadingOlder(false);
+    }
+  }, [olderCursor, loadingOlder]);
+
   useEffect(() => {
     let cancelled = false;
 
     async function boot() {
       try {
-        const [meData, providerData, sessionList, kbList] = await Promise.all([
+        const [meData, providerData, sessionPage, kbList] = await Promise.all([
           apiFetch("/api/auth/me"),
           fetchLlmProviders(),
           fetchSessions(),
@@ -93,10 +149,12 @@ function ChatPage() {
           llmProviders: providerData.providers,
           defaultProvider: providerData.defaultProvider,
           llmProvider: providerData.defaultProvider,
-          sessions: sessionList,
+          sessions: sessionPage.sessions,
+          sessionsCursor: sessionPage.nextCursor,
           knowledgeBases: kbList,
           sessionId: null,
           messages: [],
+          olderCursor: null,
           isNewChatDraft: true,
         });
       } catch (error) {
@@ -215,11 +273,20 @@ function ChatPage() {
         useChatStore.setState({ statusText: "请求失败" });
       }
     } finally {
-      useChatStore.setState({ sending: false, waitingReply: false, activeStreamSessionId: null });
+      useChatStore.setState({
+        sending: false,
+        waitingReply: false,
+        activeStreamSessionId: null,
+        activeRunId: null,
+      });
     }
   }
 
   function handleStop() {
+    const runId = useChatStore.getState().activeRunId;
+    if (runId) {
+      void cancelChatRun(runId).catch(() => {});
+    }
     streamRef.current?.abort();
     useChatStore.setState({ sending: false, waitingReply: false });
   }
@@ -275,6 +342,9 @@ function ChatPage() {
         onToggle={() => setSidebarCollapsed((v) => !v)}
         user={user}
         sessions={sessions}
+        hasMoreSessions={Boolean(sessionsCursor)}
+        loadingMoreSessions={loadingMoreSessions}
+        onLoadMoreSessions={loadMoreSessions}
         sessionId={sessionId}
         onNewChat={handleNewChat}
         onSelectSession={handleSelectSession}
@@ -294,6 +364,9 @@ function ChatPage() {
         <div className={`chat-body ${isEmptyView ? "chat-body-empty" : ""}`}>
           <MessageList
             messages={messages}
+            hasOlder={Boolean(sessionId && olderCursor)}
+            loadingOlder={loadingOlder}
+            onLoadOlder={loadOlderMessages}
             streamText={streamText}
             streamToolCalls={streamToolCalls}
             waitingReply={waitingReply}
@@ -26,14 +26,28 @@ export function isImageFile(name) {
   return IMAGE_EXT.test(String(name || ""));
 }
 
-export async function fetchSessions() {
-  const data = await apiFetch("/api/sessions");
-  return data.sessions || [];
+// 侧栏会话按页加载，滚动到列表底部再取下一页
+export const SESSION_PAGE_SIZE = 50;
+
+export async function fetchSessions({ cursor, limit = SESSION_PAGE_SIZE } = {}) {
+  const query = new URLSearchParams({ limit: String(limit) });
+  if (cursor) {
+    query.set("cursor", cursor);
+  }
+  const data = await apiFetch(`/api/sessions?${query.toString()}`);
+  return { sessions: data.sessions || [], nextCursor: data.next_cursor || null };
 }
 
-export async function fetchSessionMessages(sessionId) {
-  const data = await apiFetch(`/api/sessions/${sessionId}/messages`);
-  return data.messages || [];
+// 打开会话时只取最新一页，向上翻页再取更早的消息
+export const MESSAGE_PAGE_SIZE = 50;
+
+export async function fetchSessionMessages(sessionId, { before, limit = MESSAGE_PAGE_SIZE } = {}) {
+  const query = new URLSearchParams({ limit: String(limit) });
+  if (before) {
+    query.set("before", before);
+  }
+  const data = await apiFetch(`/api/sessions/${sessionId}/messages?${query.toString()}`);
+  return { messages: data.messages || [], nextCursor: data.next_cursor || null };
 }
 
 export async function updateSessionPin(sessionId, pinned) {
@@ -49,6 +63,13 @@ export async function deleteSession(sessionId) {
   });
 }
 
+// 停止生成：取消后端运行（仅中断连接时运行会在后台继续）
+export async function cancelChatRun(runId) {
+  return apiFetch(`/api/chat/${runId}/cancel`, {
+    method: "POST",
+  });
+}
+
 export async function fetchLlmProviders() {
   const data = await apiFetch("/api/llm/providers");
   return {
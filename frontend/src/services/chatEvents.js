@@ -44,6 +44,10 @@ export function applyChatEvent(data, storeApi) {
   const patch = {};
 
   switch (data.type) {
+    case "run":
+      patch.activeRunId = data.run_id;
+      break;
+
     case "content":
       patch.streamText = `${state.streamText || ""}${data.content || ""}`;
       break;
@@ -134,7 +138,7 @@ export function applyChatEvent(data, storeApi) {
       patch.streamText = "";
       patch.streamUsage = null;
       patch.streamToolCalls = [];
-      patch.statusText = usageStatusText(usage);
+      patch.statusText = data.cancelled ? "已停止生成" : usageStatusText(usage);
       effects.finalized = true;
       break;
     }
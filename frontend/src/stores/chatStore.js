@@ -7,7 +7,11 @@ export const useChatStore = create((set) => ({
   user: null,
   sessionId: null,
   sessions: [],
+  // 侧栏会话列表下一页游标；null 表示已全部加载
+  sessionsCursor: null,
   messages: [],
+  // 当前会话更早消息的分页游标；null 表示已加载到最早
+  olderCursor: null,
   streamText: "",
   streamUsage: null,
   streamToolCalls: [],
@@ -22,6 +26,8 @@ export const useChatStore = create((set) => ({
   selectedKnowledgeBaseIds: [],
   isNewChatDraft: false,
   activeStreamSessionId: null,
+  // 后端运行 ID（POST /api/chat 首个 run 事件），用于停止生成
+  activeRunId: null,
 
   resetStream: () =>
     set({
@@ -31,12 +37,14 @@ export const useChatStore = create((set) => ({
       waitingReply: false,
       sending: false,
       activeStreamSessionId: null,
+      activeRunId: null,
     }),
 
   resetChat: () =>
     set({
       sessionId: null,
       messages: [],
+      olderCursor: null,
       streamText: "",
       streamUsage: null,
       streamToolCalls: [],
@@ -47,5 +55,6 @@ export const useChatStore = create((set) => ({
       selectedKnowledgeBaseIds: [],
       isNewChatDraft: true,
       activeStreamSessionId: null,
+      activeRunId: null,
     }),
 }));
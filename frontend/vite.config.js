@@ -7,6 +7,10 @@ export default defineConfig({
     host: "0.0.0.0",
     port: 5173,
     proxy: {
+      "/api/chat/stream": {
+        target: "http://127.0.0.1:5001",
+        changeOrigin: true,
+      },
       "/api": {
         target: "http://127.0.0.1:5000",
         changeOrigin: true,
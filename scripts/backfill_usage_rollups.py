@@ -0,0 +1,39 @@
+"""Token 用量汇总表历史回填：把增量维护上线前的 `token_usage` 明细分批累加进小时/日汇总表。
+
+用法（应用至少启动过一次，`create_app` 会记录回填范围；可在服务运行期间执行）：
+    python scripts/backfill_usage_rollups.py
+    python scripts/backfill_usage_rollups.py --env backend/.env.develop --batch-size 5000
+
+每批（`--batch-size` 个 id）与进度在同一事务提交，中断后重跑从上次位置继续。
+"""
+import argparse
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv  # noqa: E402
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--env", default=os.path.join(PROJECT_ROOT, "backend", ".env.product"), help="环境变量文件")
+    parser.add_argument("--batch-size", type=int, default=10000, help="每批处理的 token_usage id 区间长度")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    load_dotenv(args.env)
+
+    from backend.db import init_db
+    from backend.services.usage_rollup import backfill_usage_rollups
+
+    init_db()
+    backfilled_id = backfill_usage_rollups(batch_size=args.batch_size)
+    print(f"Token 用量汇总表回填完成（token_usage.id <= {backfilled_id}）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""聊天限流算法基准：对比 sliding_log / sliding_window / gcra 的 Redis 内存与吞吐。
+
+用法（需可写的 Redis，脚本只操作 `bench:rate_limit:` 前缀并在结束时清理）：
+    python scripts/bench_rate_limit.py --redis-url redis://localhost:6379/15 --users 2000 --requests 300
+
+每个用户连续发起 `--requests` 次请求；为测量稳态内存，基准使用足够大的上限
+（默认三个窗口与线上一致：1 分钟 / 1 天 / 1 周），保证请求全部被记录。
+内存统计使用 `MEMORY USAGE` 汇总全部限流 key。
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import redis  # noqa: E402
+
+from backend.utils.rate_limit import RedisRateLimiter  # noqa: E402
+
+ALGORITHMS = ("sliding_log", "sliding_window", "gcra")
+KEY_PREFIX = "bench:rate_limit:"
+
+
+def _cleanup(client, prefix: str) -> None:
+    for key in client.scan_iter(match=f"{prefix}*", count=1000):
+        client.delete(key)
+
+
+def _memory_usage(client, prefix: str) -> tuple:
+    total = 0
+    keys = 0
+    for key in client.scan_iter(match=f"{prefix}*", count=1000):
+        total += client.memory_usage(key, samples=0) or 0
+        keys += 1
+    return keys, total
+
+
+def run(client, algorithm: str, users: int, requests: int) -> dict:
+    prefix = f"{KEY_PREFIX}{algorithm}:"
+    _cleanup(client, prefix)
+
+    limiter = RedisRateLimiter(redis_client=client, algorithm=algorithm)
+    limiter.key_prefix = prefix
+    limiter.limits = [(window, requests + 1, desc) for window, _, desc in limiter.limits]
+
+    denied = 0
+    started = time.perf_counter()
+    for _ in range(requests):
+        for user_id in range(users):
+            allowed, _, _ = limiter.is_allowed(user_id)
+            denied += 0 if allowed else 1
+    elapsed = time.perf_counter() - started
+
+    keys, memory = _memory_usage(client, prefix)
+    _cleanup(client, prefix)
+    total = users * requests
+    return {
+        "algorithm": algorithm,
+        "ops_per_sec": total / elapsed,
+        "keys": keys,
+        "memory_bytes": memory,
+        "bytes_per_user": memory / users,
+        "denied": denied,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--redis-url", default="redis://localhost:6379/15")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=300, help="每个用户的请求数")
+    parser.add_argument("--algorithms", nargs="+", default=list(ALGORITHMS), choices=ALGORITHMS)
+    args = parser.parse_args()
+
+    client = redis.Redis.from_url(args.redis_url, decode_responses=True)
+    client.ping()
+
+    print(f"users={args.users} requests/user={args.requests}")
+    print(f"{'algorithm':<16}{'ops/sec':>12}{'keys':>10}{'memory':>14}{'bytes/user':>12}{'denied':>8}")
+    for algorithm in args.algorithms:
+        result = run(client, algorithm, args.users, args.requests)
+        print(
+            f"{result['algorithm']:<16}{result['ops_per_sec']:>12.0f}{result['keys']:>10}"
+            f"{result['memory_bytes']:>14}{result['bytes_per_user']:>12.0f}{result['denied']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""聊天流中继基准：对比「SSE 字符串 + 逐帧 json.loads」与「ChatEvent 对象 + 路由边界序列化」。
+
+用法（不访问 LLM / 数据库，只测单个 worker 进程内的中继开销）：
+    python scripts/bench_sse_relay.py --tokens 200000 --token-size 4
+
+两条路径都模拟一次完整回答：Agent 逐 token 产出事件 → ChatService 累积正文与用量
+→ 路由输出 SSE 文本。输出为每秒中继的 token 数。
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.services.chat_events import (  # noqa: E402
+    CONTENT,
+    DONE,
+    USAGE,
+    content_event,
+    done_event,
+    to_sse_stream,
+    usage_event,
+)
+
+USAGE_PAYLOAD = {"prompt_tokens": 100, "completion_tokens": 100, "total_tokens": 200}
+
+
+def _legacy_agent(tokens):
+    for token in tokens:
+        yield f"data: {json.dumps({'type': 'content', 'content': token}, ensure_ascii=False)}\n\n"
+    yield f"data: {json.dumps({'type': 'usage', 'usage': USAGE_PAYLOAD}, ensure_ascii=False)}\n\n"
+    yield f"data: {json.dumps({'type': 'done', 'tool_calls': []}, ensure_ascii=False)}\n\n"
+
+
+def _legacy_relay(tokens):
+    assistant_content = ""
+    for chunk in _legacy_agent(tokens):
+        yield chunk
+        data = json.loads(chunk[6:].strip())
+        if data.get("type") == "content":
+            assistant_content += data.get("content", "")
+        elif data.get("type") == "usage":
+            data.get("usage")
+        elif data.get("type") == "done":
+            data.get("tool_calls", [])
+    assert assistant_content
+
+
+def _event_agent(tokens):
+    for token in tokens:
+        yield content_event(token)
+    yield usage_event(USAGE_PAYLOAD)
+    yield done_event([])
+
+
+def _event_relay(tokens):
+    content_parts = []
+    for event in _event_agent(tokens):
+        yield event
+        if event.type == CONTENT:
+            content_parts.append(event.data["content"])
+        elif event.type == USAGE:
+            event.data.get("usage")
+        elif event.type == DONE:
+            event.data.get("tool_calls", [])
+    assert "".join(content_parts)
+
+
+PATHS = {
+    "legacy": lambda tokens: _legacy_relay(tokens),
+    "events": lambda tokens: to_sse_stream(_event_relay(tokens)),
+}
+
+
+def run(path: str, tokens, rounds: int) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _frame in PATHS[path](tokens):
+            pass
+        best = min(best, time.perf_counter() - started)
+    return len(tokens) / best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=200000, help="单次回答的 token 数")
+    parser.add_argument("--token-size", type=int, default=4, help="每个 token 的字符数")
+    parser.add_argument("--rounds", type=int, default=5, help="重复次数（取最快一次）")
+    args = parser.parse_args()
+
+    tokens = [("中文" * args.token_size)[: args.token_size]] * args.tokens
+    print(f"tokens={args.tokens} token_size={args.token_size} rounds={args.rounds}")
+    print(f"{'path':<10}{'tokens/sec':>14}")
+    for path in PATHS:
+        print(f"{path:<10}{run(path, tokens, args.rounds):>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
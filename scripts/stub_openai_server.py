@@ -0,0 +1,118 @@
+"""本地 OpenAI 兼容桩服务：演练 LLM 端点池的延迟路由与故障转移，不消耗真实 API。
+
+用法（每个端口一个端点，分别设置首 token 延迟与故障比例）：
+    python scripts/stub_openai_server.py --port 9001 --delay 0.2
+    python scripts/stub_openai_server.py --port 9002 --delay 1.5
+    python scripts/stub_openai_server.py --port 9003 --fail-rate 0.5 --fail-status 503
+
+    DEEPSEEK_ENDPOINTS=http://127.0.0.1:9001/v1|stub,http://127.0.0.1:9002/v1|stub,http://127.0.0.1:9003/v1|stub
+
+只实现 POST `/v1/chat/completions`：`stream=true` 时按 SSE 逐字返回固定回答并在末尾附 usage，
+否则返回一次性 JSON。`--hang` 模拟接受连接但迟迟不返回首 token（触发读超时转移）。
+路由统计见 `GET /api/llm/routing`（admin）。
+"""
+import argparse
+import json
+import random
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANSWER = "这是来自本地桩服务的回答。"
+
+
+def _chunk(completion_id: str, model: str, delta: dict, finish_reason=None, usage=None) -> bytes:
+    payload = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if usage is None else [],
+    }
+    if usage is not None:
+        payload["usage"] = usage
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    options = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        options = self.options
+
+        if random.random() < options.fail_rate:
+            self.send_response(options.fail_status)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(json.dumps({"error": {"message": "stub failure"}}).encode("utf-8"))
+            return
+        if options.hang:
+            time.sleep(options.hang)
+
+        model = body.get("model", "stub")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        usage = {"prompt_tokens": 10, "completion_tokens": len(ANSWER), "total_tokens": 10 + len(ANSWER)}
+        time.sleep(options.delay)
+
+        if not body.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(json.dumps({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": ANSWER},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            }, ensure_ascii=False).encode("utf-8"))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(_chunk(completion_id, model, {"role": "assistant", "content": ""}))
+        for char in ANSWER:
+            self.wfile.write(_chunk(completion_id, model, {"content": char}))
+            self.wfile.flush()
+            time.sleep(options.token_interval)
+        self.wfile.write(_chunk(completion_id, model, {}, finish_reason="stop"))
+        if (body.get("stream_options") or {}).get("include_usage"):
+            self.wfile.write(_chunk(completion_id, model, {}, usage=usage))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9001)
+    parser.add_argument("--delay", type=float, default=0.2, help="首 token 延迟（秒）")
+    parser.add_argument("--token-interval", type=float, default=0.02, help="token 间隔（秒）")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="直接返回错误状态码的请求比例")
+    parser.add_argument("--fail-status", type=int, default=503, help="故障时的 HTTP 状态码（429 / 5xx）")
+    parser.add_argument("--hang", type=float, default=0.0, help="返回响应头前额外挂起的秒数")
+    args = parser.parse_args()
+
+    StubHandler.options = args
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    print(f"stub OpenAI server on http://{args.host}:{args.port}/v1 "
+          f"delay={args.delay} fail_rate={args.fail_rate} hang={args.hang}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()